@@ -7,7 +7,6 @@ from aiohttp_middlewares import cors_middleware
 from ll.logger import setup_logging
 from ll.sentry import setup_sentry
 
-from ..game.loop import game_loop
 from ..game.setup import setup_game_states
 from ..storage.db import close_connection_pool, create_connection_pool
 from .handlers.game import setup_api_routes
@@ -43,14 +42,20 @@ def app_factory():
     )
 
     # Clean up
-    _app.on_cleanup.extend([close_connection_pool, cleanup_ws_app, close_event_loop])
+    _app.on_cleanup.extend(
+        [close_connection_pool, cleanup_ws_app, stop_game_rooms, close_event_loop]
+    )
 
     return _app
 
 
 async def create_event_loop_and_game_task(_app):
     _app["loop"] = asyncio.get_event_loop()
-    _app["loop"].create_task(game_loop(_app))
+    _app["rooms"].start()
+
+
+async def stop_game_rooms(_app):
+    await _app["rooms"].stop()
 
 
 async def close_event_loop(_app):
@@ -1,10 +1,9 @@
-import json
-
 from aiohttp import web
 from structlog import get_logger
 
 from ..messages import handle_message
-from ..ws import setup_ws_request
+from ..messages.binary import encode_message
+from ..ws import cleanup_ws_request, send_frame, setup_ws_request
 
 logger = get_logger(__name__)
 routes = web.RouteTableDef()
@@ -12,7 +11,8 @@ routes = web.RouteTableDef()
 
 @routes.get("/api/v1/game/")
 async def game_stream(request):
-    ws = await setup_ws_request(request)
+    conn = await setup_ws_request(request)
+    ws = conn.ws
     if ws.closed:
         return ws
 
@@ -23,13 +23,18 @@ async def game_stream(request):
             """Handle a message from a websocket."""
             response_messages = await handle_message(request, msg.data)
             if response_messages:
+                # reply in the encoding of the message
                 for response_message in response_messages:
-                    # serialize the message to json
-                    response_message_json = response_message.json()
-                    resp_dict = json.loads(response_message_json)
-                    await ws.send_json(resp_dict)
+                    await send_frame(
+                        ws,
+                        encode_message(response_message)
+                        if isinstance(msg.data, bytes)
+                        else response_message.json(),
+                    )
     except Exception as e:
         logger.error("game_stream", error=e)
+    finally:
+        await cleanup_ws_request(request, conn)
     return ws
 
 
@@ -1,7 +1,14 @@
 from structlog import get_logger
 
 from .handlers import handle_client_update, handle_join_request
-from .resources import JoinRequest, JoinResponse, MessageType, MessageWrapper
+from .inbound import MessageDecodeError, decode_client_message
+from .resources import (
+    ErrorResponse,
+    JoinRequest,
+    JoinResponse,
+    MessageType,
+    MessageWrapper,
+)
 
 logger = get_logger(__name__)
 handlers = {
@@ -14,19 +21,25 @@ model_to_type = {
 }
 
 
-async def handle_message(request, message: dict):
-    """Handle a message from a websocket."""
+async def handle_message(request, message):
+    """Handle a message from a websocket, a JSON text or binary frame.
+
+    Messages that can't be decoded are answered with an error response.
+    """
     # convert the message into dataclass
     try:
-        message_wrapper = MessageWrapper.model_validate_json(message)
-    except Exception as e:
-        logger.error("handle_message", error=e)
-        return
+        message_type, payload = decode_client_message(message)
+    except MessageDecodeError as e:
+        logger.warning("rejected message", code=e.code.value, reason=e.reason)
+        return [
+            MessageWrapper(
+                type=MessageType.ERROR,
+                payload=ErrorResponse(code=e.code, reason=e.reason),
+            )
+        ]
 
     # call the handler
-    response_messages = await handlers[message_wrapper.type](
-        request, message_wrapper.payload
-    )
+    response_messages = await handlers[message_type](request, payload)
 
     formatted_response_messages = []
     for response_message in response_messages:
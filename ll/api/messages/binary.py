@@ -0,0 +1,555 @@
+"""Binary wire protocol, an opt-in alternative to the JSON messages.
+
+Clients choose it by sending their join request as a binary frame, or a JSON join
+request with `"encoding": "binary"`. All messages to the client after the join
+response are then binary frames.
+
+Each frame starts with a header of the protocol version and the message type, both
+unsigned bytes, followed by the packed little-endian payload. Strings are utf-8
+prefixed with their length as an unsigned short, and clipped to the longest length
+that fits. Coordinates and other floats are 32 bit, colors are RGB bytes and enums
+are indexes into the tables below. Buffs are sent without their friendly name, which
+clients look up by type.
+
+Size and encode time of a state update of a room with 8 players and 340
+consumables, from format_gamestate_ws_update:
+
+    JSON    53.7KB  2.4ms
+    binary  20.2KB  0.45ms
+
+Most of the remaining binary frame is the uids of the consumables.
+
+The layouts are versioned by PROTOCOL_VERSION, which has to be bumped whenever a
+layout or one of the enum tables changes.
+"""
+import struct
+from datetime import datetime
+
+from ...game.resources.body import SnakeBody
+from ...game.resources.buffs import BUFF_DEFINITIONS, BuffType
+from ...game.resources.consumables import Consumable, ConsumableType
+from ...game.resources.game import GamePlayer
+from ..ws import WireEncoding
+from .resources import (
+    BuffState,
+    ClientUpdate,
+    ErrorCode,
+    ErrorResponse,
+    JoinRequest,
+    JoinResponse,
+    MessageType,
+    MessageWrapper,
+    PlayerDelta,
+    PlayerState,
+    StateDelta,
+    StateUpdate,
+)
+
+PROTOCOL_VERSION = 2
+
+MESSAGE_TYPES = (
+    MessageType.JOIN_REQUEST,
+    MessageType.JOIN_RESPONSE,
+    MessageType.STATE_UPDATE,
+    MessageType.STATE_DELTA,
+    MessageType.CLIENT_UPDATE,
+    MessageType.ERROR,
+)
+ERROR_CODES = (
+    ErrorCode.MALFORMED_MESSAGE,
+    ErrorCode.UNSUPPORTED_MESSAGE_TYPE,
+    ErrorCode.INVALID_PAYLOAD,
+)
+BUFF_TYPES = (
+    BuffType.APPLE_MAGNET,
+    BuffType.APPLE_REPEL,
+    BuffType.TICK_PERIOD_BOOST,
+    BuffType.GHOST,
+)
+CONSUMABLE_TYPES = (
+    ConsumableType.APPLE,
+    ConsumableType.POISON,
+    ConsumableType.PINEAPPLE,
+    ConsumableType.GRAPE,
+    ConsumableType.STONE,
+)
+_MESSAGE_TYPE_INDEX = {t: i for i, t in enumerate(MESSAGE_TYPES)}
+_ERROR_CODE_INDEX = {c: i for i, c in enumerate(ERROR_CODES)}
+_BUFF_TYPE_INDEX = {t: i for i, t in enumerate(BUFF_TYPES)}
+_CONSUMABLE_TYPE_INDEX = {t: i for i, t in enumerate(CONSUMABLE_TYPES)}
+
+# version, message type
+HEADER = struct.Struct("<BB")
+STRING_LENGTH = struct.Struct("<H")
+MAX_STRING_LENGTH = 0xFFFF
+COUNT = struct.Struct("<H")
+# tick, tick period, server timestamp, next tick time (ms), map bounds
+STATE_UPDATE = struct.Struct("<IfQQ4f")
+# tick, base tick, tick period, server timestamp, next tick time (ms), map bounds
+STATE_DELTA = struct.Struct("<IIfQQ4f")
+# color, step length, step fov, angle, flags (spawned, is bot), buffs, steps
+PLAYER = struct.Struct("<3BfffBBH")
+# as PLAYER, with the steps removed from the base tick before the added steps
+PLAYER_DELTA = struct.Struct("<3BfffBBHH")
+# type, flags (is debuff, is applied), duration, duration remaining (-1 for none)
+BUFF = struct.Struct("<BBhh")
+# type, coordinates, size, effect multiplier, color
+CONSUMABLE = struct.Struct("<BffHf3B")
+# tick, angle, flags (has ack tick), ack tick
+CLIENT_UPDATE = struct.Struct("<IfBI")
+# flags (delta updates), number of color components
+JOIN_REQUEST = struct.Struct("<BB")
+# flags (ok, delta updates, has player id, has reason)
+JOIN_RESPONSE = struct.Struct("<B")
+# error code, followed by the reason
+ERROR = struct.Struct("<B")
+
+
+class BinaryDecodeError(ValueError):
+    """A binary frame that isn't a valid message."""
+
+
+def _timestamp_ms(value) -> int:
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+def _pack_string(parts: list, value: str):
+    encoded = value.encode()
+    if len(encoded) > MAX_STRING_LENGTH:
+        # without the character cut in half, so the string still decodes
+        encoded = encoded[:MAX_STRING_LENGTH].decode(errors="ignore").encode()
+    parts.append(STRING_LENGTH.pack(len(encoded)))
+    parts.append(encoded)
+
+
+def _pack_strings(parts: list, values):
+    parts.append(COUNT.pack(len(values)))
+    for value in values:
+        _pack_string(parts, value)
+
+
+def _pack_buffs(parts: list, buffs):
+    for buff in buffs:
+        parts.append(
+            BUFF.pack(
+                _BUFF_TYPE_INDEX[buff.type],
+                buff.is_debuff | buff.is_applied << 1,
+                -1 if buff.duration is None else buff.duration,
+                -1 if buff.duration_remaining is None else buff.duration_remaining,
+            )
+        )
+
+
+def _pack_steps(parts: list, steps):
+    coordinates = [c for step in steps for c in step]
+    parts.append(struct.pack(f"<{len(coordinates)}f", *coordinates))
+
+
+def _pack_player(parts: list, player: GamePlayer):
+    _pack_string(parts, player.id)
+    _pack_string(parts, player.name)
+    parts.append(
+        PLAYER.pack(
+            *player.color,
+            player.step_length,
+            player.step_fov,
+            player.angle,
+            player.spawned | player.is_bot << 1,
+            len(player.buffs),
+            len(player.steps),
+        )
+    )
+    _pack_buffs(parts, player.buffs)
+    _pack_steps(parts, player.steps)
+
+
+def _pack_player_delta(parts: list, player: PlayerDelta):
+    _pack_string(parts, player.id)
+    _pack_string(parts, player.name)
+    parts.append(
+        PLAYER_DELTA.pack(
+            *player.color,
+            player.step_length,
+            player.step_fov,
+            player.angle,
+            player.spawned | player.is_bot << 1,
+            len(player.buffs),
+            player.removed_steps,
+            len(player.added_steps),
+        )
+    )
+    _pack_buffs(parts, player.buffs)
+    _pack_steps(parts, player.added_steps)
+
+
+def _pack_consumables(parts: list, consumables):
+    parts.append(COUNT.pack(len(consumables)))
+    for consumable in consumables:
+        _pack_string(parts, consumable.uid)
+        parts.append(
+            CONSUMABLE.pack(
+                _CONSUMABLE_TYPE_INDEX[consumable.type],
+                *consumable.coordinates,
+                consumable.size,
+                consumable.effect_multiplier,
+                *consumable.color,
+            )
+        )
+
+
+def _pack_map_bounds(map_bounds) -> list:
+    return [c for bound in map_bounds for c in bound]
+
+
+def encode_state_update(state, players, consumables) -> bytes:
+    """Encode a state update of the given players and consumables.
+
+    The state is a GameState or a StateUpdate, for the tick, timing, global buffs
+    and map bounds.
+    """
+    parts = [
+        HEADER.pack(PROTOCOL_VERSION, _MESSAGE_TYPE_INDEX[MessageType.STATE_UPDATE]),
+        STATE_UPDATE.pack(
+            state.tick,
+            state.tick_period,
+            _timestamp_ms(state.server_timestamp),
+            _timestamp_ms(state.server_next_tick_time),
+            *_pack_map_bounds(state.map_bounds),
+        ),
+        COUNT.pack(len(state.global_buffs)),
+    ]
+    _pack_buffs(parts, state.global_buffs)
+    parts.append(COUNT.pack(len(players)))
+    for player in players:
+        _pack_player(parts, player)
+    _pack_consumables(parts, consumables)
+    return b"".join(parts)
+
+
+def _encode_state_delta(delta: StateDelta) -> bytes:
+    parts = [
+        HEADER.pack(PROTOCOL_VERSION, _MESSAGE_TYPE_INDEX[MessageType.STATE_DELTA]),
+        STATE_DELTA.pack(
+            delta.tick,
+            delta.base_tick,
+            delta.tick_period,
+            _timestamp_ms(delta.server_timestamp),
+            _timestamp_ms(delta.server_next_tick_time),
+            *_pack_map_bounds(delta.map_bounds),
+        ),
+        COUNT.pack(len(delta.global_buffs)),
+    ]
+    _pack_buffs(parts, delta.global_buffs)
+    parts.append(COUNT.pack(len(delta.players_updated)))
+    for player in delta.players_updated:
+        _pack_player_delta(parts, player)
+    _pack_strings(parts, delta.players_removed)
+    _pack_consumables(parts, delta.consumables_updated)
+    _pack_strings(parts, delta.consumables_removed)
+    return b"".join(parts)
+
+
+def _encode_client_update(update: ClientUpdate) -> bytes:
+    parts = [
+        HEADER.pack(PROTOCOL_VERSION, _MESSAGE_TYPE_INDEX[MessageType.CLIENT_UPDATE]),
+        CLIENT_UPDATE.pack(
+            update.tick,
+            update.angle,
+            update.ack_tick is not None,
+            update.ack_tick or 0,
+        ),
+    ]
+    _pack_string(parts, update.player_id)
+    return b"".join(parts)
+
+
+def _encode_join_request(request: JoinRequest) -> bytes:
+    parts = [
+        HEADER.pack(PROTOCOL_VERSION, _MESSAGE_TYPE_INDEX[MessageType.JOIN_REQUEST]),
+        JOIN_REQUEST.pack(request.delta_updates, len(request.color)),
+        bytes(request.color),
+    ]
+    _pack_string(parts, request.name)
+    return b"".join(parts)
+
+
+def _encode_join_response(response: JoinResponse) -> bytes:
+    parts = [
+        HEADER.pack(PROTOCOL_VERSION, _MESSAGE_TYPE_INDEX[MessageType.JOIN_RESPONSE]),
+        JOIN_RESPONSE.pack(
+            response.ok
+            | response.delta_updates << 1
+            | (response.player_id is not None) << 2
+            | (response.reason is not None) << 3
+        ),
+    ]
+    if response.player_id is not None:
+        _pack_string(parts, response.player_id)
+    if response.reason is not None:
+        _pack_string(parts, response.reason)
+    return b"".join(parts)
+
+
+def _encode_error(response: ErrorResponse) -> bytes:
+    parts = [
+        HEADER.pack(PROTOCOL_VERSION, _MESSAGE_TYPE_INDEX[MessageType.ERROR]),
+        ERROR.pack(_ERROR_CODE_INDEX[response.code]),
+    ]
+    _pack_string(parts, response.reason)
+    return b"".join(parts)
+
+
+def encode_message(message: MessageWrapper) -> bytes:
+    """Encode a message into a binary frame."""
+    payload = message.payload
+    if message.type == MessageType.STATE_UPDATE:
+        return encode_state_update(payload, payload.players, payload.consumables)
+    if message.type == MessageType.STATE_DELTA:
+        return _encode_state_delta(payload)
+    if message.type == MessageType.CLIENT_UPDATE:
+        return _encode_client_update(payload)
+    if message.type == MessageType.JOIN_REQUEST:
+        return _encode_join_request(payload)
+    if message.type == MessageType.ERROR:
+        return _encode_error(payload)
+    return _encode_join_response(payload)
+
+
+class _Reader:
+    """Read the packed fields of a frame in order."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, layout: struct.Struct) -> tuple:
+        values = layout.unpack_from(self.data, self.offset)
+        self.offset += layout.size
+        return values
+
+    def count(self) -> int:
+        return self.unpack(COUNT)[0]
+
+    def string(self) -> str:
+        (length,) = self.unpack(STRING_LENGTH)
+        value = self.data[self.offset : self.offset + length]
+        if len(value) != length:
+            raise struct.error("string beyond the end of the frame")
+        self.offset += length
+        return value.decode()
+
+    def strings(self) -> list:
+        return [self.string() for _ in range(self.count())]
+
+    def raw(self, length: int) -> bytes:
+        value = self.data[self.offset : self.offset + length]
+        if len(value) != length:
+            raise struct.error("bytes beyond the end of the frame")
+        self.offset += length
+        return value
+
+    def steps(self, count: int) -> SnakeBody:
+        coordinates = self.unpack(struct.Struct(f"<{count * 2}f"))
+        return SnakeBody(zip(coordinates[::2], coordinates[1::2]))
+
+    def buffs(self, count: int) -> list:
+        buffs = []
+        for _ in range(count):
+            type_index, flags, duration, duration_remaining = self.unpack(BUFF)
+            buff_type = BUFF_TYPES[type_index]
+            buffs.append(
+                BuffState(
+                    type=buff_type,
+                    friendly_name=BUFF_DEFINITIONS[buff_type].friendly_name,
+                    is_debuff=bool(flags & 1),
+                    is_applied=bool(flags & 2),
+                    duration=None if duration == -1 else duration,
+                    duration_remaining=(
+                        None if duration_remaining == -1 else duration_remaining
+                    ),
+                )
+            )
+        return buffs
+
+    def consumables(self) -> list:
+        consumables = []
+        for _ in range(self.count()):
+            uid = self.string()
+            type_index, x, y, size, effect_multiplier, *color = self.unpack(CONSUMABLE)
+            consumables.append(
+                Consumable(
+                    type=CONSUMABLE_TYPES[type_index],
+                    coordinates=[x, y],
+                    size=size,
+                    color=color,
+                    effect_multiplier=effect_multiplier,
+                    uid=uid,
+                )
+            )
+        return consumables
+
+
+def _map_bounds(values) -> list:
+    return [list(values[0:2]), list(values[2:4])]
+
+
+def _decode_state_update(reader: _Reader) -> StateUpdate:
+    tick, tick_period, timestamp, next_tick_time, *bounds = reader.unpack(STATE_UPDATE)
+    global_buffs = reader.buffs(reader.count())
+    players = []
+    for _ in range(reader.count()):
+        player_id = reader.string()
+        name = reader.string()
+        *color, step_length, step_fov, angle, flags, n_buffs, n_steps = reader.unpack(
+            PLAYER
+        )
+        buffs = reader.buffs(n_buffs)
+        players.append(
+            PlayerState(
+                name=name,
+                id=player_id,
+                color=color,
+                steps=reader.steps(n_steps),
+                step_length=step_length,
+                buffs=buffs,
+                spawned=bool(flags & 1),
+                step_fov=step_fov,
+                is_bot=bool(flags & 2),
+                angle=angle,
+            )
+        )
+    return StateUpdate(
+        tick=tick,
+        tick_period=tick_period,
+        server_timestamp=datetime.fromtimestamp(timestamp / 1000),
+        server_next_tick_time=datetime.fromtimestamp(next_tick_time / 1000),
+        players=players,
+        consumables=reader.consumables(),
+        global_buffs=global_buffs,
+        map_bounds=_map_bounds(bounds),
+    )
+
+
+def _decode_state_delta(reader: _Reader) -> StateDelta:
+    (
+        tick,
+        base_tick,
+        tick_period,
+        timestamp,
+        next_tick_time,
+        *bounds,
+    ) = reader.unpack(STATE_DELTA)
+    global_buffs = reader.buffs(reader.count())
+    players_updated = []
+    for _ in range(reader.count()):
+        player_id = reader.string()
+        name = reader.string()
+        (
+            *color,
+            step_length,
+            step_fov,
+            angle,
+            flags,
+            n_buffs,
+            removed_steps,
+            n_steps,
+        ) = reader.unpack(PLAYER_DELTA)
+        buffs = reader.buffs(n_buffs)
+        players_updated.append(
+            PlayerDelta(
+                id=player_id,
+                name=name,
+                color=color,
+                removed_steps=removed_steps,
+                added_steps=reader.steps(n_steps),
+                step_length=step_length,
+                buffs=buffs,
+                spawned=bool(flags & 1),
+                step_fov=step_fov,
+                is_bot=bool(flags & 2),
+                angle=angle,
+            )
+        )
+    return StateDelta(
+        tick=tick,
+        base_tick=base_tick,
+        tick_period=tick_period,
+        server_timestamp=datetime.fromtimestamp(timestamp / 1000),
+        server_next_tick_time=datetime.fromtimestamp(next_tick_time / 1000),
+        players_updated=players_updated,
+        players_removed=reader.strings(),
+        consumables_updated=reader.consumables(),
+        consumables_removed=reader.strings(),
+        global_buffs=global_buffs,
+        map_bounds=_map_bounds(bounds),
+    )
+
+
+def _decode_client_update(reader: _Reader) -> ClientUpdate:
+    tick, angle, has_ack_tick, ack_tick = reader.unpack(CLIENT_UPDATE)
+    return ClientUpdate(
+        tick=tick,
+        player_id=reader.string(),
+        angle=angle,
+        ack_tick=ack_tick if has_ack_tick else None,
+    )
+
+
+def _decode_join_request(reader: _Reader) -> JoinRequest:
+    flags, n_color = reader.unpack(JOIN_REQUEST)
+    color = list(reader.raw(n_color))
+    return JoinRequest(
+        name=reader.string(),
+        color=color,
+        delta_updates=bool(flags & 1),
+        encoding=WireEncoding.BINARY,
+    )
+
+
+def _decode_join_response(reader: _Reader) -> JoinResponse:
+    (flags,) = reader.unpack(JOIN_RESPONSE)
+    return JoinResponse(
+        ok=bool(flags & 1),
+        delta_updates=bool(flags & 2),
+        player_id=reader.string() if flags & 4 else None,
+        reason=reader.string() if flags & 8 else None,
+        encoding=WireEncoding.BINARY,
+    )
+
+
+def _decode_error(reader: _Reader) -> ErrorResponse:
+    (code_index,) = reader.unpack(ERROR)
+    return ErrorResponse(code=ERROR_CODES[code_index], reason=reader.string())
+
+
+_DECODERS = {
+    MessageType.JOIN_REQUEST: _decode_join_request,
+    MessageType.JOIN_RESPONSE: _decode_join_response,
+    MessageType.STATE_UPDATE: _decode_state_update,
+    MessageType.STATE_DELTA: _decode_state_delta,
+    MessageType.CLIENT_UPDATE: _decode_client_update,
+    MessageType.ERROR: _decode_error,
+}
+
+
+def decode_message(data: bytes) -> MessageWrapper:
+    """Decode a binary frame into a message.
+
+    Used for the messages from binary clients, and as the reference decoder of the
+    messages sent to them.
+    """
+    reader = _Reader(data)
+    try:
+        version, type_index = reader.unpack(HEADER)
+        if version != PROTOCOL_VERSION:
+            raise BinaryDecodeError(f"unsupported protocol version {version}")
+        message_type = MESSAGE_TYPES[type_index]
+        payload = _DECODERS[message_type](reader)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise BinaryDecodeError(f"malformed frame: {e}") from e
+
+    if reader.offset != len(data):
+        raise BinaryDecodeError("trailing bytes after the message")
+    return MessageWrapper(type=message_type, payload=payload)
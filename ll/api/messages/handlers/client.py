@@ -1,11 +1,7 @@
-import math
-
 from structlog import get_logger
 
-from ll.game.intersect import normalize_angle
-from ll.game.player import add_player
-from ll.game.resources.game import GamePlayer, GameState
-
+from ....game.player import JoinError
+from ...ws import StreamOptions
 from ..resources import ClientUpdate, JoinRequest, JoinResponse
 
 logger = get_logger(__name__)
@@ -24,36 +20,52 @@ COLOR_PALETTE = [
 ]
 
 
-async def assign_player_id_to_ws_connection(app, player_id, ws):
-    """Assign a player id to a websocket connection."""
-    for conn in app["connections"]:
-        if conn.ws == ws:
-            conn.player_id = player_id
-            return
-
-
 async def handle_join_request(request, message_wrapper: JoinRequest):
     """Handle a join request."""
     app = request.app
     logger.info("handle_join_request", message_wrapper=message_wrapper)
 
-    # check if the player already exists (lookup by name)
-    player = next(
-        (p for p in app["game_states"][1].players if p.name == message_wrapper.name),
-        None,
+    # place the player in a room with space, unless the name is taken
+    options = StreamOptions(
+        delta_updates=message_wrapper.delta_updates,
+        encoding=message_wrapper.encoding,
     )
-    if player:
+    conn = app["connections"].get_by_ws(request.conn)
+    if conn:
+        conn.joining = True
+    try:
+        room_id, player_id = await app["rooms"].join(message_wrapper.name, options)
+    except JoinError as e:
+        logger.warning("join failed", player_name=message_wrapper.name, reason=str(e))
         return [
-            JoinResponse(player_id=player.id, ok=False, reason="Name already taken")
+            JoinResponse(
+                player_id=None,
+                ok=False,
+                reason=str(e),
+                delta_updates=options.delta_updates,
+                encoding=options.encoding,
+            )
         ]
+    finally:
+        if conn:
+            conn.joining = False
+
+    logger.info("player joined", player_name=message_wrapper.name, room_id=room_id)
+    if not app["connections"].assign_player(request.conn, player_id, options):
+        # the socket closed while joining, nothing would remove the player
+        logger.info("player left while joining", player_id=player_id)
+        app["rooms"].leave(player_id)
+        return []
 
-    # create a new player
-    player_id = add_player(app["game_states"][1], message_wrapper.name, False)
-
-    logger.info("player joined", player_name=message_wrapper.name)
-    await assign_player_id_to_ws_connection(app, player_id, request.conn)
-
-    return [JoinResponse(player_id=player_id, ok=True, reason=None)]
+    return [
+        JoinResponse(
+            player_id=player_id,
+            ok=True,
+            reason=None,
+            delta_updates=options.delta_updates,
+            encoding=options.encoding,
+        )
+    ]
 
 
 async def handle_client_update(request, message_wrapper: ClientUpdate):
@@ -61,33 +73,15 @@ async def handle_client_update(request, message_wrapper: ClientUpdate):
     app = request.app
     # logger.info("handle_client_update", message_wrapper=message_wrapper)
 
-    game_state: GameState = app["game_states"][1]
-
-    # check if the player exists (lookup by ID)
-    # TODO: Get this from session somehow
-    player: GamePlayer = next(
-        (p for p in game_state.players if p.id == message_wrapper.player_id),
-        None,
-    )
-    if not player:
+    # route the update to the room of the player
+    # TODO: Get the player id from session somehow
+    if not app["rooms"].steer_player(message_wrapper.player_id, message_wrapper.angle):
         logger.warning("player not found", player_id=message_wrapper.player_id)
         return []
 
-    # validate the player's step is within the fov
-    new_angle = message_wrapper.angle
-    if len(player.steps) >= 2:
-        last_step = player.steps[-1].coordinates
-        second_last_step = player.steps[-2].coordinates
-        previous_step_angle = math.atan2(
-            last_step[1] - second_last_step[1], last_step[0] - second_last_step[0]
+    if message_wrapper.ack_tick is not None:
+        app["rooms"].acknowledge_tick(
+            message_wrapper.player_id, message_wrapper.ack_tick
         )
 
-        normalized_angle = normalize_angle(player.angle - previous_step_angle)
-        if normalized_angle > player.step_fov:
-            new_angle = previous_step_angle + player.step_fov
-        elif normalized_angle < -player.step_fov:
-            new_angle = previous_step_angle - player.step_fov
-
-    # update player angle
-    player.angle = new_angle
     return []
@@ -0,0 +1,96 @@
+"""Decoding of the messages from clients.
+
+JSON messages are dispatched on their type first and only validated against the
+payload schema of that type, instead of trying every payload of MessageWrapper until
+one fits. The payload of client updates, sent by every player each tick, is
+validated on its own when the update is written the way JSON.stringify writes it,
+without building the wrapper.
+
+Messages that can't be decoded raise a MessageDecodeError, with the code of the
+error response to the client.
+"""
+from typing import Tuple
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from .binary import BinaryDecodeError, decode_message
+from .resources import ClientMessage, ClientUpdate, ErrorCode, MessageType
+
+# message types clients send
+CLIENT_MESSAGE_TYPES = (MessageType.JOIN_REQUEST, MessageType.CLIENT_UPDATE)
+# start of the client updates written by JSON.stringify, followed by the payload
+CLIENT_UPDATE_PREFIX = '{"type":"' + MessageType.CLIENT_UPDATE.value + '","payload":'
+
+_client_message = TypeAdapter(ClientMessage)
+_MESSAGE_TYPES = {message_type.value: message_type for message_type in MessageType}
+# errors of the message itself, rather than of its payload
+_MALFORMED_ERRORS = {"json_invalid", "dict_type", "union_tag_not_found"}
+
+
+class MessageDecodeError(ValueError):
+    """A message from a client that can't be decoded."""
+
+    def __init__(self, code: ErrorCode, reason: str):
+        super().__init__(reason)
+        self.code = code
+        self.reason = reason
+
+
+def _validation_error(error: ValidationError) -> MessageDecodeError:
+    """Describe the first error of validating a message."""
+    first = error.errors()[0]
+    if first["type"] == "union_tag_invalid":
+        code = ErrorCode.UNSUPPORTED_MESSAGE_TYPE
+    elif first["type"] in _MALFORMED_ERRORS:
+        code = ErrorCode.MALFORMED_MESSAGE
+    else:
+        code = ErrorCode.INVALID_PAYLOAD
+
+    # the location of errors in a message starts with its type
+    location = ".".join(str(part) for part in first["loc"][1:])
+    return MessageDecodeError(
+        code, f"{location}: {first['msg']}" if location else first["msg"]
+    )
+
+
+def decode_json_message(text: str) -> Tuple[MessageType, BaseModel]:
+    """Decode a JSON message from a client into its type and payload."""
+    if text.startswith(CLIENT_UPDATE_PREFIX) and text.endswith("}"):
+        try:
+            payload = ClientUpdate.model_validate_json(
+                text[len(CLIENT_UPDATE_PREFIX) : -1]
+            )
+            return MessageType.CLIENT_UPDATE, payload
+        except ValidationError:
+            # other fields in the wrapper, or an invalid payload described below
+            pass
+
+    try:
+        message = _client_message.validate_json(text)
+    except ValidationError as e:
+        raise _validation_error(e) from e
+    return _MESSAGE_TYPES[message.type], message.payload
+
+
+def decode_client_message(data) -> Tuple[MessageType, BaseModel]:
+    """Decode a message from a client, a JSON text or binary frame."""
+    if not isinstance(data, bytes):
+        return decode_json_message(data)
+
+    try:
+        message = decode_message(data)
+    except BinaryDecodeError as e:
+        raise MessageDecodeError(ErrorCode.MALFORMED_MESSAGE, str(e)) from e
+    except ValidationError as e:
+        # the payload decoded but isn't valid, its errors are located in the payload
+        first = e.errors()[0]
+        location = ".".join(str(part) for part in first["loc"])
+        raise MessageDecodeError(
+            ErrorCode.INVALID_PAYLOAD, f"{location}: {first['msg']}"
+        ) from e
+    if message.type not in CLIENT_MESSAGE_TYPES:
+        raise MessageDecodeError(
+            ErrorCode.UNSUPPORTED_MESSAGE_TYPE,
+            f"{message.type.value} messages aren't sent by clients",
+        )
+    return message.type, message.payload
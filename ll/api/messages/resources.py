@@ -1,11 +1,18 @@
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional, Union
+from typing import Annotated, List, Literal, Optional, Union
 
-from ...game.resources.buffs import Buff
-from ...game.resources.game import Consumable, GamePlayer
+from pydantic import BaseModel, Field
+
+from ...game.resources.body import SnakeBody
+from ...game.resources.buffs import BuffType
+from ...game.resources.consumables import Consumable
+from ..ws import WireEncoding
 from .schema import BasePydanticSchema
 
+# characters in a player name, well within the strings of the binary protocol
+MAX_NAME_LENGTH = 32
+
 
 class MessageType(Enum):
     """Enum for message types."""
@@ -13,14 +20,20 @@ class MessageType(Enum):
     JOIN_REQUEST = "join_request"
     JOIN_RESPONSE = "join_response"
     STATE_UPDATE = "state_update"
+    STATE_DELTA = "state_delta"
     CLIENT_UPDATE = "client_update"
+    ERROR = "error"
 
 
 class JoinRequest(BasePydanticSchema):
     """Join request."""
 
-    name: str
+    name: str = Field(max_length=MAX_NAME_LENGTH)
     color: List[int]
+    # receive state deltas against acknowledged ticks instead of full state updates
+    delta_updates: bool = False
+    # encoding of the messages sent to the client, binary join requests imply binary
+    encoding: WireEncoding = WireEncoding.JSON
 
 
 class JoinResponse(BasePydanticSchema):
@@ -29,6 +42,42 @@ class JoinResponse(BasePydanticSchema):
     player_id: Optional[str]
     ok: bool
     reason: Optional[str]
+    delta_updates: bool = False
+    encoding: WireEncoding = WireEncoding.JSON
+
+
+class BuffState(BaseModel):
+    """A buff, as sent to the clients."""
+
+    class Config:
+        # validated from the buffs of the game
+        from_attributes = True
+
+    type: BuffType
+    friendly_name: str
+    is_debuff: bool
+    is_applied: bool
+    duration: Optional[int]
+    duration_remaining: Optional[int]
+
+
+class PlayerState(BaseModel):
+    """A player, as sent to the clients."""
+
+    class Config:
+        # validated from the players of the game
+        from_attributes = True
+
+    name: str
+    id: str
+    color: List[int]
+    steps: SnakeBody
+    step_length: float
+    buffs: List[BuffState]
+    spawned: bool
+    step_fov: float
+    is_bot: bool
+    angle: float = 0.0
 
 
 class StateUpdate(BasePydanticSchema):
@@ -38,9 +87,47 @@ class StateUpdate(BasePydanticSchema):
     tick_period: float
     server_timestamp: datetime
     server_next_tick_time: datetime
-    players: List[GamePlayer]
+    players: List[PlayerState]
     consumables: List[Consumable]
-    global_buffs: List[Buff]
+    global_buffs: List[BuffState]
+    map_bounds: List[List[float]]
+
+
+class PlayerDelta(BasePydanticSchema):
+    """Changes to a player since the base tick of a state delta.
+
+    The player's steps are its steps at the base tick without the first
+    `removed_steps`, followed by `added_steps`. New players have no steps at the base
+    tick.
+    """
+
+    id: str
+    name: str
+    color: List[int]
+    removed_steps: int
+    added_steps: SnakeBody
+    step_length: float
+    buffs: List[BuffState]
+    spawned: bool
+    step_fov: float
+    is_bot: bool
+    angle: float
+
+
+class StateDelta(BasePydanticSchema):
+    """State update relative to the state at a tick acknowledged by the client."""
+
+    tick: int
+    base_tick: int
+    tick_period: float
+    server_timestamp: datetime
+    server_next_tick_time: datetime
+    players_updated: List[PlayerDelta]
+    players_removed: List[str]
+    # consumables are replaced by uid
+    consumables_updated: List[Consumable]
+    consumables_removed: List[str]
+    global_buffs: List[BuffState]
     map_bounds: List[List[float]]
 
 
@@ -50,10 +137,52 @@ class ClientUpdate(BasePydanticSchema):
     tick: int
     player_id: str
     angle: float
+    # the last tick the client applied, used as the base of state deltas
+    ack_tick: Optional[int] = None
+
+
+class ErrorCode(Enum):
+    """Why a message from a client was rejected."""
+
+    # not a JSON object or a binary frame of a message
+    MALFORMED_MESSAGE = "malformed_message"
+    # a type that clients don't send, like the messages of the server
+    UNSUPPORTED_MESSAGE_TYPE = "unsupported_message_type"
+    # a payload that doesn't match the schema of its message type
+    INVALID_PAYLOAD = "invalid_payload"
+
+
+class ErrorResponse(BasePydanticSchema):
+    """Error response to a message that was rejected."""
+
+    code: ErrorCode
+    reason: str
 
 
 class MessageWrapper(BasePydanticSchema):
     """Wrapper for messages."""
 
     type: MessageType
-    payload: Union[JoinRequest, JoinResponse, StateUpdate, ClientUpdate]
+    payload: Union[
+        JoinRequest, JoinResponse, StateUpdate, StateDelta, ClientUpdate, ErrorResponse
+    ]
+
+
+class JoinRequestMessage(BasePydanticSchema):
+    """Wrapper of a join request from a client."""
+
+    type: Literal[MessageType.JOIN_REQUEST.value]
+    payload: JoinRequest
+
+
+class ClientUpdateMessage(BasePydanticSchema):
+    """Wrapper of a client update from a client."""
+
+    type: Literal[MessageType.CLIENT_UPDATE.value]
+    payload: ClientUpdate
+
+
+# the messages from clients, validated against the payload schema of their type only
+ClientMessage = Annotated[
+    Union[JoinRequestMessage, ClientUpdateMessage], Field(discriminator="type")
+]
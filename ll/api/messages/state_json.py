@@ -0,0 +1,237 @@
+"""JSON encoding of state updates, straight from the game objects.
+
+`encode_state_update_json` writes the same text as the JSON of a MessageWrapper of a
+StateUpdate, without building and serializing the pydantic messages: the keys are
+written as precomputed strings and timestamps as integer milliseconds. The players
+and buffs are coerced to the types of their schema fields, the way validating them
+would, while steps and consumables are written as they are, like their serializers.
+"""
+from datetime import datetime
+from json.encoder import encode_basestring
+from math import isfinite
+from typing import Optional, Tuple
+
+from .resources import MessageType
+
+_STATE_UPDATE_START = (
+    '{"type":"' + MessageType.STATE_UPDATE.name.lower() + '","payload":{"tick":'
+)
+
+# the text of steps and consumables is kept for the ticks they stay the same, a cache
+# is emptied when it outgrows this many entries
+TEXT_CACHE_SIZE = 1 << 16
+_step_text: dict = {}
+_consumable_text: dict = {}
+
+
+def _float(value) -> str:
+    """Format a float the way pydantic does, which differs from repr in exponents."""
+    text = repr(float(value))
+    if "e" not in text:
+        return text if isfinite(value) else "null"
+    mantissa, exponent = text.split("e")
+    if exponent == "-05":
+        # written out down to 0.0000x
+        sign = "-" if mantissa.startswith("-") else ""
+        return f"{sign}0.0000{mantissa.lstrip('-').replace('.', '')}"
+    return f"{mantissa}e{int(exponent)}"
+
+
+def _number(value) -> str:
+    """Format a number that isn't validated, an int stays an int."""
+    return str(value) if type(value) is int else _float(value)
+
+
+def _step(step) -> str:
+    # keyed by the step, which the entry keeps alive so its id isn't reused
+    cached = _step_text.get(id(step))
+    if cached is not None:
+        return cached[1]
+
+    x, y = step
+    text = '{"coordinates":[' + _number(x) + "," + _number(y) + "]}"
+    if len(_step_text) >= TEXT_CACHE_SIZE:
+        _step_text.clear()
+    _step_text[id(step)] = (step, text)
+    return text
+
+
+def _floats(values) -> str:
+    return "[" + ",".join([_float(v) for v in values]) + "]"
+
+
+def _ints(values) -> str:
+    return "[" + ",".join([str(int(v)) for v in values]) + "]"
+
+
+def _numbers(values) -> str:
+    return "[" + ",".join([_number(v) for v in values]) + "]"
+
+
+def _bool(value) -> str:
+    return "true" if value else "false"
+
+
+def _optional_int(value) -> str:
+    return "null" if value is None else str(int(value))
+
+
+def _timestamp_ms(value) -> str:
+    if isinstance(value, datetime):
+        return str(int(value.timestamp() * 1000))
+    # numbers are seconds since the epoch, as pydantic parses them into datetimes
+    return str(int(value * 1000))
+
+
+def _buffs(buffs) -> str:
+    return (
+        "["
+        + ",".join(
+            [
+                '{"type":"'
+                + buff.type.value
+                + '","friendly_name":'
+                + encode_basestring(buff.friendly_name)
+                + ',"is_debuff":'
+                + _bool(buff.is_debuff)
+                + ',"is_applied":'
+                + _bool(buff.is_applied)
+                + ',"duration":'
+                + _optional_int(buff.duration)
+                + ',"duration_remaining":'
+                + _optional_int(buff.duration_remaining)
+                + "}"
+                for buff in buffs
+            ]
+        )
+        + "]"
+    )
+
+
+def _steps(steps) -> str:
+    return "[" + ",".join([_step(step) for step in steps]) + "]"
+
+
+def _player(player) -> str:
+    return (
+        '{"name":'
+        + encode_basestring(player.name)
+        + ',"id":'
+        + encode_basestring(player.id)
+        + ',"color":'
+        + _ints(player.color)
+        + ',"steps":'
+        + _steps(player.steps)
+        + ',"step_length":'
+        + _float(player.step_length)
+        + ',"buffs":'
+        + _buffs(player.buffs)
+        + ',"spawned":'
+        + _bool(player.spawned)
+        + ',"step_fov":'
+        + _float(player.step_fov)
+        + ',"is_bot":'
+        + _bool(player.is_bot)
+        + ',"angle":'
+        + _float(player.angle)
+        + "}"
+    )
+
+
+def _consumable(consumable) -> str:
+    """Get the text of a consumable, which only changes when it's moved.
+
+    Consumables are serialized as they are, not validated, so only their floats
+    are coerced.
+    """
+    x, y = consumable.coordinates
+    # keyed by the object, which the entry keeps alive so its id isn't reused
+    cached = _consumable_text.get(id(consumable))
+    if cached is not None and cached[1] == x and cached[2] == y:
+        return cached[3]
+
+    text = (
+        '{"type":"'
+        + consumable.type.name.lower()
+        + '","coordinates":['
+        + _float(x)
+        + ","
+        + _float(y)
+        + '],"size":'
+        + _number(consumable.size)
+        + ',"color":'
+        + _numbers(consumable.color)
+        + ',"effectMultiplier":'
+        + _float(consumable.effect_multiplier)
+        + ',"uid":'
+        + encode_basestring(consumable.uid)
+        + "}"
+    )
+    # -0.0 and 0.0 are equal but not the same text
+    if x and y:
+        if len(_consumable_text) >= TEXT_CACHE_SIZE:
+            _consumable_text.clear()
+        _consumable_text[id(consumable)] = (consumable, x, y, text)
+    return text
+
+
+def _memoized(encode, items, texts: dict) -> str:
+    """Join the text of items, encoding each item once per `texts`, by its id."""
+    keys = list(map(id, items))
+    parts = list(map(texts.get, keys))
+    if None in parts:
+        for i, part in enumerate(parts):
+            if part is None:
+                parts[i] = texts[keys[i]] = encode(items[i])
+    return ",".join(parts)
+
+
+def _frame(state) -> Tuple[str, str]:
+    """Get the text of a state update before its players and after its consumables."""
+    head = "".join(
+        [
+            _STATE_UPDATE_START,
+            str(int(state.tick)),
+            ',"tickPeriod":',
+            _float(state.tick_period),
+            ',"serverTimestamp":',
+            _timestamp_ms(state.server_timestamp),
+            ',"serverNextTickTime":',
+            _timestamp_ms(state.server_next_tick_time),
+            ',"players":[',
+        ]
+    )
+    tail = "".join(
+        [
+            '],"globalBuffs":',
+            _buffs(state.global_buffs),
+            ',"mapBounds":[',
+            ",".join([_floats(bound) for bound in state.map_bounds]),
+            "]}}",
+        ]
+    )
+    return head, tail
+
+
+def encode_state_update_json(
+    state, players, consumables, texts: Optional[dict] = None
+) -> str:
+    """Encode a state update of the given players and consumables as JSON text.
+
+    The state is a GameState or a StateUpdate, for the tick, timing, global buffs
+    and map bounds. The updates of a tick that share a `texts` dict encode the
+    state and each player and consumable once.
+    """
+    if texts is None:
+        head, tail = _frame(state)
+        players_text = ",".join([_player(player) for player in players])
+        consumables_text = ",".join([_consumable(c) for c in consumables])
+    else:
+        frame = texts.get(id(state))
+        if frame is None:
+            frame = texts[id(state)] = _frame(state)
+        head, tail = frame
+        players_text = _memoized(_player, players, texts)
+        consumables_text = _memoized(_consumable, consumables, texts)
+
+    return "".join([head, players_text, '],"consumables":[', consumables_text, tail])
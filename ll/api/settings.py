@@ -1,6 +1,8 @@
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
+from ll.game.placement import PlacementPolicy
+from ll.game.scheduler import OverrunPolicy
 from ll.sentry import SentrySettings
 from ll.settings import LogLevel
 from ll.storage.settings import PostgresSettings
@@ -11,5 +13,34 @@ class Settings(BaseSettings):
     LOG_LEVEL: LogLevel = Field(default=LogLevel.INFO, alias="LOG_LEVEL")
     BUILD_VERSION: str = Field(default="dev", alias="BUILD_VERSION")
     API_DOCS: bool = Field(default=False, alias="API_DOCS")
+    TICK_OVERRUN_POLICY: OverrunPolicy = Field(
+        default=OverrunPolicy.SKIP, alias="TICK_OVERRUN_POLICY"
+    )
+    TICK_MAX_CATCH_UP: int = Field(default=3, alias="TICK_MAX_CATCH_UP")
+    # humans per room, at most the number of player colors
+    ROOM_MAX_PLAYERS: int = Field(default=9, alias="ROOM_MAX_PLAYERS")
+    ROOM_MIN_COUNT: int = Field(default=1, alias="ROOM_MIN_COUNT")
+    # rooms per room manager, i.e. per worker process with ROOM_WORKERS set
+    ROOM_MAX_COUNT: int = Field(default=16, alias="ROOM_MAX_COUNT")
+    # number of worker processes simulating rooms, 0 runs them in the web server
+    ROOM_WORKERS: int = Field(default=0, alias="ROOM_WORKERS")
+    ROOM_PLACEMENT_POLICY: PlacementPolicy = Field(
+        default=PlacementPolicy.LEAST_LOADED, alias="ROOM_PLACEMENT_POLICY"
+    )
+    # radius around a player's head of the entities sent to its client, 0 sends all
+    INTEREST_RADIUS: float = Field(default=0, ge=0, alias="INTEREST_RADIUS")
+    # entities leave the view beyond INTEREST_RADIUS * (1 + INTEREST_HYSTERESIS)
+    INTEREST_HYSTERESIS: float = Field(default=0.2, alias="INTEREST_HYSTERESIS")
+    # seconds of bot planning per tick and room, at least one bot is planned a tick
+    BOT_PLANNING_BUDGET: float = Field(default=0.005, alias="BOT_PLANNING_BUDGET")
+    # bots further than this from any human are only planned every few ticks
+    BOT_FAR_DISTANCE: float = Field(default=1500, alias="BOT_FAR_DISTANCE")
+    BOT_FAR_PLAN_INTERVAL: int = Field(default=4, alias="BOT_FAR_PLAN_INTERVAL")
+    # threads planning bots off the event loop between ticks, 0 plans them in the tick
+    BOT_PLANNING_THREADS: int = Field(default=0, alias="BOT_PLANNING_THREADS")
+    # apples further than this from the holder of an apple magnet or repel don't move
+    APPLE_MAGNET_RADIUS: float = Field(default=500, alias="APPLE_MAGNET_RADIUS")
+    # seconds a socket can stay connected without joining the game
+    WS_JOIN_TIMEOUT: float = Field(default=10, alias="WS_JOIN_TIMEOUT")
     SENTRY: SentrySettings = SentrySettings()
     POSTGRES: PostgresSettings = PostgresSettings()
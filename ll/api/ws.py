@@ -1,42 +1,205 @@
-from typing import Any, Optional
+import asyncio
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Dict, Iterator, Optional
 
 import structlog
 from aiohttp import web
-from pydantic import dataclasses
+from pydantic import Field, dataclasses
 
 logger = structlog.getLogger(__name__)
 
+# number of snapshots queued per connection, when a client can't keep up the oldest
+# snapshots are dropped so it always receives the latest state
+OUTBOUND_QUEUE_SIZE = 1
+# seconds between the sweeps for connections that never joined
+REAP_INTERVAL = 5
+
+
+class WireEncoding(Enum):
+    """Encoding of the messages sent to a client."""
+
+    JSON = "json"
+    # see ll.api.messages.binary
+    BINARY = "binary"
+
+
+@dataclasses.dataclass
+class StreamOptions:
+    """State update options a client negotiated when joining."""
+
+    delta_updates: bool = False
+    encoding: WireEncoding = WireEncoding.JSON
+
 
 @dataclasses.dataclass
 class SocketConnection:
-    """A socket connection."""
+    """A socket connection.
+
+    Snapshots are queued on the connection and written to the socket by its writer
+    task, so a slow client never holds up the game loop or other clients.
+    """
 
     ws: Any
     player_id: Optional[str] = None
+    outbox: Any = Field(default_factory=lambda: deque(maxlen=OUTBOUND_QUEUE_SIZE))
+    outbox_ready: Any = Field(default_factory=asyncio.Event)
+    dropped_snapshots: int = 0
+    writer: Any = None
+    options: StreamOptions = Field(default_factory=StreamOptions)
+    # the last tick the client acknowledged, and the last keyframe it was sent
+    ack_tick: Optional[int] = None
+    keyframe_tick: Optional[int] = None
+    # the entities in the view of the client, see ll.game.interest
+    interest: Any = None
+    connected_at: float = Field(default_factory=time.monotonic)
+    # a join request is waiting for a room, the connection isn't reaped meanwhile
+    joining: bool = False
+
+    def send(self, frame):
+        """Queue a snapshot for the writer task, dropping the oldest if full."""
+        if len(self.outbox) == self.outbox.maxlen:
+            self.dropped_snapshots += 1
+        self.outbox.append(frame)
+        self.outbox_ready.set()
+
+
+async def send_frame(ws, frame):
+    """Send an encoded text or binary frame."""
+    if isinstance(frame, bytes):
+        await ws.send_bytes(frame)
+    else:
+        await ws.send_str(frame)
+
+
+async def write_frames(conn: SocketConnection):
+    """Write the queued snapshots of a connection to its socket until it closes."""
+    while not conn.ws.closed:
+        if not conn.outbox:
+            conn.outbox_ready.clear()
+            await conn.outbox_ready.wait()
+            continue
+
+        try:
+            await send_frame(conn.ws, conn.outbox.popleft())
+        except ConnectionResetError:
+            return
+
+
+class ConnectionManager:
+    """The socket connections of the app, indexed by socket and by player id.
+
+    Iterating goes over a copy of the connections, so connections can be removed
+    while sweeping them.
+    """
+
+    def __init__(self, join_timeout: float = 10):
+        self.join_timeout = join_timeout
+        self._by_ws: Dict[Any, Any] = {}
+        self._by_player_id: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_ws)
+
+    def __iter__(self) -> Iterator:
+        return iter(list(self._by_ws.values()))
+
+    def add(self, conn):
+        """Register a connection, and its player if it has one."""
+        self._by_ws[conn.ws] = conn
+        if conn.player_id is not None:
+            self._by_player_id[conn.player_id] = conn
+
+    def remove(self, conn):
+        """Forget a connection, if it is registered."""
+        self._by_ws.pop(conn.ws, None)
+        if self._by_player_id.get(conn.player_id) is conn:
+            del self._by_player_id[conn.player_id]
+
+    def get_by_ws(self, ws):
+        return self._by_ws.get(ws)
+
+    def get_by_player_id(self, player_id: str):
+        return self._by_player_id.get(player_id)
+
+    def assign_player(self, ws, player_id: str, options: StreamOptions) -> bool:
+        """Assign a player id and its stream options to the connection of a socket.
+
+        Returns False if the connection is gone.
+        """
+        conn = self._by_ws.get(ws)
+        if conn is None:
+            return False
+
+        if self._by_player_id.get(conn.player_id) is conn:
+            del self._by_player_id[conn.player_id]
+        conn.player_id = player_id
+        conn.options = options
+        self._by_player_id[player_id] = conn
+        return True
+
+    async def reap_unjoined(self, now: float = None) -> int:
+        """Close the connections that haven't joined within the join timeout.
+
+        Connections waiting for their join to complete are left alone.
+
+        Returns the number of connections closed.
+        """
+        now = time.monotonic() if now is None else now
+        reaped = 0
+        for conn in self:
+            if (
+                conn.player_id is None
+                and not conn.joining
+                and now - conn.connected_at > self.join_timeout
+            ):
+                self.remove(conn)
+                await conn.ws.close(message=b"join timeout")
+                reaped += 1
+        return reaped
+
+
+async def _reap_unjoined_connections(connections: ConnectionManager):
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        reaped = await connections.reap_unjoined()
+        if reaped:
+            logger.info("reaped unjoined connections", connections=reaped)
 
 
 async def setup_ws_app(_app):
-    _app["connections"] = []
+    _app["connections"] = ConnectionManager(
+        join_timeout=_app["SETTINGS"].WS_JOIN_TIMEOUT
+    )
+    _app["connection_reaper"] = asyncio.create_task(
+        _reap_unjoined_connections(_app["connections"])
+    )
 
 
 async def cleanup_ws_app(_app):
-    for ws in _app["connections"]:
-        await ws.close()
+    _app["connection_reaper"].cancel()
+    for conn in _app["connections"]:
+        await conn.ws.close()
 
 
-async def setup_ws_request(request):
+async def setup_ws_request(request) -> SocketConnection:
     """Prepare a WebSocket connection - closed if setup failed."""
     ws = web.WebSocketResponse(heartbeat=25)
     conn = SocketConnection(ws=ws)
-    request.app["connections"].append(conn)
+    request.app["connections"].add(conn)
     await conn.ws.prepare(request)
+    conn.writer = asyncio.create_task(write_frames(conn))
 
-    return ws
+    return conn
 
 
-async def cleanup_ws_request(request, player_id):
-    for conn in request.app["connections"]:
-        if conn.player_id == player_id:
-            await conn.ws.close()
-            request.app["connections"].remove(conn)
-            return
+async def cleanup_ws_request(request, conn: SocketConnection):
+    """Stop writing to a WebSocket connection once it has closed.
+
+    Connections of players are removed by the sweep that removes the player.
+    """
+    if conn.writer:
+        conn.writer.cancel()
+    if conn.player_id is None:
+        request.app["connections"].remove(conn)
@@ -1,17 +1,25 @@
-from math import atan2, cos, sin, sqrt
+from math import atan2, cos, sin
 from random import choices
+from typing import List, Optional
 
+import numpy as np
 from structlog import get_logger
 
-from .intersect import lines_intersect, normalize_angle
+from .intersect import lines_intersect, lines_intersect_batch, normalize_angle
 from .player import add_player, kick_player
-from .resources.buffs import BuffType
-from .resources.consumables import ConsumableType
-from .resources.game import GamePlayer, GameState, PlayerStep
+from .resources.body import Coordinates
+from .resources.buffs import BUFF_FLAGS, BuffType
+from .resources.consumables import Consumable, ConsumableType
+from .resources.game import GamePlayer, GameState
 
 logger = get_logger(__name__)
 
 MINIMUM_N_PLAYERS_INCL_BOTS = 4
+# how many times, and by how much, a bot turns to avoid colliding
+COLLISION_AVOIDANCE_ATTEMPTS = 50
+COLLISION_AVOIDANCE_TURN = 0.1
+# from how many pairs of next steps and segments to check for collisions at once
+BATCH_COLLISION_CHECK_PAIRS = 500
 BOT_NAMES_ADJECTIVES = [
     "DOG FIGHT",
     "YUNG",
@@ -61,7 +69,7 @@ BOT_NAMES_NOUNS = [
 def _get_bot_name(game_state: GameState):
     """Get a random name."""
     name = f"{choices(BOT_NAMES_ADJECTIVES)[0]} {choices(BOT_NAMES_NOUNS)[0]}"
-    while any([p for p in game_state.players if p.name == name]):
+    while game_state.players.get_by_name(name):
         name = _get_bot_name(game_state)
 
     return name
@@ -70,13 +78,13 @@ def _get_bot_name(game_state: GameState):
 def spawn_and_boot_bots(game_state: GameState):
     """Create bots."""
 
-    number_bots = len([p for p in game_state.players if p.is_bot])
-    number_real_players = len([p for p in game_state.players if not p.is_bot])
+    number_bots = game_state.players.n_bots
+    number_real_players = game_state.players.n_humans
 
     if len(game_state.players) >= MINIMUM_N_PLAYERS_INCL_BOTS:
         # ensure that there are no bots in the game
         required_n_bots = number_real_players - MINIMUM_N_PLAYERS_INCL_BOTS
-        bots_to_kick = [p for p in game_state.players if p.is_bot][:required_n_bots]
+        bots_to_kick = list(game_state.players.bots())[:required_n_bots]
         for bot in bots_to_kick:
             kick_player(game_state, bot.id)
 
@@ -88,28 +96,65 @@ def spawn_and_boot_bots(game_state: GameState):
 
 
 def _check_step_collisions_with_players(
-    bot: GamePlayer, next_step: PlayerStep, game_state: GameState
+    bot: GamePlayer, next_step: Coordinates, game_state: GameState
 ):
     """Test player collisions."""
     # Collisions with other players
-    if any([b for b in bot.buffs if b.definition.type == BuffType.GHOST]):
+    if bot.buff_flags & BUFF_FLAGS[BuffType.GHOST]:
         return False
 
-    new_step = (bot.steps[-1].coordinates, next_step.coordinates)
-    for other_player in game_state.players:
-        for step1, step2 in zip(other_player.steps[:-1], other_player.steps[1:]):
-            other_step = (step1.coordinates, step2.coordinates)
-            if lines_intersect(*new_step, *other_step):
-                return True
+    new_step = (bot.steps.head, next_step)
+    for _, step1, step2 in game_state.segments.candidates(*new_step):
+        if lines_intersect(*new_step, step1, step2):
+            return True
+
+
+def _calculate_next_step(bot: GamePlayer, new_angle: float) -> Coordinates:
+    x, y = bot.steps.head
+    return (x + bot.step_length * cos(new_angle), y + bot.step_length * sin(new_angle))
+
+
+def _segments_near(bot: GamePlayer, game_state: GameState, reach: float) -> list:
+    """Get the segments whose bounding box is within reach of the head of the bot."""
+    x, y = bot.steps.head
+    segments = []
+    for _, step1, step2 in game_state.segments.candidates(
+        [x - reach, y - reach], [x + reach, y + reach]
+    ):
+        (x1, y1), (x2, y2) = step1, step2
+        if (
+            min(x1, x2) <= x + reach
+            and max(x1, x2) >= x - reach
+            and min(y1, y2) <= y + reach
+            and max(y1, y2) >= y - reach
+        ):
+            segments.append((step1, step2))
+    return segments
+
+
+def _first_non_colliding_angle(
+    bot: GamePlayer, game_state: GameState, angles: List[float]
+) -> Optional[int]:
+    """Find the index of the first angle whose next step doesn't collide.
+
+    The segments that can collide with any of the next steps are found once. When
+    there are many pairs of steps and segments to check, they're checked at once.
+    """
+    head = bot.steps.head
+    ends = [_calculate_next_step(bot, angle) for angle in angles]
+    segments = _segments_near(bot, game_state, bot.step_length + 1)
 
+    if len(segments) * len(angles) < BATCH_COLLISION_CHECK_PAIRS:
+        for i, end in enumerate(ends):
+            if not any(lines_intersect(head, end, *segment) for segment in segments):
+                return i
+        return None
 
-def _calculate_next_step(bot: GamePlayer, new_angle: float):
-    return PlayerStep(
-        coordinates=[
-            bot.steps[-1].coordinates[0] + bot.step_length * cos(new_angle),
-            bot.steps[-1].coordinates[1] + bot.step_length * sin(new_angle),
-        ]
-    )
+    b1, b2 = np.array(segments, dtype=float).transpose(1, 0, 2)
+    ends = np.array(ends, dtype=float)[:, np.newaxis]
+    collides = lines_intersect_batch(head, ends, b1, b2).any(axis=1)
+    free = np.flatnonzero(~collides)
+    return int(free[0]) if len(free) else None
 
 
 def _lock_angle_to_non_colliding_angle(
@@ -125,59 +170,76 @@ def _lock_angle_to_non_colliding_angle(
         return new_angle
 
     # if the bot is colliding with another player, adjust the angle
-    for _ in range(50):
-        new_angle = normalize_angle(new_angle + 0.1)
-        new_step = _calculate_next_step(bot, new_angle)
-        if not _check_step_collisions_with_players(bot, new_step, game_state):
-            return new_angle
+    angles = []
+    for _ in range(COLLISION_AVOIDANCE_ATTEMPTS):
+        new_angle = normalize_angle(new_angle + COLLISION_AVOIDANCE_TURN)
+        angles.append(new_angle)
+
+    index = _first_non_colliding_angle(bot, game_state, angles)
+    if index is not None:
+        return angles[index]
 
     # if the bot is still colliding with another player, commit to colliding
     return new_angle
 
 
+def find_bot_target(bot: GamePlayer, game_state: GameState) -> Optional[Consumable]:
+    """Find the consumable a bot should go for."""
+    # find the closest consumable and create a path to it
+    x, y = bot.steps.head
+    # don't target undesirable consumables, or the ones under a STEP_LENGTH
+    # away (we can't hit them)
+    return game_state.consumables.nearest(
+        x,
+        y,
+        min_distance=bot.step_length,
+        exclude=(ConsumableType.POISON,),
+    )
+
+
+def steer_bot(
+    bot: GamePlayer,
+    game_state: GameState,
+    target: Optional[Consumable],
+    avoid_collisions: bool = True,
+):
+    """Turn a bot towards its target, as far as it can turn in a step."""
+    x, y = bot.steps.head
+    closest_consumable_angle = None
+    if target:
+        closest_consumable_angle = atan2(
+            target.coordinates[1] - y,
+            target.coordinates[0] - x,
+        )
+
+    new_angle = closest_consumable_angle or 0.0
+    previous_step_angle = bot.angle
+    normalized_angle = normalize_angle(new_angle - previous_step_angle)
+
+    if normalized_angle > bot.step_fov:
+        new_angle = previous_step_angle + bot.step_fov
+    elif normalized_angle < -bot.step_fov:
+        new_angle = previous_step_angle - bot.step_fov
+
+    if avoid_collisions:
+        new_angle = _lock_angle_to_non_colliding_angle(bot, game_state, new_angle)
+
+    bot.angle = new_angle
+
+
+def plan_bot_step(bot: GamePlayer, game_state: GameState) -> Optional[Consumable]:
+    """Choose a target for a bot and the angle of its next step, returning the target.
+
+    The segments of the game state have to be in sync with the players.
+    """
+    target = find_bot_target(bot, game_state)
+    steer_bot(bot, game_state, target)
+    return target
+
+
 def choose_bot_step_angles(game_state: GameState):
     """Choose the next steps for all bots."""
-    for player in game_state.players:
-        if not player.is_bot:
-            continue
-
+    game_state.segments.sync_players(game_state.players)
+    for player in game_state.players.bots():
         # set the next step for the bot
-
-        # find the closest consumable and create a path to it
-        closest_consumable = None
-        closest_consumable_distance = None
-        closest_consumable_angle = None
-
-        for consumable in game_state.consumables:
-            # don't target undesirable consumables
-            if consumable.type == ConsumableType.POISON:
-                continue
-            distance = sqrt(
-                (player.steps[-1].coordinates[0] - consumable.coordinates[0]) ** 2
-                + (player.steps[-1].coordinates[1] - consumable.coordinates[1]) ** 2
-            )
-
-            # if the consumable is under a STEP_LENGTH away (and we can't hit it), ignore it
-            if (distance + consumable.size) < player.step_length:
-                continue
-
-            if not closest_consumable or distance < closest_consumable_distance:
-                closest_consumable = consumable
-                closest_consumable_distance = distance
-                closest_consumable_angle = atan2(
-                    consumable.coordinates[1] - player.steps[-1].coordinates[1],
-                    consumable.coordinates[0] - player.steps[-1].coordinates[0],
-                )
-
-        new_angle = closest_consumable_angle or 0.0
-        previous_step_angle = player.angle
-        normalized_angle = normalize_angle(new_angle - previous_step_angle)
-
-        if normalized_angle > player.step_fov:
-            new_angle = previous_step_angle + player.step_fov
-        elif normalized_angle < -player.step_fov:
-            new_angle = previous_step_angle - player.step_fov
-
-        new_angle = _lock_angle_to_non_colliding_angle(player, game_state, new_angle)
-
-        player.angle = new_angle
+        plan_bot_step(player, game_state)
@@ -1,60 +1,73 @@
-from ..resources.buffs import BuffApplicationFrequency, BuffApplicationTime
-from .effects import BUFF_APPLY_MAP, BUFF_UNAPPLY_MAP
+from ..resources.buffs import BuffApplicationTime, buff_flags
+from .effects import BUFF_APPLY_MAP, BUFF_UNAPPLY_MAP, MAGNET_BUFFS, move_apples
 
 
-def decay_buffs(game_state, application_time: BuffApplicationTime):
-    """Decay buffs."""
+def _in_room(game_state, entry) -> bool:
+    """Test if the holder of a scheduled buff is still in the room."""
+    return entry.player is None or game_state.players.get(entry.player.id) is (
+        entry.player
+    )
 
-    for player in game_state.players:
-        for buff in player.buffs:
-            if buff.definition.application_time != application_time:
-                continue
 
-            buff.duration_remaining -= 1
+def _by_holder(game_state, entries: list) -> list:
+    """Sort scheduled buffs in the order of the players, with the global buffs last.
 
-            # unapply buff if duration is over
-            if buff.duration_remaining < 0:
-                BUFF_UNAPPLY_MAP[buff.type](game_state, player)
-        player.buffs = [b for b in player.buffs if b.duration_remaining >= 0]
+    Buffs of players that left the room are dropped.
+    """
+    entries = [entry for entry in entries if _in_room(game_state, entry)]
+    if len(entries) < 2:
+        return entries
+    positions = {player.id: i for i, player in enumerate(game_state.players)}
+    return sorted(
+        entries,
+        key=lambda entry: (
+            positions[entry.player.id] if entry.player else len(positions),
+            entry.order,
+        ),
+    )
 
-    for buff in game_state.global_buffs:
-        if buff.definition.application_time != application_time:
-            continue
-
-        buff.duration_remaining -= 1
 
-        # unapply buff if duration is over
-        if buff.duration_remaining < 0:
-            BUFF_UNAPPLY_MAP[buff.type](game_state, None)
+def decay_buffs(game_state, expired: list):
+    """Unapply and remove expired buffs."""
 
-    # remove expired buffs
-    game_state.global_buffs = [
-        b for b in game_state.global_buffs if b.duration_remaining >= 0
-    ]
+    for entry in _by_holder(game_state, expired):
+        BUFF_UNAPPLY_MAP[entry.definition.type](game_state, entry.player)
+        if entry.player:
+            entry.player.buffs = [b for b in entry.player.buffs if b is not entry.buff]
+            entry.player.buff_flags = buff_flags(entry.player.buffs)
+        else:
+            game_state.global_buffs = [
+                b for b in game_state.global_buffs if b is not entry.buff
+            ]
 
 
 def apply_and_decay_buffs(game_state, application_time: BuffApplicationTime):
-    """Apply and decay buffs."""
-
-    decay_buffs(game_state, application_time)
-
-    for player in game_state.players:
-        for buff in player.buffs:
-            if (
-                buff.definition.application_frequency == BuffApplicationFrequency.ONCE
-                and buff.is_applied
-            ):
-                continue
-            if buff.definition.application_time == application_time:
-                BUFF_APPLY_MAP[buff.type](game_state, player)
-                buff.is_applied = True
-
-    for buff in game_state.global_buffs:
-        if (
-            buff.definition.application_frequency == BuffApplicationFrequency.ONCE
-            and buff.is_applied
-        ):
+    """Apply and decay buffs.
+
+    Only the buffs of the application time that expire or are due to apply are
+    visited, see BuffSchedule.
+    """
+
+    expired, due = game_state.buff_schedule.start_pass(application_time)
+    decay_buffs(game_state, expired)
+
+    magnets = []
+    global_buffs = []
+    for entry in _by_holder(game_state, due):
+        buff_type = entry.definition.type
+        if entry.player is None:
+            global_buffs.append(entry)
             continue
-        if buff.definition.application_time == application_time:
-            BUFF_APPLY_MAP[buff.type](game_state, None)
-            buff.is_applied = True
+        if buff_type in MAGNET_BUFFS:
+            magnets.append((entry.player, MAGNET_BUFFS[buff_type]))
+        else:
+            BUFF_APPLY_MAP[buff_type](game_state, entry.player)
+        entry.buff.is_applied = True
+
+    # the apples are moved for all the players holding magnets at once
+    if magnets:
+        move_apples(game_state, magnets)
+
+    for entry in global_buffs:
+        BUFF_APPLY_MAP[entry.definition.type](game_state, None)
+        entry.buff.is_applied = True
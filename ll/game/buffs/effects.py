@@ -1,37 +1,57 @@
-import math
 from functools import partial
+from typing import List, Tuple
+
+import numpy as np
 
 from ll.game.resources.buffs import BuffType
 from ll.game.resources.consumables import ConsumableType
 from ll.game.resources.game import GamePlayer, GameState
 
 
-def attract_apples(game_state: GameState, player: GamePlayer, repel: bool):
-    """Apple magnet effect.
+def move_apples(game_state: GameState, magnets: List[Tuple[GamePlayer, bool]]):
+    """Apple magnet effect, for all the (player, repel) holders of magnets at once.
 
-    Move all apples closer to the player, stopping at the player if they are close enough
+    Move the apples within the magnet radius of each player closer to it, stopping at
+    the player if they are close enough, or away from it when repelling. The players
+    pull the apples one after the other, in a single pass over the apples near them.
     """
 
     DISTANCE = 15
-    for c in game_state.consumables:
-        if c.type == ConsumableType.APPLE:
-            dx = player.steps[-1].coordinates[0] - c.coordinates[0]
-            dy = player.steps[-1].coordinates[1] - c.coordinates[1]
-            dist = math.sqrt(dx**2 + dy**2)
-            if dist < DISTANCE:
-                c.coordinates = player.steps[-1].coordinates
-            else:
-                c.coordinates = (
-                    [
-                        c.coordinates[0] + dx / dist * DISTANCE,
-                        c.coordinates[1] + dy / dist * DISTANCE,
-                    ]
-                    if not repel
-                    else [
-                        c.coordinates[0] - dx / dist * DISTANCE,
-                        c.coordinates[1] - dy / dist * DISTANCE,
-                    ]
-                )
+    consumables = game_state.consumables
+    radius = game_state.magnet_radius
+
+    apples = {}
+    for player, _ in magnets:
+        x, y = player.steps.head
+        for c, _ in consumables.near(x, y, radius):
+            if c.type == ConsumableType.APPLE:
+                apples[c.uid] = c
+    if not apples:
+        return
+
+    apples = list(apples.values())
+    coordinates = np.array([c.coordinates for c in apples], dtype=float)
+    moved = np.zeros(len(apples), dtype=bool)
+    for player, repel in magnets:
+        head = np.array(player.steps.head, dtype=float)
+        delta = head - coordinates
+        dist = np.sqrt(delta[:, 0] ** 2 + delta[:, 1] ** 2)
+        in_reach = dist <= radius
+        at_player = in_reach & (dist < DISTANCE)
+        pulled = in_reach & ~at_player
+
+        step = delta[pulled] / dist[pulled, np.newaxis] * DISTANCE
+        coordinates[pulled] += -step if repel else step
+        coordinates[at_player] = head
+        moved |= in_reach
+
+    for i in np.flatnonzero(moved):
+        consumables.move(apples[i], coordinates[i].tolist())
+
+
+def attract_apples(game_state: GameState, player: GamePlayer, repel: bool):
+    """Apple magnet effect, for a single player."""
+    move_apples(game_state, [(player, repel)])
 
 
 def tick_period_boost(game_state: GameState, player: GamePlayer, boost: float):
@@ -54,6 +74,12 @@ BUFF_APPLY_MAP = {
     BuffType.GHOST: noop,
 }
 
+# buffs applied to all their holders at once, with whether they repel apples
+MAGNET_BUFFS = {
+    BuffType.APPLE_MAGNET: False,
+    BuffType.APPLE_REPEL: True,
+}
+
 BUFF_UNAPPLY_MAP = {
     BuffType.APPLE_MAGNET: noop,
     BuffType.APPLE_REPEL: noop,
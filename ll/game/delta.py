@@ -0,0 +1,182 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from ..api.messages.binary import encode_message
+from ..api.messages.resources import (
+    MessageType,
+    MessageWrapper,
+    PlayerDelta,
+    StateDelta,
+)
+from ..api.ws import WireEncoding
+from .resources.body import SnakeBody
+from .resources.game import GamePlayer, GameState
+
+# number of past snapshots kept per room that deltas can be computed against
+SNAPSHOT_HISTORY_SIZE = 32
+# ticks between the keyframes (full state updates) sent to delta clients
+KEYFRAME_INTERVAL = 100
+
+
+class RoomSnapshot:
+    """Compact, immutable copy of the parts of a room that deltas are computed on."""
+
+    def __init__(self, game_state: GameState):
+        self.tick = game_state.tick
+        self.players: Dict[str, Tuple[tuple, tuple]] = {
+            p.id: (
+                tuple(p.steps),
+                _player_fields(p),
+            )
+            for p in game_state.players
+        }
+        self.consumables: Dict[str, tuple] = {
+            c.uid: (c.type, tuple(c.coordinates), c.size, tuple(c.color))
+            for c in game_state.consumables
+        }
+
+
+def _player_fields(player: GamePlayer) -> tuple:
+    return (
+        player.name,
+        tuple(player.color),
+        player.step_length,
+        player.spawned,
+        player.step_fov,
+        player.is_bot,
+        player.angle,
+        tuple((b.type, b.duration_remaining, b.is_applied) for b in player.buffs),
+    )
+
+
+class SnapshotHistory:
+    """The last snapshots of a room, by tick."""
+
+    def __init__(self, size: int = SNAPSHOT_HISTORY_SIZE):
+        self.size = size
+        self._snapshots: Dict[int, RoomSnapshot] = OrderedDict()
+
+    def record(self, game_state: GameState) -> RoomSnapshot:
+        """Take a snapshot of the current tick, once per tick."""
+        snapshot = self._snapshots.get(game_state.tick)
+        if snapshot is None:
+            snapshot = RoomSnapshot(game_state)
+            self._snapshots[game_state.tick] = snapshot
+            if len(self._snapshots) > self.size:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def get(self, tick: Optional[int]) -> Optional[RoomSnapshot]:
+        if tick is None:
+            return None
+        return self._snapshots.get(tick)
+
+
+def choose_base_tick(conn, tick: int, history: SnapshotHistory) -> Optional[int]:
+    """Pick the tick to send a connection a delta against.
+
+    Returns None when the connection should get a keyframe instead, i.e. it doesn't
+    use deltas, hasn't acknowledged a tick we still have, or is due a keyframe.
+    """
+    if not conn.options.delta_updates:
+        return None
+    if conn.keyframe_tick is None or tick - conn.keyframe_tick >= KEYFRAME_INTERVAL:
+        return None
+    if conn.ack_tick is None or conn.ack_tick >= tick or not history.get(conn.ack_tick):
+        return None
+    return conn.ack_tick
+
+
+def _diff_steps(base_steps: tuple, steps: tuple) -> int:
+    """Count the steps removed from the start of the base steps.
+
+    The remaining base steps are the start of the current steps.
+    """
+    for removed in range(len(base_steps)):
+        kept = len(base_steps) - removed
+        if base_steps[removed:] == steps[:kept]:
+            return removed
+    return len(base_steps)
+
+
+def format_gamestate_ws_delta(
+    game_state: GameState,
+    base: RoomSnapshot,
+    current: RoomSnapshot,
+    base_view=None,
+    view=None,
+    encoding: WireEncoding = WireEncoding.JSON,
+):
+    """Encode the changes to a room since the base snapshot into a single frame.
+
+    With views, the changes are between the entities in the view of the client at the
+    base tick and the ones in its view now.
+    """
+    base_players = base.players
+    base_consumables = base.consumables
+    players = list(game_state.players)
+    consumables = list(game_state.consumables)
+    if view is not None:
+        base_players = {
+            k: v for k, v in base_players.items() if k in base_view.player_ids
+        }
+        base_consumables = {
+            k: v for k, v in base_consumables.items() if k in base_view.consumable_uids
+        }
+        players = view.players
+        consumables = view.consumables
+
+    player_ids = {p.id for p in players}
+    consumable_uids = {c.uid for c in consumables}
+
+    players_updated = []
+    for player in players:
+        steps, fields = current.players[player.id]
+        base_steps, base_fields = base_players.get(player.id, ((), None))
+        if steps == base_steps and fields == base_fields:
+            continue
+
+        removed_steps = _diff_steps(base_steps, steps)
+        kept_steps = len(base_steps) - removed_steps
+        players_updated.append(
+            PlayerDelta(
+                id=player.id,
+                name=player.name,
+                color=player.color,
+                removed_steps=removed_steps,
+                added_steps=SnakeBody(player.steps[kept_steps:]),
+                step_length=player.step_length,
+                buffs=player.buffs,
+                spawned=player.spawned,
+                step_fov=player.step_fov,
+                is_bot=player.is_bot,
+                angle=player.angle,
+            )
+        )
+
+    message = MessageWrapper(
+        type=MessageType.STATE_DELTA,
+        payload=StateDelta(
+            tick=game_state.tick,
+            base_tick=base.tick,
+            tick_period=game_state.tick_period,
+            server_timestamp=game_state.server_timestamp,
+            server_next_tick_time=game_state.server_next_tick_time,
+            players_updated=players_updated,
+            players_removed=[p for p in base_players if p not in player_ids],
+            consumables_updated=[
+                c
+                for c in consumables
+                if base_consumables.get(c.uid) != current.consumables[c.uid]
+            ],
+            consumables_removed=[
+                uid for uid in base_consumables if uid not in consumable_uids
+            ],
+            global_buffs=game_state.global_buffs,
+            map_bounds=game_state.map_bounds,
+        ),
+    )
+
+    if encoding == WireEncoding.BINARY:
+        return encode_message(message)
+    return message.json()
@@ -0,0 +1,145 @@
+import dataclasses
+import math
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from .delta import SNAPSHOT_HISTORY_SIZE
+from .resources.consumables import Consumable
+from .resources.game import GamePlayer, GameState
+
+
+@dataclasses.dataclass(frozen=True)
+class View:
+    """The players and consumables in the view of a client at a tick."""
+
+    player_ids: FrozenSet[str]
+    consumable_uids: FrozenSet[str]
+    # the entities themselves in room order, to encode the view at its tick
+    players: Tuple[GamePlayer, ...] = dataclasses.field(default=(), compare=False)
+    consumables: Tuple[Consumable, ...] = dataclasses.field(default=(), compare=False)
+
+
+class InterestGrid:
+    """Index of a room at a tick, to find the entities near a point.
+
+    The coordinates of the consumables are copied from the array their store keeps,
+    so their distances from a point are computed at once for each view, and players
+    are tested against the bounding box of their steps. Entities are given by their
+    index in the room, the ones in a view's margin apart from the others, as only
+    those have to be looked up in the previous view.
+    """
+
+    def __init__(self, game_state: GameState):
+        self.players = list(game_state.players)
+        self.consumables = list(game_state.consumables)
+        self.player_ids = [p.id for p in self.players]
+        self.consumable_uids = [c.uid for c in self.consumables]
+
+        self._player_bounds = []
+        for player in self.players:
+            xs, ys = zip(*player.steps)
+            self._player_bounds.append((min(xs), min(ys), max(xs), max(ys)))
+        coordinates = game_state.consumables.coordinates()
+        self._consumable_xs = coordinates[:, 0].copy()
+        self._consumable_ys = coordinates[:, 1].copy()
+
+    def consumables_near(
+        self, x: float, y: float, radius: float, leave_radius: float
+    ) -> Tuple[List[int], List[int]]:
+        """Get the consumables within a radius of a point, by index.
+
+        The consumables beyond the radius but within the leave radius are given apart.
+        """
+        distances = np.hypot(self._consumable_xs - x, self._consumable_ys - y)
+        return _split(distances, radius, leave_radius)
+
+    def players_near(
+        self, x: float, y: float, radius: float, leave_radius: float
+    ) -> Tuple[List[int], List[int]]:
+        """Get the players whose steps' bounding box is within a radius of a point.
+
+        The players are given by index, and the ones beyond the radius but within the
+        leave radius apart.
+        """
+        inside, edge = [], []
+        for i, (min_x, min_y, max_x, max_y) in enumerate(self._player_bounds):
+            dx = max(min_x - x, 0, x - max_x)
+            dy = max(min_y - y, 0, y - max_y)
+            distance = math.hypot(dx, dy)
+            if distance <= radius:
+                inside.append(i)
+            elif distance <= leave_radius:
+                edge.append(i)
+        return inside, edge
+
+
+def _split(
+    distances: np.ndarray, radius: float, leave_radius: float
+) -> Tuple[List[int], List[int]]:
+    """Get the indices of the distances within a radius, and within the leave radius."""
+    inside = distances <= radius
+    edge = (distances <= leave_radius) & ~inside
+    return np.flatnonzero(inside).tolist(), np.flatnonzero(edge).tolist()
+
+
+class PlayerInterest:
+    """Track the entities in the view of a player's client.
+
+    Entities enter the view within `radius` of the player's head, and only leave it
+    beyond `radius * (1 + hysteresis)`, so they don't flicker at the edge of the view.
+    The views sent at recent ticks are kept as the bases of state deltas.
+    """
+
+    def __init__(self, radius: float, hysteresis: float):
+        self.radius = radius
+        self.leave_radius = radius * (1 + hysteresis)
+        self.view: Optional[View] = None
+        self._views: Dict[int, View] = OrderedDict()
+
+    @staticmethod
+    def _in_view(
+        near: Tuple[List[int], List[int]], ids: List[str], previous: FrozenSet[str]
+    ) -> List[int]:
+        """Get the indices of the entities near the player that are in its view."""
+        inside, edge = near
+        kept = [i for i in edge if ids[i] in previous]
+        if not kept:
+            return inside
+        return sorted(inside + kept)
+
+    def update(self, tick: int, grid: InterestGrid, head: List[float]) -> View:
+        """Compute the view of the player at a tick."""
+        previous = self.view or View(
+            player_ids=frozenset(), consumable_uids=frozenset()
+        )
+        x, y = head
+
+        players = self._in_view(
+            grid.players_near(x, y, self.radius, self.leave_radius),
+            grid.player_ids,
+            previous.player_ids,
+        )
+        consumables = self._in_view(
+            grid.consumables_near(x, y, self.radius, self.leave_radius),
+            grid.consumable_uids,
+            previous.consumable_uids,
+        )
+        self.view = View(
+            player_ids=frozenset([grid.player_ids[i] for i in players]),
+            consumable_uids=frozenset([grid.consumable_uids[i] for i in consumables]),
+            players=tuple([grid.players[i] for i in players]),
+            consumables=tuple([grid.consumables[i] for i in consumables]),
+        )
+
+        self._views[tick] = self.view
+        if len(self._views) > SNAPSHOT_HISTORY_SIZE:
+            self._views.popitem(last=False)
+        return self.view
+
+    def get(self, tick: Optional[int]) -> Optional[View]:
+        """Get the view of the player at a recent tick."""
+        if tick is None:
+            return None
+        return self._views.get(tick)
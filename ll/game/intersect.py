@@ -1,6 +1,9 @@
+from functools import lru_cache
 from math import pi, sqrt
 from typing import List, Tuple
 
+import numpy as np
+
 EPS = 0.000001
 
 # If we're within this distance of a circle, we're inside it
@@ -73,3 +76,108 @@ def _overlap_intervals(ub1: float, ub2: float) -> List[float]:
         return [A]
     else:
         return [A, B]
+
+
+def lines_intersect_batch(a1, a2, b1, b2) -> np.ndarray:
+    """Check if line segments intersect, for arrays of segments.
+
+    Takes arrays of points of shape (..., 2) that broadcast together, and returns a
+    boolean mask that matches `lines_intersect` for each pair of segments, including
+    the parallel and collinear cases. Zero length segments never intersect.
+    """
+    a1, a2, b1, b2 = (np.asarray(p, dtype=float) for p in (a1, a2, b1, b2))
+    a1x, a1y = a1[..., 0], a1[..., 1]
+    b1x, b1y = b1[..., 0], b1[..., 1]
+    dax, day = a2[..., 0] - a1x, a2[..., 1] - a1y
+    dbx, dby = b2[..., 0] - b1x, b2[..., 1] - b1y
+    ox, oy = a1x - b1x, a1y - b1y
+
+    denom = (dax * dby) - (day * dbx)
+    num1 = (oy * dbx) - (ox * dby)
+    num2 = (oy * dax) - (ox * day)
+    parallel = np.abs(denom) < EPS
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # infinite lines intersect somewhere
+        r = num1 / denom
+        s = num2 / denom
+    intersect = (r > 0) & (r < 1) & (s > 0) & (s < 1)
+    if not parallel.any():
+        return intersect
+
+    intersect[parallel] = False
+    # parallel or same line, only the collinear pairs can overlap
+    collinear = parallel & ((np.abs(num1) < EPS) | (np.abs(num2) < EPS))
+    collinear &= (dax != 0) | (day != 0)
+    i = np.nonzero(collinear)
+    if not len(i[0]):
+        return intersect
+
+    def pick(values):
+        return np.broadcast_to(values, collinear.shape)[i]
+
+    dax, day = pick(dax), pick(day)
+    ub1x, ub1y = -pick(ox), -pick(oy)
+    ub2x, ub2y = pick(b2[..., 0] - a1x), pick(b2[..., 1] - a1y)
+    # project b onto a along its longest axis
+    along_x = np.abs(dax) > np.abs(day)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ub1 = np.where(along_x, ub1x / dax, ub1y / day)
+        ub2 = np.where(along_x, ub2x / dax, ub2y / day)
+    intersect[i] = np.maximum(0, np.minimum(ub1, ub2)) < np.minimum(
+        1, np.maximum(ub1, ub2)
+    )
+    return intersect
+
+
+def point_inside_circle_batch(points, centers, radii) -> np.ndarray:
+    """Check if points are inside circles, for arrays of points and circles.
+
+    Points and centers are arrays of shape (n, 2) or (2,), and radii of shape (n,) or
+    a scalar. Returns a boolean mask that matches `point_inside_circle`.
+    """
+    points = np.asarray(points, dtype=float)
+    centers = np.asarray(centers, dtype=float)
+    distance = np.sqrt(
+        (points[..., 0] - centers[..., 0]) ** 2
+        + (points[..., 1] - centers[..., 1]) ** 2
+    )
+    return distance <= np.asarray(radii, dtype=float) + CIRCLE_COLLISION_TOLERANCE
+
+
+@lru_cache(maxsize=16)
+def _map_bound_edges(map_bounds: Tuple[Tuple[float, float], ...]) -> tuple:
+    (min_x, min_y), (max_x, max_y) = map_bounds
+    return (
+        ((min_x, min_y), (min_x, max_y)),
+        ((max_x, min_y), (max_x, max_y)),
+        ((min_x, max_y), (max_x, max_y)),
+        ((min_x, min_y), (max_x, min_y)),
+    )
+
+
+@lru_cache(maxsize=16)
+def _map_bound_arrays(map_bounds: Tuple[Tuple[float, float], ...]) -> tuple:
+    edges = np.array(_map_bound_edges(map_bounds), dtype=float)
+    return edges[:, 0], edges[:, 1]
+
+
+def map_bound_edges(map_bounds: List[List[float]]) -> tuple:
+    """Get the (start, end) points of the four edges of the map, built once."""
+    return _map_bound_edges(tuple(tuple(bound) for bound in map_bounds))
+
+
+def segments_cross_map_bounds(
+    starts, ends, map_bounds: List[List[float]]
+) -> np.ndarray:
+    """Check which segments cross an edge of the map.
+
+    Takes the start and end points of the segments as arrays of shape (n, 2), and
+    matches testing each edge with `lines_intersect(edge_start, edge_end, start, end)`.
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 1, 2)
+    bound_starts, bound_ends = _map_bound_arrays(
+        tuple(tuple(bound) for bound in map_bounds)
+    )
+    return lines_intersect_batch(bound_starts, bound_ends, starts, ends).any(axis=1)
@@ -1,126 +1,206 @@
-import asyncio
-import json
 from datetime import datetime, timedelta
 from random import randint, random
 
 from structlog import get_logger
 
-from ..api.messages.resources import MessageType, MessageWrapper, StateUpdate
-from .bot import choose_bot_step_angles, spawn_and_boot_bots
+from ..api.messages.binary import encode_state_update
+from ..api.messages.state_json import encode_state_update_json
+from ..api.ws import WireEncoding
+from .bot import spawn_and_boot_bots
 from .buffs import BuffApplicationTime, apply_and_decay_buffs
+from .delta import SnapshotHistory, choose_base_tick, format_gamestate_ws_delta
+from .interest import InterestGrid, PlayerInterest, View
+from .planner import BotPlanner
 from .player import take_player_steps
 from .resources.consumables import CONSUMABLE_DEFINITIONS, Consumable
 from .resources.game import MIN_CONSUMABLE_COUNT, GameState
+from .scheduler import TickScheduler
 
 logger = get_logger(__name__)
 
 
-def format_gamestate_ws_update(game_state: GameState):
-    message = MessageWrapper(
-        type=MessageType.STATE_UPDATE,
-        payload=StateUpdate(
-            tick=game_state.tick,
-            tick_period=game_state.tick_period,
-            server_timestamp=game_state.server_timestamp,
-            server_next_tick_time=game_state.server_next_tick_time,
-            players=game_state.players,
-            consumables=game_state.consumables,
-            global_buffs=game_state.global_buffs,
-            map_bounds=game_state.map_bounds,
-        ),
-    )
-
-    return json.loads(message.json())
-
-
-def get_connection_by_player_id(app, player_id: str):
-    for conn in app["connections"]:
-        if conn.player_id == player_id:
-            return conn
-
-
-async def publish_state_to_connected_players(app, game_state):
-    game_state_msg = format_gamestate_ws_update(game_state)
+def format_gamestate_ws_update(
+    game_state: GameState,
+    view: View = None,
+    encoding: WireEncoding = WireEncoding.JSON,
+    texts: dict = None,
+):
+    """Encode the state update of a room into a single frame.
+
+    Without a view the frame has the whole room and can be shared by all players.
+    The JSON frames of a tick that share `texts` encode the parts they have in common
+    once.
+    """
+    if view is None:
+        players = list(game_state.players)
+        consumables = list(game_state.consumables)
+    else:
+        players = view.players
+        consumables = view.consumables
+
+    if encoding == WireEncoding.BINARY:
+        return encode_state_update(game_state, players, consumables)
+
+    return encode_state_update_json(game_state, players, consumables, texts)
+
+
+def publish_state_to_connected_players(
+    app, game_state: GameState, history: SnapshotHistory
+):
+    """Queue the state update on the connection of each player in the room.
+
+    Clients using deltas get the changes since the last tick they acknowledged, and
+    with an interest radius configured each client only gets the entities near its
+    player. Each distinct frame is encoded once and shared by the connections it is
+    queued on, and the connections' writer tasks send it, so this never waits on a
+    socket.
+    """
+    settings = app["SETTINGS"]
+    connections = app["connections"]
+    grid = None
+    frames = {}
+    texts = {}
+    snapshot = None
     for player in game_state.players:
-        conn = get_connection_by_player_id(app, player.id)
-        if conn and not conn.ws.closed:
-            await conn.ws.send_json(game_state_msg)
+        conn = connections.get_by_player_id(player.id)
+        if not conn or conn.ws.closed:
+            continue
+
+        if conn.options.delta_updates and snapshot is None:
+            snapshot = history.record(game_state)
+
+        base_tick = choose_base_tick(conn, game_state.tick, history)
+        view = base_view = None
+        if settings.INTEREST_RADIUS:
+            if grid is None:
+                grid = InterestGrid(game_state)
+            if conn.interest is None:
+                conn.interest = PlayerInterest(
+                    settings.INTEREST_RADIUS, settings.INTEREST_HYSTERESIS
+                )
+            view = conn.interest.update(game_state.tick, grid, player.steps.head)
+            base_view = conn.interest.get(base_tick)
+            if base_view is None:
+                base_tick = None
+
+        if base_tick is None:
+            conn.keyframe_tick = game_state.tick
+        encoding = conn.options.encoding
+        # a delta is computed from the view at the base tick as well as the current one
+        key = (base_tick, base_view, view, encoding)
+        if key not in frames:
+            frames[key] = (
+                format_gamestate_ws_update(game_state, view, encoding, texts)
+                if base_tick is None
+                else format_gamestate_ws_delta(
+                    game_state,
+                    history.get(base_tick),
+                    snapshot,
+                    base_view,
+                    view,
+                    encoding,
+                )
+            )
+
+        conn.send(frames[key])
 
 
 def spawn_consumables(game_state: GameState):
     """Ensure there are enough consumables spawned."""
+    consumables = game_state.consumables
+    (min_x, min_y), (max_x, max_y) = [
+        [int(c) for c in bound] for bound in game_state.map_bounds
+    ]
 
     for consumable in CONSUMABLE_DEFINITIONS:
         expected_spawn_count = int(consumable.spawn_ratio * MIN_CONSUMABLE_COUNT)
-        actual_spawn_count = len(
-            [c for c in game_state.consumables if c.type == consumable.type]
-        )
-        diff = expected_spawn_count - actual_spawn_count
-
-        for _ in range(diff):
-            size_multiplier = (
-                random()
-                * (
-                    consumable.size_multiplier_range[1]
-                    - consumable.size_multiplier_range[0]
-                )
-                + consumable.size_multiplier_range[0]
+        diff = expected_spawn_count - consumables.count(consumable.type)
+        if diff <= 0:
+            continue
+
+        low, high = consumable.size_multiplier_range
+        # size multiplier and position of each new consumable, in the order the
+        # random numbers have always been drawn in
+        draws = [
+            (
+                random() * (high - low) + low,
+                randint(min_x, max_x),
+                randint(min_y, max_y),
             )
-
-            game_state.consumables.append(
-                Consumable(
-                    coordinates=[
-                        randint(
-                            game_state.map_bounds[0][0], game_state.map_bounds[1][0]
-                        ),
-                        randint(
-                            game_state.map_bounds[0][1], game_state.map_bounds[1][1]
-                        ),
-                    ],
-                    type=consumable.type,
-                    size=int(consumable.size * size_multiplier),
-                    color=consumable.color,
-                )
+            for _ in range(diff)
+        ]
+        consumables.extend(
+            Consumable(
+                coordinates=[x, y],
+                type=consumable.type,
+                size=int(consumable.size * size_multiplier),
+                color=consumable.color,
+                uid=consumables.next_uid(),
             )
+            for size_multiplier, x, y in draws
+        )
 
 
 def remove_disconnected_or_disconnecting_players(app, game_state: GameState):
-    """Remove players that are disconnected or disconnecting."""
-    for conn in app["connections"]:
-        if conn.ws.closed:
-            player = next(
-                (p for p in game_state.players if p.id == conn.player_id),
-                None,
-            )
-            if player:
-                logger.info("player disconnected", player_id=player.id)
-                game_state.players.remove(player)
-            app["connections"].remove(conn)
+    """Remove players of this room that are disconnected or disconnecting."""
+    connections = app["connections"]
+    for player in list(game_state.players):
+        conn = connections.get_by_player_id(player.id)
+        if not conn or not conn.ws.closed:
+            continue
+
+        logger.info(
+            "player disconnected",
+            player_id=player.id,
+            dropped_snapshots=conn.dropped_snapshots,
+        )
+        game_state.players.remove(player.id)
+        app["rooms"].leave(player.id)
+        connections.remove(conn)
 
 
-async def game_loop(app):
-    logger.info("Starting game loop")
+async def game_loop(
+    app, game_state: GameState, scheduler: TickScheduler, planner: BotPlanner
+):
+    """Run the game loop of a single room."""
+    logger.info("Starting game loop", room_id=game_state.id)
+    history = SnapshotHistory()
     while True:
-        game_state: GameState = app["game_states"][1]
-        await asyncio.sleep(game_state.tick_period)
+        lateness = await scheduler.wait_for_tick(game_state.tick_period)
         remove_disconnected_or_disconnecting_players(app, game_state)
+        if app["rooms"].should_close_room(game_state):
+            app["rooms"].close_room(game_state.id)
+            return
+
         spawn_and_boot_bots(game_state)
 
         # log the active players
-        logger.info("active players", player_names=[p.name for p in game_state.players])
+        logger.info(
+            "active players",
+            room_id=game_state.id,
+            player_names=[p.name for p in game_state.players],
+            tick_lateness=lateness,
+            tick_overruns=scheduler.stats.overruns,
+            bot_planning_time=planner.stats.last_planning_time,
+            bot_planning_backlog=planner.stats.backlog,
+            bot_planning_missed_deadlines=planner.stats.missed_deadlines,
+        )
 
         # update the game state
         game_state.tick += 1
         game_state.server_timestamp = datetime.now()
 
         apply_and_decay_buffs(game_state, BuffApplicationTime.PRE_STEP)
-        choose_bot_step_angles(game_state)
+        planner.plan(game_state)
         take_player_steps(game_state)
         spawn_consumables(game_state)
         apply_and_decay_buffs(game_state, BuffApplicationTime.POST_STEP)
 
-        # add the tick period to the server timestamp in seconds
+        # schedule the next tick with the (possibly boosted) tick period, and convert
+        # its deadline on the loop clock into wall clock time for the clients
+        scheduler.schedule_next(game_state.tick_period)
         game_state.server_next_tick_time = datetime.now() + timedelta(
-            seconds=game_state.tick_period
+            seconds=max(scheduler.seconds_until_deadline(), 0.0)
         )
-        await publish_state_to_connected_players(app, game_state)
+        publish_state_to_connected_players(app, game_state, history)
+        planner.plan_ahead(game_state)
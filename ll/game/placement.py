@@ -0,0 +1,43 @@
+import dataclasses
+import itertools
+from enum import Enum
+from typing import List
+
+from .rooms import RoomsLoad
+
+
+@dataclasses.dataclass
+class WorkerLoad:
+    """The last load reported by a room worker process."""
+
+    worker_id: int
+    load: RoomsLoad
+    alive: bool = True
+
+
+class LeastLoadedPlacement:
+    """Place joining players on the worker with the fewest human players."""
+
+    def choose_worker(self, workers: List[WorkerLoad]) -> WorkerLoad:
+        return min(workers, key=lambda w: (w.load.humans, w.load.tick_lateness))
+
+
+class RoundRobinPlacement:
+    """Place joining players on each worker in turn."""
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose_worker(self, workers: List[WorkerLoad]) -> WorkerLoad:
+        return workers[next(self._counter) % len(workers)]
+
+
+class PlacementPolicy(Enum):
+    LEAST_LOADED = "least_loaded"
+    ROUND_ROBIN = "round_robin"
+
+
+PLACEMENT_POLICY_MAP = {
+    PlacementPolicy.LEAST_LOADED: LeastLoadedPlacement,
+    PlacementPolicy.ROUND_ROBIN: RoundRobinPlacement,
+}
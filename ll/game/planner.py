@@ -0,0 +1,250 @@
+import copy
+import dataclasses
+import math
+import time
+from concurrent.futures import Executor, Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .bot import plan_bot_step, steer_bot
+from .resources.consumables import Consumable, ConsumableStore
+from .resources.game import SEGMENT_GRID_CELL_SIZE, GamePlayer, GameState, PlayerStore
+from .spatial import SegmentGrid
+
+# seconds of bot planning per tick, at least one bot is planned each tick
+BOT_PLANNING_BUDGET = 0.005
+# bots further than this from any human are planned less often
+BOT_FAR_DISTANCE = 1500
+BOT_FAR_PLAN_INTERVAL = 4
+
+
+@dataclasses.dataclass
+class PlanningStats:
+    """Timing statistics for a bot planner."""
+
+    ticks: int = 0
+    plans: int = 0
+    # seconds spent planning bots in the last tick
+    last_planning_time: float = 0.0
+    max_planning_time: float = 0.0
+    # number of bots due a plan in the last tick that were left for later
+    backlog: int = 0
+    # the most ticks any bot of the last tick had gone without a plan
+    max_staleness: int = 0
+    # number of ticks without a plan, as planning in an executor wasn't done in time
+    missed_deadlines: int = 0
+
+
+@dataclasses.dataclass
+class _Plan:
+    """The outcome of planning the bots of a room for a tick."""
+
+    tick: int
+    # bot id -> uid of its target and tick of its last plan, after planning
+    targets: Dict[str, Optional[str]]
+    planned_at: Dict[str, int]
+    # bot id -> angle, when planned from a snapshot of the room
+    angles: Dict[str, float] = dataclasses.field(default_factory=dict)
+    plans: int = 0
+    backlog: int = 0
+    planning_time: float = 0.0
+
+
+def _copy_for_planning(game_state: GameState) -> Tuple[GameState, list, list]:
+    """Copy what planning reads from a room, to plan from while the room changes."""
+    players = []
+    for player in game_state.players:
+        player = copy.copy(player)
+        player.steps = player.steps.copy()
+        player.buffs = list(player.buffs)
+        players.append(player)
+    consumables = [
+        (c.type, c.coordinates, c.size, c.color, c.uid) for c in game_state.consumables
+    ]
+    return copy.copy(game_state), players, consumables
+
+
+def _build_snapshot(
+    game_state: GameState, players: list, consumables: list
+) -> GameState:
+    game_state.players = PlayerStore(players)
+    game_state.consumables = ConsumableStore(
+        Consumable(
+            type=consumable_type,
+            coordinates=coordinates,
+            size=size,
+            color=color,
+            uid=uid,
+        )
+        for consumable_type, coordinates, size, color, uid in consumables
+    )
+    game_state.segments = SegmentGrid(SEGMENT_GRID_CELL_SIZE)
+    return game_state
+
+
+class BotPlanner:
+    """Plan the bots of a room in turns, within a time budget per tick.
+
+    Planning a bot searches for its target and steers it around collisions, which is
+    costly with many bots. Each tick the bots are planned in a rotating order until
+    the budget is spent, starting with the ones without a target, and bots far from
+    any human are only planned every few ticks. Bots that aren't planned keep
+    steering towards the target of their last plan.
+
+    With an executor, the bots are planned off the event loop: `plan_ahead` plans the
+    next tick from a snapshot of the room once a tick is done, and `plan` applies
+    those angles at the start of the next tick. If planning isn't done by then, the
+    bots keep their angles and the late plan is dropped, targets included, so its
+    bots are planned again.
+    """
+
+    def __init__(
+        self,
+        budget: float = BOT_PLANNING_BUDGET,
+        far_distance: float = BOT_FAR_DISTANCE,
+        far_plan_interval: int = BOT_FAR_PLAN_INTERVAL,
+        clock: Optional[Callable[[], float]] = None,
+        executor: Optional[Executor] = None,
+    ):
+        self.budget = budget
+        self.far_distance = far_distance
+        self.far_plan_interval = far_plan_interval
+        self.stats = PlanningStats()
+        self._clock = clock or time.perf_counter
+        # bot id -> uid of its target, in the order the bots are planned
+        self._targets: Dict[str, Optional[str]] = {}
+        # bot id -> tick of its last plan
+        self._planned_at: Dict[str, int] = {}
+        self.executor = executor
+        # the planning running in the executor, and the one to apply at the next tick
+        self._running: Optional[Future] = None
+        self._pending: Optional[Future] = None
+
+    def _forget_bots_that_left(self, bots: List[GamePlayer], plan: _Plan):
+        bot_ids = {bot.id for bot in bots}
+        for bot_id in [b for b in plan.targets if b not in bot_ids]:
+            del plan.targets[bot_id]
+            del plan.planned_at[bot_id]
+
+    def _is_far(self, bot: GamePlayer, humans: List[List[float]]) -> bool:
+        x, y = bot.steps.head
+        return all(math.hypot(x - hx, y - hy) > self.far_distance for hx, hy in humans)
+
+    def _due_bots(
+        self, game_state: GameState, bots: Dict[str, GamePlayer], plan: _Plan
+    ) -> list:
+        """Get the bots due a plan, the ones without a target first."""
+        humans = [p.steps.head for p in game_state.players if not p.is_bot and p.steps]
+        urgent, due = [], []
+        for bot_id, target_uid in plan.targets.items():
+            bot = bots[bot_id]
+            recently_planned = (
+                game_state.tick - plan.planned_at[bot_id] < self.far_plan_interval
+            )
+            if target_uid is None or target_uid not in game_state.consumables:
+                urgent.append(bot)
+            elif not (recently_planned and self._is_far(bot, humans)):
+                due.append(bot)
+        return urgent + due
+
+    def plan(self, game_state: GameState):
+        """Choose the next steps of the bots of a room.
+
+        With an executor, this applies the angles planned since the last tick.
+        """
+        if self.executor is None:
+            self._apply(self._plan(game_state, self._targets, self._planned_at))
+            return
+
+        future, self._pending = self._pending, None
+        if self._running and not self._running.done():
+            # every tick the late planning holds up counts, as none is planned
+            self.stats.missed_deadlines += 1
+            return
+        if future is None:
+            return
+
+        plan = future.result()
+        for bot_id, angle in plan.angles.items():
+            bot = game_state.players.get(bot_id)
+            if bot:
+                bot.angle = angle
+        self._apply(plan)
+
+    def plan_ahead(self, game_state: GameState):
+        """Start planning the next tick in the executor, if there is one."""
+        if self.executor is None:
+            return
+        if self._running and not self._running.done():
+            # still planning an earlier tick
+            return
+
+        # the targets are copied too, they are only updated once the plan is applied
+        self._running = self._pending = self.executor.submit(
+            self._plan_snapshot,
+            dict(self._targets),
+            dict(self._planned_at),
+            *_copy_for_planning(game_state),
+        )
+
+    def _plan_snapshot(self, targets, planned_at, *snapshot) -> _Plan:
+        game_state = _build_snapshot(*snapshot)
+        game_state.tick += 1
+        plan = self._plan(game_state, targets, planned_at)
+        plan.angles = {bot.id: bot.angle for bot in game_state.players.bots()}
+        return plan
+
+    def _plan(
+        self,
+        game_state: GameState,
+        targets: Dict[str, Optional[str]],
+        planned_at: Dict[str, int],
+    ) -> _Plan:
+        """Plan the bots of a room, updating the given targets and plan ticks."""
+        start = self._clock()
+        plan = _Plan(tick=game_state.tick, targets=targets, planned_at=planned_at)
+        game_state.segments.sync_players(game_state.players)
+        bots = {bot.id: bot for bot in game_state.players.bots()}
+        self._forget_bots_that_left(list(bots.values()), plan)
+        for bot_id in bots:
+            if bot_id not in targets:
+                targets[bot_id] = None
+                planned_at[bot_id] = game_state.tick
+
+        due = self._due_bots(game_state, bots, plan)
+        planned = set()
+        for bot in due:
+            if planned and self._clock() - start >= self.budget:
+                break
+            target = plan_bot_step(bot, game_state)
+            # move the bot to the back of the rotation
+            del targets[bot.id]
+            targets[bot.id] = target.uid if target else None
+            planned_at[bot.id] = game_state.tick
+            planned.add(bot.id)
+
+        for bot_id, target_uid in targets.items():
+            if bot_id in planned or target_uid is None:
+                continue
+            target = game_state.consumables.get(target_uid)
+            if target:
+                steer_bot(bots[bot_id], game_state, target, avoid_collisions=False)
+
+        plan.planning_time = self._clock() - start
+        plan.plans = len(planned)
+        plan.backlog = len(due) - len(planned)
+        return plan
+
+    def _apply(self, plan: _Plan):
+        """Keep the targets and statistics of a plan that was used."""
+        self._targets = plan.targets
+        self._planned_at = plan.planned_at
+        self.stats.ticks += 1
+        self.stats.plans += plan.plans
+        self.stats.last_planning_time = plan.planning_time
+        self.stats.max_planning_time = max(
+            self.stats.max_planning_time, plan.planning_time
+        )
+        self.stats.backlog = plan.backlog
+        self.stats.max_staleness = max(
+            (plan.tick - tick for tick in plan.planned_at.values()), default=0
+        )
@@ -4,55 +4,65 @@ from random import choices, randint
 
 from structlog import get_logger
 
-from .intersect import lines_intersect, point_inside_circle
-from .resources.buffs import BuffType
-from .resources.consumables import ConsumableType
-from .resources.game import (
-    MAP_SIZE,
-    MINIMUM_STEP_LENGTH,
-    GamePlayer,
-    GameState,
-    PlayerStep,
+from .intersect import (
+    CIRCLE_COLLISION_TOLERANCE,
+    lines_intersect,
+    map_bound_edges,
+    normalize_angle,
+    point_inside_circle,
 )
+from .resources.body import SnakeBody
+from .resources.buffs import BUFF_FLAGS, BuffType
+from .resources.consumables import ConsumableType
+from .resources.game import MAP_SIZE, MINIMUM_STEP_LENGTH, GamePlayer, GameState
 
 logger = get_logger(__name__)
 
 
 def _reset_player(player: GamePlayer):
     """Reset a player to its initial state."""
-    player.steps = [
-        PlayerStep(
-            coordinates=[
-                float(randint(-MAP_SIZE, MAP_SIZE)),
-                float(randint(-MAP_SIZE, MAP_SIZE)),
-            ]
-        )
-    ]
+    player.steps = SnakeBody(
+        [(float(randint(-MAP_SIZE, MAP_SIZE)), float(randint(-MAP_SIZE, MAP_SIZE)))]
+    )
     player.step_length = MINIMUM_STEP_LENGTH
     player.angle = 0.0
     player.spawned = False
 
 
+def _is_ghost(player: GamePlayer) -> bool:
+    return bool(player.buff_flags & BUFF_FLAGS[BuffType.GHOST])
+
+
+def _collides(
+    player: GamePlayer, last_step: tuple, other_player: GamePlayer, step1, step2
+):
+    other_step = (step1, step2)
+    if other_player.id == player.id and other_step == last_step:
+        return False
+    if _is_ghost(other_player):
+        return False
+    return lines_intersect(*last_step, *other_step)
+
+
 def _check_collisions_with_players(player: GamePlayer, game_state: GameState):
     """Test player collisions."""
     # Collisions with other players
-    if any([b for b in player.buffs if b.definition.type == BuffType.GHOST]):
+    if _is_ghost(player):
         return
 
     if len(player.steps) >= 3:
-        last_step = (player.steps[-2].coordinates, player.steps[-1].coordinates)
+        last_step = (player.steps[-2], player.steps.head)
+
+        # broad phase, only the segments sharing a grid cell with the step can hit it
+        if not any(
+            _collides(player, last_step, *segment)
+            for segment in game_state.segments.candidates(*last_step)
+        ):
+            return
 
         for other_player in game_state.players:
-            if any(
-                [b for b in other_player.buffs if b.definition.type == BuffType.GHOST]
-            ):
-                continue
-            for step1, step2 in zip(other_player.steps[:-1], other_player.steps[1:]):
-                other_step = (step1.coordinates, step2.coordinates)
-                if other_player.id == player.id and other_step == last_step:
-                    continue
-
-                if lines_intersect(*last_step, *other_step):
+            for step1, step2 in other_player.steps.segments():
+                if _collides(player, last_step, other_player, step1, step2):
                     logger.info(
                         "player collision",
                         player_name=player.name,
@@ -69,35 +79,43 @@ def _check_consumable_collisions(player: GamePlayer, game_state: GameState):
 
     Any new buffs that are applied to the player are added to the player's buffs list.
     """
+    consumables = game_state.consumables
+    head = player.steps.head
+    # only the consumables in the cells around the head can be in reach
+    reach = consumables.max_size + CIRCLE_COLLISION_TOLERANCE
+    consumed = sorted(
+        (
+            consumable
+            for consumable in consumables.grid.candidates(*head, reach)
+            if point_inside_circle(head, consumable.coordinates, consumable.size)
+        ),
+        key=consumables.position,
+    )
 
-    for consumable in game_state.consumables:
-        if point_inside_circle(
-            player.steps[-1].coordinates, consumable.coordinates, consumable.size
-        ):
-            if consumable.definition.type in [
-                ConsumableType.POISON,
-                ConsumableType.APPLE,
-            ]:
-                consumable_size_multiplier = (
-                    consumable.size / consumable.definition.size
-                )
-                player.step_length += (
-                    consumable.definition.size_effect_multiplier(
-                        consumable_size_multiplier
-                    )
-                    * consumable.definition.player_size_diff
-                )
-                player.step_length = max(player.step_length, 50)
+    for consumable in consumed:
+        if consumable.definition.type in [
+            ConsumableType.POISON,
+            ConsumableType.APPLE,
+        ]:
+            consumable_size_multiplier = consumable.size / consumable.definition.size
+            player.step_length += (
+                consumable.definition.size_effect_multiplier(consumable_size_multiplier)
+                * consumable.definition.player_size_diff
+            )
+            player.step_length = max(player.step_length, 50)
 
-            buff = consumable.buff
-            if buff:
-                definition = buff.definition
-                if definition.applies_globally:
-                    game_state.global_buffs.append(buff)
-                else:
-                    player.buffs.append(buff)
+        buff = consumable.buff
+        if buff:
+            definition = buff.definition
+            if definition.applies_globally:
+                game_state.global_buffs.append(buff)
+                game_state.buff_schedule.add(buff)
+            else:
+                player.buffs.append(buff)
+                player.buff_flags |= BUFF_FLAGS[buff.type]
+                game_state.buff_schedule.add(buff, player)
 
-            game_state.consumables.remove(consumable)
+        consumables.remove(consumable.uid)
 
 
 def _check_in_map_bounds(player: GamePlayer, game_state: GameState):
@@ -106,19 +124,11 @@ def _check_in_map_bounds(player: GamePlayer, game_state: GameState):
     if len(player.steps) < 2:
         return
 
-    b = game_state.map_bounds
-    bounds = [
-        [(b[0][0], b[0][1]), (b[0][0], b[1][1])],
-        [(b[1][0], b[0][1]), (b[1][0], b[1][1])],
-        [(b[0][0], b[1][1]), (b[1][0], b[1][1])],
-        [(b[0][0], b[0][1]), (b[1][0], b[0][1])],
-    ]
-
-    for bound in bounds:
+    for bound in map_bound_edges(game_state.map_bounds):
         if lines_intersect(
             *bound,
-            player.steps[-2].coordinates,
-            player.steps[-1].coordinates,
+            player.steps[-2],
+            player.steps.head,
         ):
             logger.info("player out of bounds", player_name=player.name)
             _reset_player(player)
@@ -126,26 +136,29 @@ def _check_in_map_bounds(player: GamePlayer, game_state: GameState):
 
 
 def _take_step(player: GamePlayer, game_state: GameState):
-    x, y = player.steps[-1].coordinates
+    x, y = player.steps.head
     dx = math.cos(player.angle) * player.step_length
     dy = math.sin(player.angle) * player.step_length
-    player.steps.append(PlayerStep(coordinates=[x + dx, y + dy]))
+    player.steps.push(x + dx, y + dy)
 
     # Limit number of segments
     max_steps = int(player.step_length**0.3 + 7)
-    player.steps = player.steps[-max_steps:]
+    player.steps.trim(max_steps)
 
     # Decay step length
     player.step_length = max(player.step_length - 0.2, MINIMUM_STEP_LENGTH)
 
     # Test collisions
+    game_state.segments.sync(player)
     _check_collisions_with_players(player, game_state)
     _check_consumable_collisions(player, game_state)
     _check_in_map_bounds(player, game_state)
+    game_state.segments.sync(player)
 
 
 def take_player_steps(game_state: GameState):
     """Take a step for each player."""
+    game_state.segments.sync_players(game_state.players)
     for player in game_state.players:
         _take_step(player, game_state)
 
@@ -164,25 +177,29 @@ COLOR_PALETTE = [
 
 
 def _get_unassigned_color(game_state: GameState):
-    """Get an unassigned color."""
+    """Get an unassigned color, or any color once all of them are assigned.
+
+    Rooms hold at most a player per color, but bots leaving room for new players
+    only leave at the next tick.
+    """
     assigned_colors = [p.color for p in game_state.players]
     available_colors = [c for c in COLOR_PALETTE if c not in assigned_colors]
-    color = choices(available_colors)[0]
+    color = choices(available_colors or COLOR_PALETTE)[0]
     return color
 
 
+class JoinError(ValueError):
+    """A player that can't be added to a room, with the reason for the client."""
+
+
 def add_player(game_state: GameState, name: str, is_bot: bool) -> str:
     """Create a player.
 
     Returns the player id.
     """
     # check if the player already exists (lookup by name)
-    player = next(
-        (p for p in game_state.players if p.name == name),
-        None,
-    )
-    if player:
-        raise ValueError("Name already taken")
+    if game_state.players.get_by_name(name):
+        raise JoinError("Name already taken")
 
     player = GamePlayer(
         id=str(uuid.uuid4()),
@@ -190,31 +207,41 @@ def add_player(game_state: GameState, name: str, is_bot: bool) -> str:
         color=_get_unassigned_color(game_state),
         step_length=MINIMUM_STEP_LENGTH,
         spawned=False,
-        steps=[
-            PlayerStep(
-                coordinates=[
-                    float(randint(-MAP_SIZE, MAP_SIZE)),
-                    float(randint(-MAP_SIZE, MAP_SIZE)),
-                ]
-            )
-        ],
+        steps=SnakeBody(
+            [(float(randint(-MAP_SIZE, MAP_SIZE)), float(randint(-MAP_SIZE, MAP_SIZE)))]
+        ),
         step_fov=math.pi * 0.875,
         is_bot=is_bot,
         buffs=[],
     )
-    game_state.players.append(player)
+    game_state.players.add(player)
     logger.info("added player", player_id=player.id)
     return player.id
 
 
 def kick_player(game_state: GameState, player_id: str):
     """Remove a player."""
-    player = next(
-        (p for p in game_state.players if p.id == player_id),
-        None,
-    )
+    player = game_state.players.remove(player_id)
     if player:
-        game_state.players.remove(player)
         logger.info("removed player", player_name=player.name, is_bot=player.is_bot)
     else:
-        logger.info("player not found", player_name=player.name)
+        logger.info("player not found", player_id=player_id)
+
+
+def steer_player(player: GamePlayer, angle: float):
+    """Set the angle of the player's next step, validating it is within the fov."""
+    new_angle = angle
+    if len(player.steps) >= 2:
+        last_step = player.steps.head
+        second_last_step = player.steps[-2]
+        previous_step_angle = math.atan2(
+            last_step[1] - second_last_step[1], last_step[0] - second_last_step[0]
+        )
+
+        normalized_angle = normalize_angle(player.angle - previous_step_angle)
+        if normalized_angle > player.step_fov:
+            new_angle = previous_step_angle + player.step_fov
+        elif normalized_angle < -player.step_fov:
+            new_angle = previous_step_angle - player.step_fov
+
+    player.angle = new_angle
@@ -0,0 +1,120 @@
+import itertools
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pydantic_core import core_schema
+
+# number of steps a snake body has room for at first, it grows when it's full
+SNAKE_BODY_CAPACITY = 16
+
+Coordinates = Tuple[float, float]
+
+
+class SnakeBody:
+    """The steps of a snake, tail first, as (x, y) tuples in a ring buffer.
+
+    Pushing a step at the head and trimming steps off the tail are O(1), and the
+    steps and segments are read in place. Steps are numbered in the order they were
+    pushed, so the steps a snake kept from one tick to the next are found without
+    comparing them, see `SegmentGrid.sync`.
+
+    Clients get the steps as a list of `{"coordinates": [x, y]}`.
+    """
+
+    def __init__(
+        self,
+        steps: Iterable[Sequence[float]] = (),
+        capacity: int = SNAKE_BODY_CAPACITY,
+    ):
+        self._ring: List[Optional[Coordinates]] = [None] * capacity
+        # number of the tail step, and of the step after the head
+        self.start = 0
+        self.end = 0
+        for x, y in steps:
+            self.push(x, y)
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __iter__(self) -> Iterator[Coordinates]:
+        # the steps are in at most two runs of the ring
+        capacity = len(self._ring)
+        first = self.start % capacity
+        last = first + len(self)
+        if last <= capacity:
+            return iter(self._ring[first:last])
+        return itertools.chain(self._ring[first:], self._ring[: last - capacity])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("snake body index out of range")
+        return self._ring[(self.start + index) % len(self._ring)]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, SnakeBody):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"SnakeBody({list(self)!r})"
+
+    @property
+    def head(self) -> Coordinates:
+        """Get the coordinates of the head step."""
+        return self._ring[(self.end - 1) % len(self._ring)]
+
+    def push(self, x: float, y: float):
+        """Add a step at the head."""
+        if len(self) == len(self._ring):
+            self._grow()
+        self._ring[self.end % len(self._ring)] = (x, y)
+        self.end += 1
+
+    def _grow(self):
+        ring = [None] * (2 * len(self._ring))
+        for number in range(self.start, self.end):
+            ring[number % len(ring)] = self._ring[number % len(self._ring)]
+        self._ring = ring
+
+    def trim(self, max_steps: int):
+        """Drop the steps at the tail beyond a number of steps."""
+        while len(self) > max_steps:
+            self._ring[self.start % len(self._ring)] = None
+            self.start += 1
+
+    def segments(self, start: int = 0) -> Iterator[Tuple[Coordinates, Coordinates]]:
+        """Yield the (step, next step) segments, from the one of a step number on."""
+        ring, capacity = self._ring, len(self._ring)
+        for number in range(max(start, self.start), self.end - 1):
+            yield ring[number % capacity], ring[(number + 1) % capacity]
+
+    def copy(self) -> "SnakeBody":
+        """Copy the body, keeping the numbers of the steps."""
+        body = SnakeBody(capacity=len(self._ring))
+        body._ring = list(self._ring)
+        body.start, body.end = self.start, self.end
+        return body
+
+    @classmethod
+    def _validate(cls, value) -> "SnakeBody":
+        if isinstance(value, cls):
+            return value
+        return cls(
+            step["coordinates"] if isinstance(step, dict) else step for step in value
+        )
+
+    @staticmethod
+    def _serialize(body: "SnakeBody") -> list:
+        return [{"coordinates": step} for step in body]
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                cls._serialize
+            ),
+        )
@@ -1,7 +1,8 @@
+import dataclasses
+import heapq
+import itertools
 from enum import Enum
-from typing import Optional
-
-from pydantic import dataclasses
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 
 class BuffType(Enum):
@@ -34,14 +35,59 @@ class BuffDefinition:
     applies_globally: bool
 
 
-@dataclasses.dataclass
+class PassCounter:
+    """The passes of a phase of a buff schedule so far."""
+
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+
+@dataclasses.dataclass(slots=True, init=False)
 class Buff:
+    """A buff held by a player, or a global buff.
+
+    The remaining duration isn't counted down, it's worked out from the pass the buff
+    expires in and the passes of its phase so far, whenever it's read. Until the buff
+    is scheduled its passes stand still.
+    """
+
     type: BuffType
     friendly_name: str
     is_debuff: bool
     is_applied: bool
     duration: Optional[int]
-    duration_remaining: Optional[int]
+    # the pass of its phase the buff expires in, None if it doesn't
+    expires_in: Optional[int]
+    passes: PassCounter = dataclasses.field(compare=False, repr=False)
+
+    def __init__(
+        self,
+        type: BuffType,
+        friendly_name: str,
+        is_debuff: bool,
+        is_applied: bool,
+        duration: Optional[int],
+        duration_remaining: Optional[int],
+    ):
+        self.type = type
+        self.friendly_name = friendly_name
+        self.is_debuff = is_debuff
+        self.is_applied = is_applied
+        self.duration = duration
+        self.passes = PassCounter()
+        self.duration_remaining = duration_remaining
+
+    @property
+    def duration_remaining(self) -> Optional[int]:
+        if self.expires_in is None:
+            return None
+        return self.expires_in - self.passes.count - 1
+
+    @duration_remaining.setter
+    def duration_remaining(self, value: Optional[int]):
+        self.expires_in = None if value is None else self.passes.count + value + 1
 
     @property
     def definition(self) -> BuffDefinition:
@@ -86,3 +132,109 @@ BUFF_DEFINITIONS = {
         applies_globally=False,
     ),
 }
+
+# a bit per buff type, for the flags of the buffs a player holds
+BUFF_FLAGS = {buff_type: 1 << i for i, buff_type in enumerate(BuffType)}
+
+
+def buff_flags(buffs: List[Buff]) -> int:
+    """Get the flags of the types of some buffs."""
+    flags = 0
+    for buff in buffs:
+        flags |= BUFF_FLAGS[buff.type]
+    return flags
+
+
+class ScheduledBuff(NamedTuple):
+    """A buff in a buff schedule."""
+
+    buff: Buff
+    definition: BuffDefinition
+    # the player holding the buff, None for a global buff
+    player: Optional[Any]
+    # the order the buffs were added in
+    order: int
+
+
+class BuffSchedule:
+    """The buffs of a room, bucketed by the phase of the tick they're applied in.
+
+    Each tick runs a pass of each BuffApplicationTime, and a pass only visits the
+    buffs of its phase that are due: the ones expiring come off a heap keyed on the
+    pass they expire in, and the ones applied are the repeating buffs and the buffs
+    applied once that haven't been yet. The buffs share the pass counter of their
+    phase, so their remaining durations follow the passes without being visited.
+
+    A buff with a duration of D is applied from the first pass of its phase after it
+    is added, and expires in the D + 1th pass.
+    """
+
+    def __init__(self):
+        self._orders = itertools.count()
+        # passes of each phase so far
+        self._passes = {phase: PassCounter() for phase in BuffApplicationTime}
+        # order -> buff, of the buffs that haven't expired
+        self._active: Dict[BuffApplicationTime, Dict[int, ScheduledBuff]] = {
+            phase: {} for phase in BuffApplicationTime
+        }
+        # heaps of (pass the buff expires in, order)
+        self._expiries: Dict[BuffApplicationTime, List[Tuple[int, int]]] = {
+            phase: [] for phase in BuffApplicationTime
+        }
+        # order -> buff, of the buffs applied each pass and the ones yet to be applied
+        self._repeating: Dict[BuffApplicationTime, Dict[int, ScheduledBuff]] = {
+            phase: {} for phase in BuffApplicationTime
+        }
+        self._pending: Dict[BuffApplicationTime, Dict[int, ScheduledBuff]] = {
+            phase: {} for phase in BuffApplicationTime
+        }
+
+    def __len__(self) -> int:
+        return sum(len(active) for active in self._active.values())
+
+    def add(self, buff: Buff, player=None) -> ScheduledBuff:
+        """Schedule a buff held by a player, or a global buff without one."""
+        definition = buff.definition
+        phase = definition.application_time
+        entry = ScheduledBuff(buff, definition, player, next(self._orders))
+
+        self._active[phase][entry.order] = entry
+        duration_remaining = buff.duration_remaining
+        buff.passes = self._passes[phase]
+        buff.duration_remaining = duration_remaining
+        if buff.expires_in is not None:
+            heapq.heappush(self._expiries[phase], (buff.expires_in, entry.order))
+        if definition.application_frequency == BuffApplicationFrequency.REPEATING:
+            self._repeating[phase][entry.order] = entry
+        elif not buff.is_applied:
+            self._pending[phase][entry.order] = entry
+        return entry
+
+    def start_pass(
+        self, phase: BuffApplicationTime
+    ) -> Tuple[List[ScheduledBuff], List[ScheduledBuff]]:
+        """Start a pass of a phase, and get the buffs expiring and to apply.
+
+        Both lists are in the order the buffs were added.
+        """
+        passes = self._passes[phase]
+        passes.count += 1
+        current = passes.count
+        active = self._active[phase]
+
+        expired = []
+        expiries = self._expiries[phase]
+        while expiries and expiries[0][0] <= current:
+            _, order = heapq.heappop(expiries)
+            expired.append(active.pop(order))
+            self._repeating[phase].pop(order, None)
+            self._pending[phase].pop(order, None)
+        expired.sort(key=lambda entry: entry.order)
+
+        pending = self._pending[phase]
+        due = sorted(
+            itertools.chain(pending.values(), self._repeating[phase].values()),
+            key=lambda entry: entry.order,
+        )
+        pending.clear()
+        return expired, due
@@ -1,10 +1,22 @@
 import dataclasses
+import itertools
 from enum import Enum
-from typing import Callable, List
+from math import sqrt
+from operator import attrgetter
+from typing import Callable, Collection, Dict, Iterable, Iterator, List, Optional, Tuple
 from uuid import uuid4
 
+import numpy as np
+
+from ..spatial import SpatialGrid
 from .buffs import BUFF_DEFINITIONS, Buff, BuffType
 
+# size of the cells of the spatial grid of the consumables of a room
+CONSUMABLE_GRID_CELL_SIZE = 100
+# consumables the coordinate array of a room has room for at first, it doubles when
+# it's full
+COORDINATES_CAPACITY = 256
+
 
 class ConsumableType(Enum):
     APPLE = "apple"
@@ -84,6 +96,7 @@ CONSUMABLE_DEFINITIONS = [
         size_effect_multiplier=lambda x: x,
     ),
 ]
+CONSUMABLE_DEFINITIONS_BY_TYPE = {d.type: d for d in CONSUMABLE_DEFINITIONS}
 
 
 @dataclasses.dataclass
@@ -100,7 +113,7 @@ class Consumable:
     @property
     def definition(self):
         """Get the consumable definition."""
-        return next((d for d in CONSUMABLE_DEFINITIONS if d.type == self.type), None)
+        return CONSUMABLE_DEFINITIONS_BY_TYPE.get(self.type)
 
     @property
     def buff(self):
@@ -118,3 +131,127 @@ class Consumable:
             duration=buff_definition.default_duration,
             is_applied=False,
         )
+
+
+class ConsumableStore:
+    """The consumables of a room, with live counts per type and a spatial grid.
+
+    Removing a consumable swaps the last one into its place, so it's O(1) but
+    doesn't keep the order of the consumables. Uids are short and unique within the
+    store. Consumables have to be moved with `move`, to keep the grid and the array
+    of their coordinates up to date.
+    """
+
+    def __init__(self, consumables: Iterable[Consumable] = ()):
+        self._consumables: List[Consumable] = []
+        self._positions: Dict[str, int] = {}
+        self._counts: Dict[ConsumableType, int] = {t: 0 for t in ConsumableType}
+        # the coordinates of the consumables, in the same order
+        self._coordinates = np.empty((COORDINATES_CAPACITY, 2))
+        self._uids = itertools.count()
+        self.grid = SpatialGrid(
+            CONSUMABLE_GRID_CELL_SIZE, position=attrgetter("coordinates")
+        )
+        # the size of the biggest consumable added, bounding the pickup distance
+        self.max_size = 0
+        self.extend(consumables)
+
+    def __len__(self) -> int:
+        return len(self._consumables)
+
+    def __iter__(self) -> Iterator[Consumable]:
+        return iter(self._consumables)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._positions
+
+    def count(self, consumable_type: ConsumableType) -> int:
+        return self._counts[consumable_type]
+
+    def get(self, uid: str) -> Optional[Consumable]:
+        position = self._positions.get(uid)
+        return None if position is None else self._consumables[position]
+
+    def position(self, consumable: Consumable) -> int:
+        """Get the index of a consumable in the iteration order."""
+        return self._positions[consumable.uid]
+
+    def coordinates(self) -> np.ndarray:
+        """Get the coordinates of the consumables in the iteration order, as an array.
+
+        The array changes with the store, it has to be copied to be kept.
+        """
+        return self._coordinates[: len(self._consumables)]
+
+    def next_uid(self) -> str:
+        return format(next(self._uids), "x")
+
+    def add(self, consumable: Consumable):
+        position = len(self._consumables)
+        if position == len(self._coordinates):
+            self._coordinates = np.concatenate(
+                [self._coordinates, np.empty_like(self._coordinates)]
+            )
+        self._coordinates[position] = consumable.coordinates
+        self._positions[consumable.uid] = position
+        self._consumables.append(consumable)
+        self._counts[consumable.type] += 1
+        self.grid.insert(consumable.uid, consumable)
+        self.max_size = max(self.max_size, consumable.size)
+
+    def extend(self, consumables: Iterable[Consumable]):
+        for consumable in consumables:
+            self.add(consumable)
+
+    def remove(self, uid: str) -> Optional[Consumable]:
+        """Remove a consumable, returning it if it was in the store."""
+        position = self._positions.pop(uid, None)
+        if position is None:
+            return None
+
+        consumable = self._consumables[position]
+        last = self._consumables.pop()
+        if last is not consumable:
+            self._consumables[position] = last
+            self._positions[last.uid] = position
+            self._coordinates[position] = self._coordinates[len(self._consumables)]
+        self._counts[consumable.type] -= 1
+        self.grid.remove(uid)
+        return consumable
+
+    def move(self, consumable: Consumable, coordinates: List[float]):
+        consumable.coordinates = coordinates
+        self._coordinates[self._positions[consumable.uid]] = coordinates
+        self.grid.move(consumable.uid, consumable)
+
+    def near(
+        self, x: float, y: float, radius: float
+    ) -> Iterator[Tuple[Consumable, float]]:
+        """Yield the consumables within a radius of a point, with their distance."""
+        return self.grid.query(x, y, radius)
+
+    def nearest(
+        self,
+        x: float,
+        y: float,
+        min_distance: float = 0.0,
+        exclude: Collection[ConsumableType] = (),
+    ) -> Optional[Consumable]:
+        """Find the consumable closest to a point.
+
+        Skips the excluded types and the consumables closer than `min_distance`,
+        counting their size. Of equally close consumables, the first in the store wins.
+        """
+
+        def key(consumable: Consumable):
+            if consumable.type in exclude:
+                return None
+            distance = sqrt(
+                (x - consumable.coordinates[0]) ** 2
+                + (y - consumable.coordinates[1]) ** 2
+            )
+            if (distance + consumable.size) < min_distance:
+                return None
+            return distance, self._positions[consumable.uid]
+
+        return self.grid.nearest(x, y, key)
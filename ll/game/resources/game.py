@@ -1,41 +1,101 @@
-from typing import List
+import dataclasses
+from typing import Dict, Iterator, List, Optional
 
-from pydantic import dataclasses
-
-from .buffs import Buff
-from .consumables import Consumable
+from ..spatial import SegmentGrid
+from .body import SnakeBody
+from .buffs import Buff, BuffSchedule
+from .consumables import ConsumableStore
 
 DEFAULT_TICK_PERIOD = 1.25
 MINIMUM_STEP_LENGTH = 50
 MAP_SIZE = 2000
 CONSUMABLE_DENSITY = 0.00005
 MIN_CONSUMABLE_COUNT = int((MAP_SIZE**2) * CONSUMABLE_DENSITY)
+# size of the cells of the grid of the segments of the snakes in a room
+SEGMENT_GRID_CELL_SIZE = 200
+# apples further than this from the holder of an apple magnet or repel don't move
+APPLE_MAGNET_RADIUS = 500
 
 
-@dataclasses.dataclass
-class PlayerStep:
-    """A step a player took."""
-
-    coordinates: List[float]
-
-
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class GamePlayer:
     """A player in the game."""
 
     name: str
     id: str
     color: List[int]
-    steps: List[PlayerStep]
+    steps: SnakeBody
     step_length: float
     buffs: List[Buff]
     spawned: bool
     step_fov: float
     is_bot: bool
     angle: float = 0.0
+    # BUFF_FLAGS of the buffs the player holds, kept in step with buffs
+    buff_flags: int = 0
+
+
+class PlayerStore:
+    """The players of a room, indexed by id and by name.
+
+    Inserting and removing a player is O(1), and players are iterated in the order
+    they were added, so removing a player doesn't reorder the others.
+    """
+
+    def __init__(self, players=()):
+        self._by_id: Dict[str, GamePlayer] = {}
+        self._by_name: Dict[str, GamePlayer] = {}
+        self._bots: Dict[str, GamePlayer] = {}
+        for player in players:
+            self.add(player)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[GamePlayer]:
+        return iter(self._by_id.values())
+
+    def __contains__(self, player_id: str) -> bool:
+        return player_id in self._by_id
+
+    @property
+    def n_bots(self) -> int:
+        return len(self._bots)
+
+    @property
+    def n_humans(self) -> int:
+        return len(self._by_id) - len(self._bots)
+
+    def bots(self) -> Iterator[GamePlayer]:
+        """Iterate over the bots, in the order they were added."""
+        return iter(self._bots.values())
+
+    def get(self, player_id: str) -> Optional[GamePlayer]:
+        return self._by_id.get(player_id)
+
+    def get_by_name(self, name: str) -> Optional[GamePlayer]:
+        return self._by_name.get(name)
+
+    def add(self, player: GamePlayer):
+        """Add a player, names are unique within a room."""
+        if player.name in self._by_name:
+            raise ValueError("Name already taken")
+
+        self._by_id[player.id] = player
+        self._by_name[player.name] = player
+        if player.is_bot:
+            self._bots[player.id] = player
+
+    def remove(self, player_id: str) -> Optional[GamePlayer]:
+        """Remove a player, returning it if it was in the room."""
+        player = self._by_id.pop(player_id, None)
+        if player is not None:
+            del self._by_name[player.name]
+            self._bots.pop(player_id, None)
+        return player
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class GameState:
     """The state of the game."""
 
@@ -44,7 +104,14 @@ class GameState:
     tick_period: float
     server_timestamp: int
     server_next_tick_time: int
-    players: List[GamePlayer]
-    consumables: List[Consumable]
+    players: PlayerStore
+    consumables: ConsumableStore
     global_buffs: List[Buff]
     map_bounds: List[List[float]]
+    # broad-phase index of the segments of the players, see ll.game.spatial
+    segments: SegmentGrid = dataclasses.field(
+        default_factory=lambda: SegmentGrid(SEGMENT_GRID_CELL_SIZE)
+    )
+    magnet_radius: float = APPLE_MAGNET_RADIUS
+    # the buffs of the players and the global buffs, by when they apply and expire
+    buff_schedule: BuffSchedule = dataclasses.field(default_factory=BuffSchedule)
@@ -0,0 +1,293 @@
+import asyncio
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from structlog import get_logger
+
+from .loop import game_loop
+from .planner import (
+    BOT_FAR_DISTANCE,
+    BOT_FAR_PLAN_INTERVAL,
+    BOT_PLANNING_BUDGET,
+    BotPlanner,
+)
+from .player import COLOR_PALETTE, JoinError, add_player, steer_player
+from .resources.consumables import ConsumableStore
+from .resources.game import APPLE_MAGNET_RADIUS, MAP_SIZE, GameState, PlayerStore
+from .scheduler import OverrunPolicy, TickScheduler
+
+logger = get_logger(__name__)
+
+# rooms a room manager runs at most, joins are refused when they are all full
+MAX_ROOMS = 16
+
+
+@dataclasses.dataclass
+class RoomsLoad:
+    """Load of the rooms run by a room manager."""
+
+    rooms: int = 0
+    players: int = 0
+    humans: int = 0
+    tick_overruns: int = 0
+    # seconds, the worst lateness of the last tick of each room
+    tick_lateness: float = 0.0
+    # seconds, the longest bot planning of the last tick of each room
+    bot_planning_time: float = 0.0
+    # bots due a plan in the last tick of each room that were left for later
+    bot_planning_backlog: int = 0
+
+
+def _create_game_state(
+    room_id: int, magnet_radius: float = APPLE_MAGNET_RADIUS
+) -> GameState:
+    return GameState(
+        id=room_id,
+        tick=0,
+        tick_period=1,
+        server_timestamp=0,
+        server_next_tick_time=0,
+        players=PlayerStore(),
+        consumables=ConsumableStore(),
+        global_buffs=[],
+        map_bounds=[
+            [-MAP_SIZE, -MAP_SIZE],
+            [MAP_SIZE, MAP_SIZE],
+        ],
+        magnet_radius=magnet_radius,
+    )
+
+
+def _count_humans(game_state: GameState) -> int:
+    return game_state.players.n_humans
+
+
+class RoomManager:
+    """Create, run and destroy game rooms in the current event loop.
+
+    Each room is a GameState with its own game loop task, so rooms tick independently
+    of each other. Joins are routed to the busiest room that still has space (so
+    players meet each other), and a new room is created when all rooms are full, up
+    to `max_rooms`. Names are unique across the rooms of the manager. Rooms without
+    any human players are destroyed, down to `min_rooms`.
+    """
+
+    def __init__(
+        self,
+        app,
+        max_players_per_room: int,
+        min_rooms: int = 1,
+        max_rooms: int = MAX_ROOMS,
+        tick_overrun_policy: OverrunPolicy = OverrunPolicy.SKIP,
+        tick_max_catch_up: int = 3,
+        bot_planning_budget: float = BOT_PLANNING_BUDGET,
+        bot_far_distance: float = BOT_FAR_DISTANCE,
+        bot_far_plan_interval: int = BOT_FAR_PLAN_INTERVAL,
+        bot_planning_threads: int = 0,
+        apple_magnet_radius: float = APPLE_MAGNET_RADIUS,
+    ):
+        self.app = app
+        # a room has a color per player
+        if max_players_per_room > len(COLOR_PALETTE):
+            logger.warning(
+                "room player cap above the number of colors",
+                max_players_per_room=max_players_per_room,
+                colors=len(COLOR_PALETTE),
+            )
+        self.max_players_per_room = min(max_players_per_room, len(COLOR_PALETTE))
+        self.min_rooms = min_rooms
+        self.max_rooms = max(max_rooms, min_rooms)
+        self.tick_overrun_policy = tick_overrun_policy
+        self.tick_max_catch_up = tick_max_catch_up
+        self.bot_planning_budget = bot_planning_budget
+        self.bot_far_distance = bot_far_distance
+        self.bot_far_plan_interval = bot_far_plan_interval
+        self.bot_planning_threads = bot_planning_threads
+        self.apple_magnet_radius = apple_magnet_radius
+        self._bot_planning_executor: Optional[ThreadPoolExecutor] = None
+        self.game_states: Dict[int, GameState] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._schedulers: Dict[int, TickScheduler] = {}
+        self._planners: Dict[int, BotPlanner] = {}
+        self._player_rooms: Dict[str, int] = {}
+        self._next_room_id = 1
+        self._running = False
+
+    def _start_room(self, game_state: GameState):
+        scheduler = TickScheduler(
+            policy=self.tick_overrun_policy,
+            max_catch_up_ticks=self.tick_max_catch_up,
+        )
+        planner = BotPlanner(
+            budget=self.bot_planning_budget,
+            far_distance=self.bot_far_distance,
+            far_plan_interval=self.bot_far_plan_interval,
+            executor=self._bot_planning_executor,
+        )
+        task = asyncio.get_running_loop().create_task(
+            game_loop(self.app, game_state, scheduler, planner)
+        )
+        self._schedulers[game_state.id] = scheduler
+        self._planners[game_state.id] = planner
+        self._tasks[game_state.id] = task
+
+    def create_room(self) -> GameState:
+        """Create a room, starting its game loop if the manager is running."""
+        game_state = _create_game_state(self._next_room_id, self.apple_magnet_radius)
+        self._next_room_id += 1
+        self.game_states[game_state.id] = game_state
+        if self._running:
+            self._start_room(game_state)
+
+        logger.info("created room", room_id=game_state.id)
+        return game_state
+
+    def close_room(self, room_id: int):
+        """Destroy a room and stop its game loop."""
+        self.game_states.pop(room_id, None)
+        self._schedulers.pop(room_id, None)
+        self._planners.pop(room_id, None)
+        task = self._tasks.pop(room_id, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
+
+        self._player_rooms = {
+            p: r for p, r in self._player_rooms.items() if r != room_id
+        }
+        logger.info("closed room", room_id=room_id)
+
+    def should_close_room(self, game_state: GameState) -> bool:
+        """Check if a room is idle and can be destroyed."""
+        return len(self.game_states) > self.min_rooms and _count_humans(game_state) == 0
+
+    def start(self):
+        """Start the game loops of all rooms."""
+        self._running = True
+        if self.bot_planning_threads > 0:
+            self._bot_planning_executor = ThreadPoolExecutor(
+                max_workers=self.bot_planning_threads,
+                thread_name_prefix="bot-planner",
+            )
+        while len(self.game_states) < self.min_rooms:
+            self.create_room()
+
+        for game_state in self.game_states.values():
+            if game_state.id not in self._tasks:
+                self._start_room(game_state)
+
+    async def stop(self):
+        """Stop the game loops of all rooms."""
+        self._running = False
+        tasks = list(self._tasks.values())
+        self._tasks = {}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._bot_planning_executor:
+            self._bot_planning_executor.shutdown(wait=False, cancel_futures=True)
+            self._bot_planning_executor = None
+
+    def _choose_room(self) -> GameState:
+        candidates = [
+            game_state
+            for game_state in self.game_states.values()
+            if _count_humans(game_state) < self.max_players_per_room
+        ]
+        if not candidates:
+            if len(self.game_states) >= self.max_rooms:
+                raise JoinError("All rooms are full")
+            return self.create_room()
+
+        return max(candidates, key=_count_humans)
+
+    async def join(self, name: str, options=None) -> Tuple[int, str]:
+        """Add a human player to a room.
+
+        The stream options are kept on the player's connection by the caller, as the
+        rooms are published from this process.
+
+        Returns the room id and the player id, raises JoinError if the player can't
+        be added.
+        """
+        if any(
+            game_state.players.get_by_name(name)
+            for game_state in self.game_states.values()
+        ):
+            raise JoinError("Name already taken")
+
+        game_state = self._choose_room()
+        player_id = add_player(game_state, name, False)
+        self._player_rooms[player_id] = game_state.id
+        return game_state.id, player_id
+
+    def leave(self, player_id: str):
+        """Remove a player that left the game from its room."""
+        game_state = self.game_states.get(self._player_rooms.pop(player_id, None))
+        if game_state:
+            game_state.players.remove(player_id)
+
+    def get_player_room(self, player_id: str) -> Optional[GameState]:
+        """Get the room a player joined."""
+        room_id = self._player_rooms.get(player_id)
+        if room_id is None:
+            return None
+        return self.game_states.get(room_id)
+
+    def steer_player(self, player_id: str, angle: float) -> bool:
+        """Route a client's steering input to the player in its room.
+
+        Returns False if the player is not in any room.
+        """
+        game_state = self.get_player_room(player_id)
+        if not game_state:
+            return False
+
+        player = game_state.players.get(player_id)
+        if not player:
+            return False
+
+        steer_player(player, angle)
+        return True
+
+    def acknowledge_tick(self, player_id: str, tick: int):
+        """Record the last tick a player's client applied, for state deltas."""
+        conn = self.app["connections"].get_by_player_id(player_id)
+        if conn and (conn.ack_tick is None or tick > conn.ack_tick):
+            conn.ack_tick = tick
+
+    def load(self) -> RoomsLoad:
+        """Summarise the load of all rooms."""
+        load = RoomsLoad(rooms=len(self.game_states))
+        for game_state in self.game_states.values():
+            load.players += len(game_state.players)
+            load.humans += _count_humans(game_state)
+
+        for scheduler in self._schedulers.values():
+            load.tick_overruns += scheduler.stats.overruns
+            load.tick_lateness = max(load.tick_lateness, scheduler.stats.last_lateness)
+        for planner in self._planners.values():
+            load.bot_planning_time = max(
+                load.bot_planning_time, planner.stats.last_planning_time
+            )
+            load.bot_planning_backlog += planner.stats.backlog
+
+        return load
+
+
+def create_room_manager(app) -> RoomManager:
+    """Create a room manager configured from the app settings."""
+    settings = app["SETTINGS"]
+    return RoomManager(
+        app,
+        max_players_per_room=settings.ROOM_MAX_PLAYERS,
+        min_rooms=settings.ROOM_MIN_COUNT,
+        max_rooms=settings.ROOM_MAX_COUNT,
+        tick_overrun_policy=settings.TICK_OVERRUN_POLICY,
+        tick_max_catch_up=settings.TICK_MAX_CATCH_UP,
+        bot_planning_budget=settings.BOT_PLANNING_BUDGET,
+        bot_far_distance=settings.BOT_FAR_DISTANCE,
+        bot_far_plan_interval=settings.BOT_FAR_PLAN_INTERVAL,
+        bot_planning_threads=settings.BOT_PLANNING_THREADS,
+        apple_magnet_radius=settings.APPLE_MAGNET_RADIUS,
+    )
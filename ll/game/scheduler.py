@@ -0,0 +1,116 @@
+import asyncio
+import dataclasses
+import math
+from enum import Enum
+from typing import Callable, Optional
+
+from structlog import get_logger
+
+logger = get_logger(__name__)
+
+
+class OverrunPolicy(Enum):
+    # run the missed ticks back-to-back until the schedule is caught up
+    CATCH_UP = "catch_up"
+    # drop the missed ticks and realign to the next deadline on the grid
+    SKIP = "skip"
+
+
+@dataclasses.dataclass
+class TickStats:
+    """Timing statistics for a tick scheduler."""
+
+    ticks: int = 0
+    # number of ticks that started a full tick period (or more) late
+    overruns: int = 0
+    # number of ticks dropped by the SKIP policy (or by exceeding the catch up limit)
+    skipped_ticks: int = 0
+    # seconds between the deadline of the last tick and the time it actually started
+    last_lateness: float = 0.0
+    max_lateness: float = 0.0
+
+
+class TickScheduler:
+    """Fixed-timestep scheduler targeting absolute deadlines on a monotonic clock.
+
+    Deadlines are computed from the previous deadline rather than from the time the
+    previous tick finished, so the time spent simulating and broadcasting does not
+    accumulate as drift. The tick period is passed in when scheduling each tick, so
+    changes to it (e.g. TICK_PERIOD_BOOST) take effect from the following tick.
+    """
+
+    def __init__(
+        self,
+        policy: OverrunPolicy = OverrunPolicy.SKIP,
+        max_catch_up_ticks: int = 3,
+        clock: Optional[Callable[[], float]] = None,
+    ):
+        self.policy = policy
+        self.max_catch_up_ticks = max_catch_up_ticks
+        self.stats = TickStats()
+        self._clock = clock or asyncio.get_running_loop().time
+        self._deadline: Optional[float] = None
+
+    def time(self) -> float:
+        return self._clock()
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """Deadline of the next tick on the scheduler clock."""
+        return self._deadline
+
+    def seconds_until_deadline(self) -> float:
+        if self._deadline is None:
+            return 0.0
+        return self._deadline - self.time()
+
+    def schedule_next(self, tick_period: float) -> float:
+        """Schedule the next tick one tick period after the current deadline."""
+        if self._deadline is None:
+            self._deadline = self.time() + tick_period
+        else:
+            self._deadline += tick_period
+        return self._deadline
+
+    def _handle_overrun(self, lateness: float, tick_period: float) -> float:
+        """Apply the overrun policy, returning the lateness of the realigned tick."""
+        self.stats.overruns += 1
+        missed_ticks = math.floor(lateness / tick_period)
+
+        if (
+            self.policy == OverrunPolicy.CATCH_UP
+            and missed_ticks <= self.max_catch_up_ticks
+        ):
+            # keep the deadline, the following ticks will run without sleeping
+            return lateness
+
+        self.stats.skipped_ticks += missed_ticks
+        self._deadline += missed_ticks * tick_period
+        logger.info(
+            "skipped ticks",
+            skipped_ticks=missed_ticks,
+            lateness=lateness,
+            policy=self.policy.value,
+        )
+        return lateness - missed_ticks * tick_period
+
+    async def wait_for_tick(self, tick_period: float) -> float:
+        """Sleep until the deadline of the next tick.
+
+        Returns the lateness of the tick in seconds.
+        """
+        if self._deadline is None:
+            self.schedule_next(tick_period)
+
+        delay = self.seconds_until_deadline()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        lateness = max(self.time() - self._deadline, 0.0)
+        if lateness >= tick_period:
+            lateness = self._handle_overrun(lateness, tick_period)
+
+        self.stats.ticks += 1
+        self.stats.last_lateness = lateness
+        self.stats.max_lateness = max(self.stats.max_lateness, lateness)
+        return lateness
@@ -1,24 +1,25 @@
-from .resources.game import MAP_SIZE, GameState
+from .placement import PLACEMENT_POLICY_MAP
+from .rooms import create_room_manager
+from .sharding import ShardedRoomManager
 
 
 def setup_game_states(app):
-    """Set up the game states."""
-    app["game_states"] = {}
+    """Set up the room manager, which owns the game states of all rooms.
 
-    # Just create a single game state for now
-    game_state = GameState(
-        id=1,
-        tick=0,
-        tick_period=1,
-        server_timestamp=0,
-        server_next_tick_time=0,
-        players=[],
-        consumables=[],
-        global_buffs=[],
-        map_bounds=[
-            [-MAP_SIZE, -MAP_SIZE],
-            [MAP_SIZE, MAP_SIZE],
-        ],
-    )
+    With ROOM_WORKERS set the rooms are simulated in worker processes, otherwise they
+    run in the event loop of the web server.
+    """
+    settings = app["SETTINGS"]
+    if settings.ROOM_WORKERS:
+        app["rooms"] = ShardedRoomManager(
+            app,
+            n_workers=settings.ROOM_WORKERS,
+            placement=PLACEMENT_POLICY_MAP[settings.ROOM_PLACEMENT_POLICY](),
+        )
+        return
 
-    app["game_states"][1] = game_state
+    rooms = create_room_manager(app)
+    rooms.create_room()
+
+    app["rooms"] = rooms
+    app["game_states"] = rooms.game_states
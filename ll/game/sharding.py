@@ -0,0 +1,440 @@
+import asyncio
+import functools
+import itertools
+import multiprocessing
+import queue
+import threading
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from structlog import get_logger
+
+from ..api.ws import ConnectionManager, StreamOptions
+from ..logger import setup_logging
+from .placement import WorkerLoad
+from .player import JoinError
+from .rooms import RoomsLoad, create_room_manager
+
+logger = get_logger(__name__)
+
+# seconds between the load reports sent by each worker
+LOAD_REPORT_INTERVAL = 5
+# seconds between sweeps for disconnected players in the main process
+DISCONNECT_SWEEP_INTERVAL = 1
+# seconds to wait for a worker to add a joining player
+JOIN_TIMEOUT = 10
+
+
+# put on the queue of a channel's sender thread to stop it
+_CLOSE = object()
+
+
+class _Channel:
+    """Send and receive the messages of a pipe from threads, off the event loop.
+
+    Pickling and writing to the pipe blocks when it's full, and reading a big message
+    takes a while, so neither happens on the loop: messages sent are queued for a
+    sender thread, and a receiver thread hands the messages it reads to `on_message`
+    on the loop, then None once the other end is closed. Without `on_message` the
+    channel only sends.
+    """
+
+    def __init__(self, conn, on_message: Optional[Callable] = None):
+        self.conn = conn
+        self.on_message = on_message
+        self.closed = False
+        self._loop = asyncio.get_running_loop()
+        self._outbox = queue.SimpleQueue()
+        self._sender = threading.Thread(target=self._send_all, daemon=True)
+        self._sender.start()
+        if on_message is not None:
+            threading.Thread(target=self._receive_all, daemon=True).start()
+
+    def send(self, message):
+        if not self.closed:
+            self._outbox.put(message)
+
+    def close(self):
+        """Stop the channel, once the messages already queued are sent."""
+        self.closed = True
+        self._outbox.put(_CLOSE)
+
+    def join(self, timeout: float = None):
+        """Wait for the messages queued before closing to be sent."""
+        self._sender.join(timeout)
+
+    def _send_all(self):
+        while True:
+            message = self._outbox.get()
+            if message is _CLOSE:
+                return
+            try:
+                self.conn.send(message)
+            except OSError:
+                return
+
+    def _receive_all(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                message = None
+            if self.closed:
+                return
+            try:
+                self._loop.call_soon_threadsafe(self.on_message, message)
+            except RuntimeError:
+                # the loop is closed
+                return
+            if message is None:
+                return
+
+
+class _Outbox:
+    """Batch the frames published by a worker, sending them once per loop iteration."""
+
+    def __init__(self, channel: _Channel):
+        self.channel = channel
+        self.frames = []
+
+    def put(self, player_id: str, frame):
+        if not self.frames:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.frames.append((player_id, frame))
+
+    def flush(self):
+        # a frame shared by many players is pickled once, as pickle memoizes objects
+        frames, self.frames = self.frames, []
+        self.channel.send(("frames", frames))
+
+
+class _RelaySocket:
+    """Stands in for the websocket of a player connected to the main process."""
+
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class _RelayConnection:
+    """Worker side connection of a player, sending its snapshots to the outbox.
+
+    The main process queues them on the player's real connection, so there is no need
+    for an outbound queue in the worker.
+    """
+
+    def __init__(self, player_id: str, outbox: _Outbox, options: StreamOptions):
+        self.ws = _RelaySocket()
+        self.player_id = player_id
+        self.outbox = outbox
+        self.options = options
+        self.ack_tick = None
+        self.keyframe_tick = None
+        self.interest = None
+        self.dropped_snapshots = 0
+
+    def send(self, frame):
+        self.outbox.put(self.player_id, frame)
+
+
+async def _report_load(app, channel: _Channel):
+    while True:
+        await asyncio.sleep(LOAD_REPORT_INTERVAL)
+        channel.send(("load", app["rooms"].load()))
+
+
+async def _join(
+    app,
+    channel: _Channel,
+    outbox: _Outbox,
+    request_id: int,
+    name: str,
+    options: StreamOptions,
+):
+    try:
+        room_id, player_id = await app["rooms"].join(name)
+    except JoinError as e:
+        channel.send(("join_failed", request_id, str(e)))
+        return
+    except Exception as e:
+        # the main process is waiting for an answer either way
+        logger.error("join failed", error=e)
+        channel.send(("join_failed", request_id, "Couldn't join a room"))
+        return
+
+    app["connections"].add(_RelayConnection(player_id, outbox, options))
+    channel.send(("joined", request_id, room_id, player_id))
+
+
+async def _worker_main(worker_id: int, conn, settings):
+    loop = asyncio.get_running_loop()
+    app = {"SETTINGS": settings, "connections": ConnectionManager()}
+    rooms = create_room_manager(app)
+    app["rooms"] = rooms
+    app["game_states"] = rooms.game_states
+    rooms.start()
+
+    stopped = loop.create_future()
+
+    def on_message(message):
+        if message is None:
+            # the main process is gone
+            message = ("stop",)
+
+        kind = message[0]
+        if kind == "join":
+            loop.create_task(_join(app, channel, outbox, *message[1:]))
+        elif kind == "steer":
+            rooms.steer_player(*message[1:])
+        elif kind == "ack":
+            rooms.acknowledge_tick(*message[1:])
+        elif kind == "leave":
+            # the room's disconnect sweep removes the player
+            relay_conn = app["connections"].get_by_player_id(message[1])
+            if relay_conn:
+                relay_conn.ws.closed = True
+        elif kind == "stop" and not stopped.done():
+            stopped.set_result(None)
+
+    channel = _Channel(conn, on_message)
+    outbox = _Outbox(channel)
+    report_task = loop.create_task(_report_load(app, channel))
+    logger.info("room worker started", worker_id=worker_id)
+
+    await stopped
+
+    channel.close()
+    report_task.cancel()
+    await rooms.stop()
+    logger.info("room worker stopped", worker_id=worker_id)
+
+
+def run_room_worker(worker_id: int, conn, settings):
+    """Entry point of a room worker process."""
+    setup_logging(settings.LOG_LEVEL)
+    asyncio.run(_worker_main(worker_id, conn, settings))
+
+
+class _RoomWorker:
+    """Main process handle of a room worker process."""
+
+    def __init__(self, worker_id: int, process, conn, on_message: Callable):
+        self.process = process
+        self.channel = _Channel(conn, functools.partial(on_message, self))
+        self.load = WorkerLoad(worker_id=worker_id, load=RoomsLoad())
+
+    def send(self, message):
+        if self.load.alive:
+            self.channel.send(message)
+
+
+class _PendingJoin(NamedTuple):
+    worker: _RoomWorker
+    future: asyncio.Future
+    # the load the player was counted in when placed
+    load: RoomsLoad
+    name: str
+
+
+class ShardedRoomManager:
+    """Simulate rooms in worker processes, each running its own room manager.
+
+    The main process places joining players on a worker with the placement policy,
+    forwards client inputs to the worker that owns the player, and relays the encoded
+    snapshots sent back by the worker to the player's websocket. Names are unique
+    across the workers, the names of joined and joining players are taken.
+    """
+
+    def __init__(self, app, n_workers: int, placement):
+        self.app = app
+        self.n_workers = n_workers
+        self.placement = placement
+        self._workers: Dict[int, _RoomWorker] = {}
+        self._player_workers: Dict[str, _RoomWorker] = {}
+        self._pending_joins: Dict[int, _PendingJoin] = {}
+        self._player_names: Dict[str, str] = {}
+        self._request_ids = itertools.count()
+        self._sweep_task = None
+
+    @property
+    def loads(self):
+        """Get the last load reported by each worker."""
+        return [worker.load for worker in self._workers.values()]
+
+    def start(self):
+        """Start the worker processes."""
+        loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context("spawn")
+
+        for worker_id in range(self.n_workers):
+            conn, worker_conn = context.Pipe()
+            process = context.Process(
+                target=run_room_worker,
+                args=(worker_id, worker_conn, self.app["SETTINGS"]),
+                name=f"room-worker-{worker_id}",
+                daemon=True,
+            )
+            process.start()
+            worker_conn.close()
+
+            self._workers[worker_id] = _RoomWorker(
+                worker_id, process, conn, self._on_message
+            )
+
+        self._sweep_task = loop.create_task(self._sweep_disconnected_players())
+
+    async def stop(self):
+        """Stop the worker processes."""
+        loop = asyncio.get_running_loop()
+        if self._sweep_task:
+            self._sweep_task.cancel()
+
+        for worker in self._workers.values():
+            if not worker.load.alive:
+                continue
+
+            worker.send(("stop",))
+            worker.channel.close()
+            await loop.run_in_executor(None, worker.process.join, 5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.load.alive = False
+
+    def _on_worker_died(self, worker: _RoomWorker):
+        worker_id = worker.load.worker_id
+        logger.error("room worker died", worker_id=worker_id)
+        worker.channel.close()
+        worker.load.alive = False
+
+        for request_id, pending in list(self._pending_joins.items()):
+            if pending.worker is worker:
+                del self._pending_joins[request_id]
+                if not pending.future.done():
+                    pending.future.set_exception(JoinError("Room worker died"))
+
+        # close the sockets of the players on the worker so the clients rejoin
+        for player_id, player_worker in list(self._player_workers.items()):
+            if player_worker is worker:
+                del self._player_workers[player_id]
+                conn = self.app["connections"].get_by_player_id(player_id)
+                if conn:
+                    asyncio.create_task(conn.ws.close())
+
+    def _on_message(self, worker: _RoomWorker, message):
+        if message is None:
+            self._on_worker_died(worker)
+            return
+
+        kind = message[0]
+        if kind == "frames":
+            self._relay_frames(message[1])
+        elif kind == "joined":
+            _, request_id, room_id, player_id = message
+            pending = self._pending_joins.pop(request_id, None)
+            if pending is None or pending.future.done():
+                # nobody is waiting for the player anymore
+                worker.send(("leave", player_id))
+                return
+            self._player_workers[player_id] = worker
+            self._player_names[player_id] = pending.name
+            pending.future.set_result((room_id, player_id))
+        elif kind == "join_failed":
+            _, request_id, reason = message
+            pending = self._cancel_join(request_id)
+            if pending and not pending.future.done():
+                pending.future.set_exception(JoinError(reason))
+        elif kind == "load":
+            worker.load.load = message[1]
+            logger.info(
+                "room worker load",
+                worker_id=worker.load.worker_id,
+                rooms=worker.load.load.rooms,
+                players=worker.load.load.players,
+                humans=worker.load.load.humans,
+                tick_overruns=worker.load.load.tick_overruns,
+                tick_lateness=worker.load.load.tick_lateness,
+                bot_planning_time=worker.load.load.bot_planning_time,
+                bot_planning_backlog=worker.load.load.bot_planning_backlog,
+            )
+
+    def _cancel_join(self, request_id: int) -> Optional[_PendingJoin]:
+        """Forget a join that didn't add a player, uncounting it from its worker."""
+        pending = self._pending_joins.pop(request_id, None)
+        # unless the worker reported its load since
+        if pending and pending.worker.load.load is pending.load:
+            pending.load.humans -= 1
+        return pending
+
+    def _relay_frames(self, frames):
+        connections = self.app["connections"]
+        for player_id, frame in frames:
+            conn = connections.get_by_player_id(player_id)
+            if conn and not conn.ws.closed:
+                conn.send(frame)
+
+    async def _sweep_disconnected_players(self):
+        while True:
+            await asyncio.sleep(DISCONNECT_SWEEP_INTERVAL)
+            connections = self.app["connections"]
+            for conn in connections:
+                if conn.ws.closed:
+                    if conn.player_id:
+                        self.leave(conn.player_id)
+                    connections.remove(conn)
+
+    async def join(self, name: str, options: StreamOptions) -> Tuple[int, str]:
+        """Add a human player to a room on the worker chosen by the placement policy.
+
+        Returns the room id and the player id, raises JoinError if the player can't
+        be added.
+        """
+        if name in self._player_names.values() or any(
+            pending.name == name for pending in self._pending_joins.values()
+        ):
+            raise JoinError("Name already taken")
+        loads = [load for load in self.loads if load.alive]
+        if not loads:
+            raise JoinError("No room workers available")
+
+        load = self.placement.choose_worker(loads)
+        # count the player straight away, so a burst of joins is spread over the
+        # workers before they report their load again
+        load.load.humans += 1
+
+        worker = self._workers[load.worker_id]
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending_joins[request_id] = _PendingJoin(worker, future, load.load, name)
+        worker.send(("join", request_id, name, options))
+        try:
+            return await asyncio.wait_for(future, JOIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            # a player added after this is removed when the worker answers
+            self._cancel_join(request_id)
+            raise JoinError("Timed out joining a room")
+
+    def leave(self, player_id: str):
+        """Remove a player that left the game from its worker."""
+        self._player_names.pop(player_id, None)
+        worker = self._player_workers.pop(player_id, None)
+        if worker:
+            worker.send(("leave", player_id))
+
+    def steer_player(self, player_id: str, angle: float) -> bool:
+        """Forward a client's steering input to the worker that owns the player.
+
+        Returns False if the player is not on any worker.
+        """
+        worker = self._player_workers.get(player_id)
+        if not worker:
+            return False
+
+        worker.send(("steer", player_id, angle))
+        return True
+
+    def acknowledge_tick(self, player_id: str, tick: int):
+        """Forward the last tick a player's client applied to the player's worker."""
+        worker = self._player_workers.get(player_id)
+        if worker:
+            worker.send(("ack", player_id, tick))
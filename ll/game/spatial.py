@@ -0,0 +1,225 @@
+import itertools
+import math
+from collections import deque
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+# keeps float rounding at cell edges from ending a nearest search early
+NEAREST_SLACK = 0.000001
+
+
+class SpatialGrid:
+    """Uniform spatial hash grid of points, for finding the items near a point.
+
+    Items are bucketed by the cell their position falls in, and are added, moved and
+    removed incrementally by key, so the grid never has to be rebuilt.
+    """
+
+    def __init__(self, cell_size: float, position: Callable[[Any], List[float]]):
+        self.cell_size = cell_size
+        self.position = position
+        self._cells: Dict[Tuple[int, int], Dict[Hashable, Any]] = {}
+        self._item_cells: Dict[Hashable, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._item_cells)
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def insert(self, key: Hashable, item):
+        cell = self._cell(*self.position(item))
+        self._cells.setdefault(cell, {})[key] = item
+        self._item_cells[key] = cell
+
+    def remove(self, key: Hashable):
+        cell = self._item_cells.pop(key, None)
+        if cell is None:
+            return
+
+        items = self._cells[cell]
+        del items[key]
+        if not items:
+            del self._cells[cell]
+
+    def move(self, key: Hashable, item):
+        """Update the cell of an item after its position changed."""
+        cell = self._cell(*self.position(item))
+        if self._item_cells.get(key) != cell:
+            self.remove(key)
+            self._cells.setdefault(cell, {})[key] = item
+            self._item_cells[key] = cell
+
+    def candidates(self, x: float, y: float, radius: float) -> Iterator[Any]:
+        """Yield the items in the cells overlapping the square around a circle."""
+        min_cx, min_cy = self._cell(x - radius, y - radius)
+        max_cx, max_cy = self._cell(x + radius, y + radius)
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(self._cells):
+            # a large circle, it's quicker to go through the cells with items
+            for (cx, cy), items in self._cells.items():
+                if min_cx <= cx <= max_cx and min_cy <= cy <= max_cy:
+                    yield from items.values()
+            return
+
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                items = self._cells.get((cx, cy))
+                if items:
+                    yield from items.values()
+
+    def query(self, x: float, y: float, radius: float) -> Iterator[Tuple[Any, float]]:
+        """Yield the items within a radius of a point, with their distance."""
+        for item in self.candidates(x, y, radius):
+            item_x, item_y = self.position(item)
+            distance = math.hypot(item_x - x, item_y - y)
+            if distance <= radius:
+                yield item, distance
+
+    def _ring(self, cx: int, cy: int, ring: int) -> Iterator[Tuple[int, int]]:
+        """Yield the cells at a Chebyshev distance of `ring` cells from a cell."""
+        if ring == 0:
+            yield cx, cy
+            return
+        for dx in range(-ring, ring + 1):
+            yield cx + dx, cy - ring
+            yield cx + dx, cy + ring
+        for dy in range(-ring + 1, ring):
+            yield cx - ring, cy + dy
+            yield cx + ring, cy + dy
+
+    def nearest(
+        self, x: float, y: float, key: Callable[[Any], Optional[tuple]]
+    ) -> Optional[Any]:
+        """Find the item with the smallest key, searching rings of cells outwards.
+
+        `key` returns None for items to skip, or a tuple starting with the distance of
+        the item from the point, so the search stops once no cell left can hold a
+        closer item.
+        """
+        cx, cy = self._cell(x, y)
+        size = self.cell_size
+        best, best_key = None, None
+        visited = 0
+        ring = 0
+        while visited < len(self._item_cells):
+            for cell in self._ring(cx, cy, ring):
+                items = self._cells.get(cell)
+                if not items:
+                    continue
+                visited += len(items)
+                for item in items.values():
+                    item_key = key(item)
+                    if item_key is not None and (
+                        best_key is None or item_key < best_key
+                    ):
+                        best, best_key = item, item_key
+
+            # the distance from the point to the closest cell not searched yet
+            reach = min(
+                x - (cx - ring) * size,
+                (cx + ring + 1) * size - x,
+                y - (cy - ring) * size,
+                (cy + ring + 1) * size - y,
+            )
+            if best_key is not None and best_key[0] < reach - NEAREST_SLACK:
+                break
+            ring += 1
+        return best
+
+
+class SegmentGrid:
+    """Uniform grid of the segments of the snakes, for broad-phase collision checks.
+
+    Each segment is bucketed in every cell its bounding box overlaps, so segments that
+    intersect always share a cell. Snakes only gain a head segment and lose tail
+    segments from one tick to the next, so `sync` only updates the ends of a snake,
+    found by the numbers of the steps of its body.
+    """
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self._cells: Dict[Tuple[int, int], Dict[int, tuple]] = {}
+        # player id -> (body when last synced, number of the step of its first
+        # segment, number of the step after its head, (key, step, next step) of its
+        # segments)
+        self._players: Dict[str, Tuple[Any, int, int, deque]] = {}
+        self._keys = itertools.count()
+
+    def __len__(self) -> int:
+        return sum(len(segments) for *_, segments in self._players.values())
+
+    def _cell_range(self, a: List[float], b: List[float]) -> Iterator[Tuple[int, int]]:
+        min_cx = math.floor(min(a[0], b[0]) / self.cell_size)
+        max_cx = math.floor(max(a[0], b[0]) / self.cell_size)
+        min_cy = math.floor(min(a[1], b[1]) / self.cell_size)
+        max_cy = math.floor(max(a[1], b[1]) / self.cell_size)
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                yield cx, cy
+
+    def _insert(self, player, step1, step2) -> tuple:
+        key = next(self._keys)
+        segment = (player, step1, step2)
+        for cell in self._cell_range(step1, step2):
+            self._cells.setdefault(cell, {})[key] = segment
+        return key, step1, step2
+
+    def _remove(self, key: int, step1, step2):
+        for cell in self._cell_range(step1, step2):
+            items = self._cells[cell]
+            del items[key]
+            if not items:
+                del self._cells[cell]
+
+    def sync(self, player):
+        """Update the segments of a player to match its steps."""
+        body = player.steps
+        synced = self._players.get(player.id)
+        if synced is None or synced[0] is not body:
+            # a new player, or one whose body was replaced
+            if synced is not None:
+                self.remove_player(player.id)
+            segments = deque(
+                self._insert(player, step1, step2) for step1, step2 in body.segments()
+            )
+            self._players[player.id] = (body, body.start, body.end, segments)
+            return
+
+        _, first, end, segments = synced
+        if first == body.start and end == body.end:
+            return
+
+        # the segments of the steps trimmed off the tail
+        while segments and first < body.start:
+            self._remove(*segments.popleft())
+            first += 1
+        if not segments:
+            first = body.start
+        # the segments of the steps pushed at the head
+        segments.extend(
+            self._insert(player, step1, step2)
+            for step1, step2 in body.segments(first + len(segments))
+        )
+        self._players[player.id] = (body, first, body.end, segments)
+
+    def remove_player(self, player_id: str):
+        synced = self._players.pop(player_id, None)
+        if synced is not None:
+            for segment in synced[-1]:
+                self._remove(*segment)
+
+    def sync_players(self, players):
+        """Update the segments of all players, forgetting the ones that left."""
+        player_ids = {player.id for player in players}
+        for player_id in [p for p in self._players if p not in player_ids]:
+            self.remove_player(player_id)
+        for player in players:
+            self.sync(player)
+
+    def candidates(self, a: List[float], b: List[float]) -> Iterator[tuple]:
+        """Yield the (player, step, next step) segments that may intersect a segment."""
+        seen = set()
+        for cell in self._cell_range(a, b):
+            for key, segment in self._cells.get(cell, {}).items():
+                if key not in seen:
+                    seen.add(key)
+                    yield segment
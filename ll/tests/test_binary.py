@@ -0,0 +1,115 @@
+import json
+import struct
+
+import pytest
+
+from ll.api.messages.binary import BinaryDecodeError, decode_message, encode_message
+from ll.api.messages.resources import (
+    ClientUpdate,
+    JoinRequest,
+    MessageType,
+    MessageWrapper,
+)
+from ll.api.ws import WireEncoding
+from ll.game.delta import SnapshotHistory, format_gamestate_ws_delta
+from ll.game.loop import format_gamestate_ws_update, spawn_consumables
+from ll.game.player import add_player, take_player_steps
+from ll.game.rooms import RoomManager
+
+
+def _to_float32(value):
+    """Round the floats of a JSON message the way the binary protocol packs them."""
+    if isinstance(value, float):
+        return struct.unpack("<f", struct.pack("<f", value))[0]
+    if isinstance(value, list):
+        return [_to_float32(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _to_float32(v) for k, v in value.items()}
+    return value
+
+
+def _create_room():
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    for name in ["first", "second"]:
+        add_player(game_state, name, False)
+    spawn_consumables(game_state)
+    return game_state
+
+
+def test_binary_state_update_decodes_to_json_state_update():
+    game_state = _create_room()
+    for tick in range(1, 4):
+        game_state.tick = tick
+        take_player_steps(game_state)
+
+    frame = format_gamestate_ws_update(game_state, encoding=WireEncoding.BINARY)
+    text = format_gamestate_ws_update(game_state)
+
+    assert isinstance(frame, bytes)
+    assert len(frame) < len(text) / 2
+    assert json.loads(decode_message(frame).json()) == _to_float32(json.loads(text))
+
+
+def test_binary_state_delta_decodes_to_json_state_delta():
+    game_state = _create_room()
+    history = SnapshotHistory()
+    base = history.record(game_state)
+    game_state.tick = 1
+    take_player_steps(game_state)
+    game_state.consumables.remove(list(game_state.consumables)[-1].uid)
+    current = history.record(game_state)
+
+    frame = format_gamestate_ws_delta(
+        game_state, base, current, encoding=WireEncoding.BINARY
+    )
+    text = format_gamestate_ws_delta(game_state, base, current)
+
+    assert json.loads(decode_message(frame).json()) == _to_float32(json.loads(text))
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        ClientUpdate(tick=12, player_id="player", angle=0.5, ack_tick=11),
+        ClientUpdate(tick=12, player_id="player", angle=0.5),
+        JoinRequest(
+            name="lizard",
+            color=[1, 2, 3],
+            delta_updates=True,
+            encoding=WireEncoding.BINARY,
+        ),
+    ],
+)
+def test_client_messages_round_trip(payload):
+    message_type = (
+        MessageType.CLIENT_UPDATE
+        if isinstance(payload, ClientUpdate)
+        else MessageType.JOIN_REQUEST
+    )
+    message = MessageWrapper(type=message_type, payload=payload)
+
+    assert decode_message(encode_message(message)) == message
+
+
+def test_malformed_frames_are_rejected():
+    frame = encode_message(
+        MessageWrapper(
+            type=MessageType.CLIENT_UPDATE,
+            payload=ClientUpdate(tick=1, player_id="player", angle=0.0),
+        )
+    )
+
+    for data in [frame[:-1], frame + b"\0", b"\x63" + frame[1:]]:
+        with pytest.raises(BinaryDecodeError):
+            decode_message(data)
+
+
+def test_strings_too_long_for_their_length_are_clipped():
+    game_state = _create_room()
+    # a name the join requests reject, with a character cut by the clipping
+    list(game_state.players)[0].name = "a" + "é" * 40000
+
+    frame = format_gamestate_ws_update(game_state, encoding=WireEncoding.BINARY)
+    name = decode_message(frame).payload.players[0].name
+
+    assert name == "a" + "é" * 32767
@@ -0,0 +1,61 @@
+import math
+import random
+
+import pytest
+
+from ll.game import bot
+from ll.game.intersect import lines_intersect, normalize_angle
+from ll.game.player import add_player
+from ll.game.resources.body import SnakeBody
+from ll.game.rooms import RoomManager
+
+
+def _lock_angle_one_by_one(player, game_state, angle):
+    """Try the angles one at a time, against every segment of every player."""
+    segments = [
+        segment for other in game_state.players for segment in other.steps.segments()
+    ]
+    for _ in range(bot.COLLISION_AVOIDANCE_ATTEMPTS + 1):
+        end = bot._calculate_next_step(player, angle)
+        if not any(
+            lines_intersect(player.steps.head, end, *segment) for segment in segments
+        ):
+            return angle
+        last_angle = angle
+        angle = normalize_angle(angle + bot.COLLISION_AVOIDANCE_TURN)
+    return last_angle
+
+
+@pytest.mark.parametrize("batch_pairs", [0, 10**9])
+def test_cornered_bots_choose_the_same_angle_as_trying_one_by_one(
+    monkeypatch, batch_pairs
+):
+    monkeypatch.setattr(bot, "BATCH_COLLISION_CHECK_PAIRS", batch_pairs)
+    rng = random.Random(2)
+    turned = 0
+
+    for _ in range(30):
+        game_state = RoomManager({}, max_players_per_room=8).create_room()
+        player = game_state.players.get(add_player(game_state, "bot", True))
+        length = player.step_length
+        player.steps = SnakeBody([(100.0, 100.0), (100.0 + length, 100.0)])
+        # snakes winding around the head of the bot
+        for i in range(3):
+            snake = game_state.players.get(add_player(game_state, f"snake {i}", False))
+            x, y = rng.uniform(0, 300), rng.uniform(0, 300)
+            angle = rng.uniform(-math.pi, math.pi)
+            snake.steps = SnakeBody()
+            for _ in range(rng.choice([20, 100, 300])):
+                angle += rng.uniform(-0.8, 0.8)
+                x = min(max(x + length * math.cos(angle), -100), 400)
+                y = min(max(y + length * math.sin(angle), -100), 400)
+                snake.steps.push(x, y)
+        game_state.segments.sync_players(game_state.players)
+
+        angle = rng.uniform(-math.pi, math.pi)
+        chosen = bot._lock_angle_to_non_colliding_angle(player, game_state, angle)
+
+        assert chosen == _lock_angle_one_by_one(player, game_state, angle)
+        turned += chosen != angle
+
+    assert turned >= 5
@@ -0,0 +1,183 @@
+import random
+
+import pytest
+
+from ll.game import buffs
+from ll.game.player import _is_ghost, add_player, kick_player, take_player_steps
+from ll.game.resources.body import SnakeBody
+from ll.game.resources.buffs import (
+    BUFF_DEFINITIONS,
+    BUFF_FLAGS,
+    Buff,
+    BuffApplicationFrequency,
+    BuffApplicationTime,
+    BuffSchedule,
+    BuffType,
+)
+from ll.game.resources.consumables import Consumable, ConsumableType
+from ll.game.rooms import RoomManager
+
+
+def _apply_and_decay_buffs_by_scanning(game_state, application_time):
+    """Apply and decay buffs by visiting every buff, the way it was done each tick."""
+    for player in game_state.players:
+        for buff in player.buffs:
+            if buff.definition.application_time == application_time:
+                buff.duration_remaining -= 1
+                if buff.duration_remaining < 0:
+                    buffs.BUFF_UNAPPLY_MAP[buff.type](game_state, player)
+        player.buffs = [b for b in player.buffs if b.duration_remaining >= 0]
+    for buff in game_state.global_buffs:
+        if buff.definition.application_time == application_time:
+            buff.duration_remaining -= 1
+            if buff.duration_remaining < 0:
+                buffs.BUFF_UNAPPLY_MAP[buff.type](game_state, None)
+    game_state.global_buffs = [
+        b for b in game_state.global_buffs if b.duration_remaining >= 0
+    ]
+
+    magnets = []
+    holders = [(p, p.buffs) for p in game_state.players]
+    for player, held in holders + [(None, game_state.global_buffs)]:
+        if player is None and magnets:
+            buffs.move_apples(game_state, magnets)
+        for buff in held:
+            definition = buff.definition
+            if (
+                definition.application_frequency == BuffApplicationFrequency.ONCE
+                and buff.is_applied
+            ) or definition.application_time != application_time:
+                continue
+            if buff.type in buffs.MAGNET_BUFFS:
+                magnets.append((player, buffs.MAGNET_BUFFS[buff.type]))
+            else:
+                buffs.BUFF_APPLY_MAP[buff.type](game_state, player)
+            buff.is_applied = True
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Record the buffs applied, unapplied and the magnets moving apples."""
+    calls = []
+
+    def recorder(kind, buff_type):
+        def record(game_state, player):
+            calls.append((kind, buff_type, player and player.name))
+
+        return record
+
+    for buff_type in BUFF_DEFINITIONS:
+        monkeypatch.setitem(buffs.BUFF_APPLY_MAP, buff_type, recorder("+", buff_type))
+        monkeypatch.setitem(buffs.BUFF_UNAPPLY_MAP, buff_type, recorder("-", buff_type))
+    monkeypatch.setattr(
+        buffs,
+        "move_apples",
+        lambda game_state, magnets: calls.append(
+            ("magnets", tuple((p.name, repel) for p, repel in magnets))
+        ),
+    )
+    return calls
+
+
+def _run(apply_and_decay_buffs, calls, scheduled):
+    rng = random.Random(6)
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    for i in range(5):
+        add_player(game_state, f"player {i}", i % 2 == 0)
+    ticks = []
+
+    for tick in range(120):
+        calls.clear()
+        apply_and_decay_buffs(game_state, BuffApplicationTime.PRE_STEP)
+        # buffs picked up in the step
+        for _ in range(rng.choice([0, 0, 1, 3])):
+            definition = rng.choice(list(BUFF_DEFINITIONS.values()))
+            player = rng.choice(list(game_state.players))
+            buff = Buff(
+                type=definition.type,
+                friendly_name=definition.friendly_name,
+                is_debuff=definition.is_debuff,
+                is_applied=False,
+                duration=definition.default_duration,
+                duration_remaining=definition.default_duration,
+            )
+            if definition.applies_globally:
+                player = None
+                game_state.global_buffs.append(buff)
+            else:
+                player.buffs.append(buff)
+            if scheduled:
+                game_state.buff_schedule.add(buff, player)
+        if tick % 40 == 20:
+            kick_player(game_state, rng.choice(list(game_state.players)).id)
+            add_player(game_state, f"joined {tick}", False)
+        apply_and_decay_buffs(game_state, BuffApplicationTime.POST_STEP)
+
+        visible = [
+            (p.name, [(b.type, b.duration_remaining, b.is_applied) for b in p.buffs])
+            for p in game_state.players
+        ]
+        global_buffs = [(b.type, b.duration_remaining) for b in game_state.global_buffs]
+        ticks.append((list(calls), visible, global_buffs))
+    return ticks
+
+
+def test_scheduled_buffs_apply_and_expire_like_scanning_every_buff(calls):
+    expected = _run(_apply_and_decay_buffs_by_scanning, calls, scheduled=False)
+    scheduled = _run(buffs.apply_and_decay_buffs, calls, scheduled=True)
+
+    assert scheduled == expected
+    assert any(kind == "-" for tick_calls, _, _ in expected for kind, *_ in tick_calls)
+
+
+def test_buff_flags_follow_the_buffs_picked_up_and_expired():
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    player = game_state.players.get(add_player(game_state, "ghost", False))
+    player.steps = SnakeBody([(0.0, 0.0)])
+    player.angle = 0.0
+    # two stones, the second eaten the tick after the first
+    for x in [1, 2]:
+        game_state.consumables.extend(
+            [
+                Consumable(
+                    type=ConsumableType.STONE,
+                    coordinates=[x * player.step_length, 0.0],
+                    size=10,
+                    color=[0],
+                    uid=game_state.consumables.next_uid(),
+                )
+            ]
+        )
+
+    ghost_ticks = []
+    for _ in range(12):
+        take_player_steps(game_state)
+        buffs.apply_and_decay_buffs(game_state, BuffApplicationTime.POST_STEP)
+        assert player.buff_flags == sum({BUFF_FLAGS[b.type] for b in player.buffs})
+        ghost_ticks.append(_is_ghost(player))
+
+    duration = BUFF_DEFINITIONS[BuffType.GHOST].default_duration
+    assert ghost_ticks == [True] * (duration + 1) + [False] * (11 - duration)
+
+
+def test_remaining_durations_follow_the_passes_without_being_written():
+    schedule = BuffSchedule()
+    definition = BUFF_DEFINITIONS[BuffType.APPLE_MAGNET]
+    buff = Buff(
+        type=definition.type,
+        friendly_name=definition.friendly_name,
+        is_debuff=definition.is_debuff,
+        is_applied=False,
+        duration=definition.default_duration,
+        duration_remaining=3,
+    )
+    schedule.add(buff)
+    expires_in = buff.expires_in
+
+    remaining = []
+    for _ in range(4):
+        expired, _ = schedule.start_pass(definition.application_time)
+        remaining.append((buff.duration_remaining, bool(expired)))
+
+    assert remaining == [(2, False), (1, False), (0, False), (-1, True)]
+    assert buff.expires_in == expires_in
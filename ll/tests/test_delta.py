@@ -0,0 +1,72 @@
+import json
+
+from ll.game.delta import SnapshotHistory, format_gamestate_ws_delta
+from ll.game.loop import format_gamestate_ws_update, spawn_consumables
+from ll.game.player import add_player, kick_player, take_player_steps
+from ll.game.rooms import RoomManager
+
+
+def _apply_delta(state: dict, delta: dict) -> dict:
+    """Apply a state delta the way a client would."""
+    players = {p["id"]: p for p in state["players"]}
+    for player_id in delta["playersRemoved"]:
+        del players[player_id]
+
+    updated_players = []
+    for player_delta in delta["playersUpdated"]:
+        base_steps = players.get(player_delta["id"], {"steps": []})["steps"]
+        updated_players.append(
+            {
+                "name": player_delta["name"],
+                "id": player_delta["id"],
+                "color": player_delta["color"],
+                "steps": base_steps[player_delta["removedSteps"] :]
+                + player_delta["addedSteps"],
+                "step_length": player_delta["stepLength"],
+                "buffs": player_delta["buffs"],
+                "spawned": player_delta["spawned"],
+                "step_fov": player_delta["stepFov"],
+                "is_bot": player_delta["isBot"],
+                "angle": player_delta["angle"],
+            }
+        )
+    players.update({p["id"]: p for p in updated_players})
+
+    consumables = {c["uid"]: c for c in state["consumables"]}
+    for uid in delta["consumablesRemoved"]:
+        del consumables[uid]
+    consumables.update({c["uid"]: c for c in delta["consumablesUpdated"]})
+
+    return {"players": players, "consumables": consumables}
+
+
+def test_delta_applied_to_base_matches_state_update():
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    for name in ["first", "second", "third"]:
+        add_player(game_state, name, False)
+    spawn_consumables(game_state)
+
+    history = SnapshotHistory()
+    base = history.record(game_state)
+    base_state = json.loads(format_gamestate_ws_update(game_state))["payload"]
+
+    for tick in range(1, 6):
+        game_state.tick = tick
+        take_player_steps(game_state)
+        spawn_consumables(game_state)
+    kick_player(game_state, list(game_state.players)[-1].id)
+    add_player(game_state, "fourth", False)
+    consumables = list(game_state.consumables)
+    game_state.consumables.remove(consumables[-1].uid)
+    consumables[0].coordinates = [1.0, 2.0]
+
+    current = history.record(game_state)
+    delta = json.loads(format_gamestate_ws_delta(game_state, base, current))
+    state = json.loads(format_gamestate_ws_update(game_state))["payload"]
+
+    assert delta["type"] == "state_delta"
+    assert delta["payload"]["baseTick"] == 0
+    assert _apply_delta(base_state, delta["payload"]) == {
+        "players": {p["id"]: p for p in state["players"]},
+        "consumables": {c["uid"]: c for c in state["consumables"]},
+    }
@@ -0,0 +1,151 @@
+import math
+import random
+
+import pytest
+
+from ll.api.messages.resources import PlayerState
+from ll.game.buffs.effects import move_apples
+from ll.game.loop import spawn_consumables
+from ll.game.player import add_player, kick_player, take_player_steps
+from ll.game.resources.body import SnakeBody
+from ll.game.resources.consumables import (
+    CONSUMABLE_DEFINITIONS,
+    Consumable,
+    ConsumableType,
+)
+from ll.game.resources.game import MIN_CONSUMABLE_COUNT, GamePlayer
+from ll.game.rooms import RoomManager
+
+
+def test_player_store_keeps_order_indexes_and_counts():
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    ids = [
+        add_player(game_state, name, is_bot)
+        for name, is_bot in [("a", False), ("b", True), ("c", False), ("d", True)]
+    ]
+
+    kick_player(game_state, ids[1])
+    add_player(game_state, "b", True)
+
+    assert [p.name for p in game_state.players] == ["a", "c", "d", "b"]
+    assert [p.name for p in game_state.players.bots()] == ["d", "b"]
+    assert game_state.players.get(ids[2]).name == "c"
+    assert game_state.players.get_by_name("b").is_bot
+    assert game_state.players.get(ids[1]) is None
+    assert (game_state.players.n_humans, game_state.players.n_bots) == (2, 2)
+    with pytest.raises(ValueError):
+        add_player(game_state, "a", False)
+
+
+def test_snake_body_keeps_the_steps_of_a_list():
+    rng = random.Random(8)
+    body = SnakeBody(capacity=4)
+    steps = []
+
+    for i in range(200):
+        body.push(float(i), -float(i))
+        steps.append((float(i), -float(i)))
+        # snakes grow and shrink, past the capacity of the ring
+        max_steps = rng.randint(1, 12)
+        body.trim(max_steps)
+        steps = steps[-max_steps:]
+
+        assert list(body) == steps
+        assert body.head == steps[-1] and body[0] == steps[0]
+        assert body[-2:] == steps[-2:]
+        assert list(body.segments()) == list(zip(steps, steps[1:]))
+        assert (body.start, body.end) == (i + 1 - len(steps), i + 1)
+
+    player = GamePlayer(
+        name="snake",
+        id="1",
+        color=[0],
+        steps=body.copy(),
+        step_length=50,
+        buffs=[],
+        spawned=True,
+        step_fov=1.0,
+        is_bot=False,
+    )
+    dumped = PlayerState.model_validate(player).model_dump()
+    assert dumped["steps"] == [{"coordinates": step} for step in steps]
+    assert PlayerState(**dumped).steps == body
+
+
+def test_consumables_eaten_in_the_same_step_are_all_removed_and_refilled():
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    spawn_consumables(game_state)
+    player = game_state.players.get(add_player(game_state, "eater", False))
+    player.steps = SnakeBody([(0.0, 0.0)])
+    player.angle = 0.0
+    eaten = [
+        Consumable(
+            type=ConsumableType.STONE,
+            coordinates=[player.step_length, 0.0],
+            size=10,
+            color=[0],
+            uid=game_state.consumables.next_uid(),
+        )
+        for _ in range(3)
+    ]
+    game_state.consumables.extend(eaten)
+
+    take_player_steps(game_state)
+
+    assert not any(c.uid in game_state.consumables for c in eaten)
+    assert len(game_state.global_buffs) + len(player.buffs) >= 3
+    for definition in CONSUMABLE_DEFINITIONS:
+        assert game_state.consumables.count(definition.type) == len(
+            [c for c in game_state.consumables if c.type == definition.type]
+        )
+
+    spawn_consumables(game_state)
+    assert game_state.consumables.count(ConsumableType.STONE) == int(
+        CONSUMABLE_DEFINITIONS[-1].spawn_ratio * MIN_CONSUMABLE_COUNT
+    )
+
+
+def _move_apples_one_by_one(apples, magnets, radius):
+    for (x, y), repel in magnets:
+        for apple in apples:
+            dx, dy = x - apple[0], y - apple[1]
+            dist = math.sqrt(dx * dx + dy * dy)
+            if dist > radius:
+                continue
+            if dist < 15:
+                apple[:] = [x, y]
+            else:
+                sign = -1 if repel else 1
+                apple[:] = [
+                    apple[0] + sign * dx / dist * 15,
+                    apple[1] + sign * dy / dist * 15,
+                ]
+
+
+def test_magnets_move_the_apples_within_their_radius():
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    spawn_consumables(game_state)
+    consumables = list(game_state.consumables)
+    apples = [c for c in consumables if c.type == ConsumableType.APPLE]
+    magnets = []
+    for i, repel in enumerate([False, True, False]):
+        player = game_state.players.get(add_player(game_state, f"player {i}", False))
+        # next to an apple, with others around
+        x, y = apples[i * 20].coordinates
+        player.steps = SnakeBody([(x + 10, y)])
+        magnets.append((player, repel))
+
+    before = [list(c.coordinates) for c in consumables]
+    expected = [list(c.coordinates) for c in consumables]
+    _move_apples_one_by_one(
+        [e for e, c in zip(expected, consumables) if c.type == ConsumableType.APPLE],
+        [(p.steps.head, repel) for p, repel in magnets],
+        game_state.magnet_radius,
+    )
+    move_apples(game_state, magnets)
+
+    assert [c.coordinates for c in consumables] == [pytest.approx(e) for e in expected]
+    moved = [c.coordinates != b for c, b in zip(consumables, before)]
+    assert 0 < sum(moved) < len(apples)
+    for c in consumables:
+        assert c in [c for c, _ in game_state.consumables.near(*c.coordinates, 0)]
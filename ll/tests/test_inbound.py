@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+from ll.api.messages import handle_message
+from ll.api.messages.binary import decode_message, encode_message
+from ll.api.messages.inbound import MessageDecodeError, decode_client_message
+from ll.api.messages.resources import (
+    ClientUpdate,
+    ErrorCode,
+    ErrorResponse,
+    JoinRequest,
+    JoinResponse,
+    MessageType,
+    MessageWrapper,
+)
+
+CLIENT_UPDATE = {"tick": 12, "playerId": "player", "angle": 0.5, "ackTick": 11}
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        # the fast path, the way JSON.stringify writes it
+        {"type": "client_update", "payload": CLIENT_UPDATE},
+        # other fields in the wrapper
+        {"type": "client_update", "payload": CLIENT_UPDATE, "sentAt": 1},
+        {"payload": CLIENT_UPDATE, "type": "client_update"},
+    ],
+)
+@pytest.mark.parametrize("separators", [(",", ":"), (", ", ": ")])
+def test_client_updates_decode_with_and_without_the_fast_path(message, separators):
+    text = json.dumps(message, separators=separators)
+
+    assert decode_client_message(text) == (
+        MessageType.CLIENT_UPDATE,
+        ClientUpdate(tick=12, player_id="player", angle=0.5, ack_tick=11),
+    )
+
+
+def test_messages_decode_against_the_payload_of_their_type_only():
+    join_request = {"name": "lizard", "color": [1, 2, 3]}
+    text = json.dumps({"type": "join_request", "payload": join_request})
+
+    assert decode_client_message(text) == (
+        MessageType.JOIN_REQUEST,
+        JoinRequest(name="lizard", color=[1, 2, 3]),
+    )
+    # a join request isn't taken for a client update because its payload fits
+    with pytest.raises(MessageDecodeError) as error:
+        decode_client_message(
+            json.dumps({"type": "client_update", "payload": join_request})
+        )
+    assert error.value.code == ErrorCode.INVALID_PAYLOAD
+    assert error.value.reason == "payload.tick: Field required"
+
+
+@pytest.mark.parametrize(
+    "message, code",
+    [
+        ("not json", ErrorCode.MALFORMED_MESSAGE),
+        ("[1, 2]", ErrorCode.MALFORMED_MESSAGE),
+        ('{"payload": {}}', ErrorCode.MALFORMED_MESSAGE),
+        ('{"type": "dance", "payload": {}}', ErrorCode.UNSUPPORTED_MESSAGE_TYPE),
+        ('{"type": "state_update", "payload": {}}', ErrorCode.UNSUPPORTED_MESSAGE_TYPE),
+        ('{"type":"client_update","payload":{"tick":"a"}}', ErrorCode.INVALID_PAYLOAD),
+        (
+            json.dumps(
+                {"type": "join_request", "payload": {"name": "a" * 70000, "color": []}}
+            ),
+            ErrorCode.INVALID_PAYLOAD,
+        ),
+        (b"\x02\x63", ErrorCode.MALFORMED_MESSAGE),
+        (
+            encode_message(
+                MessageWrapper(
+                    type=MessageType.JOIN_RESPONSE,
+                    payload=JoinResponse(player_id=None, ok=False, reason=None),
+                )
+            ),
+            ErrorCode.UNSUPPORTED_MESSAGE_TYPE,
+        ),
+        (
+            encode_message(
+                MessageWrapper(
+                    type=MessageType.JOIN_REQUEST,
+                    payload=JoinRequest.model_construct(
+                        name="a" * 100, color=[], delta_updates=False
+                    ),
+                )
+            ),
+            ErrorCode.INVALID_PAYLOAD,
+        ),
+    ],
+)
+@pytest.mark.asyncio
+async def test_bad_messages_are_answered_with_an_error_response(message, code):
+    (response,) = await handle_message(None, message)
+
+    assert response.type == MessageType.ERROR
+    assert response.payload.code == code
+    # in the encoding of the message
+    if isinstance(message, bytes):
+        assert decode_message(encode_message(response)) == response
+    else:
+        assert json.loads(response.json())["payload"]["code"] == code.value
+
+
+def test_error_responses_round_trip_in_binary():
+    message = MessageWrapper(
+        type=MessageType.ERROR,
+        payload=ErrorResponse(code=ErrorCode.INVALID_PAYLOAD, reason="angle: nope"),
+    )
+
+    assert decode_message(encode_message(message)) == message
@@ -0,0 +1,111 @@
+import json
+from types import SimpleNamespace
+
+from ll.api.ws import ConnectionManager, SocketConnection, StreamOptions
+from ll.game.delta import SnapshotHistory, format_gamestate_ws_delta
+from ll.game.interest import InterestGrid, PlayerInterest
+from ll.game.loop import format_gamestate_ws_update, publish_state_to_connected_players
+from ll.game.player import add_player
+from ll.game.resources.body import SnakeBody
+from ll.game.resources.consumables import Consumable, ConsumableType
+from ll.game.rooms import RoomManager
+
+from .test_delta import _apply_delta
+from .test_ws import SlowSocket
+
+
+def _create_room():
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    viewer_id = add_player(game_state, "viewer", False)
+    game_state.players.get(viewer_id).steps = SnakeBody([(0.0, 0.0)])
+    for x in [50.0, 150.0, 500.0]:
+        game_state.consumables.add(
+            Consumable(
+                type=ConsumableType.APPLE, coordinates=[x, 0.0], size=10, color=[0]
+            )
+        )
+    return game_state
+
+
+def test_entities_leave_the_view_beyond_the_hysteresis_margin():
+    game_state = _create_room()
+    near, edge, far = game_state.consumables
+    interest = PlayerInterest(radius=100, hysteresis=0.6)
+
+    view = interest.update(0, InterestGrid(game_state), [0.0, 0.0])
+    assert view.consumable_uids == {near.uid}
+    assert view.player_ids == {game_state.players.get_by_name("viewer").id}
+
+    # entering needs the radius, once in view it stays until the leave radius
+    view = interest.update(1, InterestGrid(game_state), [60.0, 0.0])
+    assert view.consumable_uids == {near.uid, edge.uid}
+    view = interest.update(2, InterestGrid(game_state), [0.0, 0.0])
+    assert view.consumable_uids == {near.uid, edge.uid}
+    view = interest.update(3, InterestGrid(game_state), [-20.0, 0.0])
+    assert view.consumable_uids == {near.uid}
+    assert far.uid not in view.consumable_uids
+
+
+def test_delta_between_views_matches_state_update_of_view():
+    game_state = _create_room()
+    interest = PlayerInterest(radius=100, hysteresis=0.2)
+    history = SnapshotHistory()
+
+    base_view = interest.update(0, InterestGrid(game_state), [0.0, 0.0])
+    base = history.record(game_state)
+    base_state = json.loads(format_gamestate_ws_update(game_state, base_view))
+
+    game_state.tick = 1
+    game_state.players.get_by_name("viewer").steps.push(220.0, 0.0)
+    view = interest.update(1, InterestGrid(game_state), [220.0, 0.0])
+    current = history.record(game_state)
+    delta = json.loads(
+        format_gamestate_ws_delta(game_state, base, current, base_view, view)
+    )
+    state = json.loads(format_gamestate_ws_update(game_state, view))["payload"]
+
+    assert delta["payload"]["consumablesRemoved"] == [
+        list(game_state.consumables)[0].uid
+    ]
+    assert _apply_delta(base_state["payload"], delta["payload"]) == {
+        "players": {p["id"]: p for p in state["players"]},
+        "consumables": {c["uid"]: c for c in state["consumables"]},
+    }
+
+
+def test_delta_clients_with_different_base_views_get_their_own_frames():
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    apple = Consumable(
+        type=ConsumableType.APPLE, coordinates=[110.0, 0.0], size=10, color=[0]
+    )
+    game_state.consumables.add(apple)
+    connections = ConnectionManager()
+    app = {
+        "SETTINGS": SimpleNamespace(INTEREST_RADIUS=100, INTEREST_HYSTERESIS=0.5),
+        "connections": connections,
+    }
+    conns = {}
+    for name, x in [("first", 0.0), ("second", 130.0)]:
+        player_id = add_player(game_state, name, False)
+        game_state.players.get(player_id).steps = SnakeBody([(x, 0.0)])
+        conns[name] = SocketConnection(ws=SlowSocket(), connected_at=0)
+        connections.add(conns[name])
+        connections.assign_player(
+            conns[name].ws, player_id, StreamOptions(delta_updates=True)
+        )
+    history = SnapshotHistory()
+
+    # only the second player sees the apple, then both move away from it
+    game_state.tick = 1
+    publish_state_to_connected_players(app, game_state, history)
+    game_state.tick = 2
+    game_state.consumables.move(apple, [1000.0, 0.0])
+    game_state.players.get_by_name("second").steps = SnakeBody([(0.0, 0.0)])
+    for conn in conns.values():
+        conn.ack_tick = 1
+    publish_state_to_connected_players(app, game_state, history)
+
+    first, second = [json.loads(conn.outbox[-1]) for conn in conns.values()]
+    assert first["type"] == second["type"] == "state_delta"
+    assert first["payload"]["consumablesRemoved"] == []
+    assert second["payload"]["consumablesRemoved"] == [apple.uid]
@@ -0,0 +1,79 @@
+import random
+
+import numpy as np
+
+from ll.game.intersect import (
+    lines_intersect,
+    lines_intersect_batch,
+    point_inside_circle,
+    point_inside_circle_batch,
+    segments_cross_map_bounds,
+)
+
+
+def _random_segments(rng, n, coordinate):
+    return [[[coordinate(), coordinate()] for _ in range(4)] for _ in range(n)]
+
+
+def _scalar_lines_intersect(a1, a2, b1, b2):
+    """Run the scalar check, counting a zero length segment as not intersecting."""
+    try:
+        return lines_intersect(a1, a2, b1, b2)
+    except ZeroDivisionError:
+        return False
+
+
+def test_lines_intersect_batch_matches_scalar():
+    rng = random.Random(3)
+    # coarse integer coordinates make parallel, collinear and touching segments common
+    for coordinate in [lambda: rng.randint(-3, 3), lambda: rng.uniform(-100, 100)]:
+        segments = _random_segments(rng, 5000, coordinate)
+        expected = [_scalar_lines_intersect(*segment) for segment in segments]
+
+        a1, a2, b1, b2 = np.array(segments, dtype=float).transpose(1, 0, 2)
+        assert lines_intersect_batch(a1, a2, b1, b2).tolist() == expected
+
+    a1, a2 = [0.0, 0.0], [2.0, 2.0]
+    others = [[[1.0, 1.0], [3.0, 3.0]], [[2.0, 2.0], [3.0, 3.0]], [[0.0, 2.0], [2, 0]]]
+    b1, b2 = np.array(others).transpose(1, 0, 2)
+    assert lines_intersect_batch(a1, a2, b1, b2).tolist() == [
+        lines_intersect(a1, a2, *other) for other in others
+    ]
+
+
+def test_point_inside_circle_batch_matches_scalar():
+    rng = random.Random(5)
+    points = [[rng.uniform(-20, 20), rng.uniform(-20, 20)] for _ in range(1000)]
+    radii = [rng.choice([0, 5, 10.5]) for _ in range(1000)]
+
+    mask = point_inside_circle_batch(points, [1.0, -2.0], radii)
+
+    assert mask.tolist() == [
+        point_inside_circle(point, [1.0, -2.0], radius)
+        for point, radius in zip(points, radii)
+    ]
+    assert mask.any() and not mask.all()
+
+
+def test_segments_cross_map_bounds_matches_scalar():
+    rng = random.Random(9)
+    map_bounds = [[-10.0, -10.0], [10.0, 10.0]]
+    (min_x, min_y), (max_x, max_y) = map_bounds
+    edges = [
+        ((min_x, min_y), (min_x, max_y)),
+        ((max_x, min_y), (max_x, max_y)),
+        ((min_x, max_y), (max_x, max_y)),
+        ((min_x, min_y), (max_x, min_y)),
+    ]
+    segments = [
+        s[:2] for s in _random_segments(rng, 2000, lambda: rng.randint(-12, 12))
+    ]
+
+    mask = segments_cross_map_bounds(
+        [s[0] for s in segments], [s[1] for s in segments], map_bounds
+    )
+
+    assert mask.tolist() == [
+        any(lines_intersect(*edge, *segment) for edge in edges) for segment in segments
+    ]
+    assert mask.any() and not mask.all()
@@ -0,0 +1,186 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from ll.game import planner as planner_module
+from ll.game.bot import choose_bot_step_angles
+from ll.game.loop import spawn_consumables
+from ll.game.planner import BotPlanner
+from ll.game.player import add_player, take_player_steps
+from ll.game.rooms import RoomManager
+
+
+def _create_room(n_bots):
+    game_state = RoomManager({}, max_players_per_room=9).create_room()
+    add_player(game_state, "human", False)
+    for i in range(n_bots):
+        add_player(game_state, f"bot {i}", True)
+    spawn_consumables(game_state)
+    return game_state
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Make planning a bot take a second."""
+    clock = [0.0]
+    plan_bot_step = planner_module.plan_bot_step
+
+    def slow_plan_bot_step(*args):
+        clock[0] += 1
+        return plan_bot_step(*args)
+
+    monkeypatch.setattr(planner_module, "plan_bot_step", slow_plan_bot_step)
+    return lambda: clock[0]
+
+
+def test_unlimited_planner_plans_like_choose_bot_step_angles():
+    game_state = _create_room(n_bots=6)
+    planner = BotPlanner(budget=float("inf"), far_plan_interval=1)
+
+    for _ in range(20):
+        game_state.tick += 1
+        bots = list(game_state.players.bots())
+        angles = [bot.angle for bot in bots]
+        planner.plan(game_state)
+        planned = [bot.angle for bot in bots]
+
+        for bot, angle in zip(bots, angles):
+            bot.angle = angle
+        choose_bot_step_angles(game_state)
+
+        assert planned == [bot.angle for bot in bots]
+        take_player_steps(game_state)
+        spawn_consumables(game_state)
+
+    assert planner.stats.plans == 6 * 20
+
+
+def test_bots_are_planned_in_turns_within_the_budget(clock, monkeypatch):
+    game_state = _create_room(n_bots=8)
+    planner = BotPlanner(budget=2.5, far_distance=10**9, clock=clock)
+    steered = []
+    steer_bot = planner_module.steer_bot
+
+    def recording_steer_bot(bot, game_state, target, avoid_collisions=True):
+        steered.append((bot.id, avoid_collisions))
+        steer_bot(bot, game_state, target, avoid_collisions)
+
+    monkeypatch.setattr(planner_module, "steer_bot", recording_steer_bot)
+
+    backlogs = []
+    for _ in range(3):
+        game_state.tick += 1
+        steered.clear()
+        planner.plan(game_state)
+        backlogs.append(planner.stats.backlog)
+
+    # each tick plans 3 bots, the ones without a target first
+    assert planner.stats.plans == 9
+    assert backlogs == [5, 5, 5]
+    assert planner.stats.max_staleness == 2
+    assert planner.stats.last_planning_time == 3
+    # the bots that weren't planned kept steering towards their targets
+    assert sorted(steered) == sorted(
+        (bot_id, False)
+        for bot_id, target in planner._targets.items()
+        if target and planner._planned_at[bot_id] < game_state.tick
+    )
+
+    # a bot whose target is gone is planned before the others
+    bot_id, target_uid = list(planner._targets.items())[-1]
+    game_state.consumables.remove(target_uid)
+    game_state.tick += 1
+    planner.plan(game_state)
+    assert planner._planned_at[bot_id] == game_state.tick
+
+
+def test_bots_far_from_humans_are_planned_less_often():
+    game_state = _create_room(n_bots=4)
+    planner = BotPlanner(budget=float("inf"), far_distance=0, far_plan_interval=3)
+
+    plans = []
+    for _ in range(7):
+        game_state.tick += 1
+        before = planner.stats.plans
+        planner.plan(game_state)
+        plans.append(planner.stats.plans - before)
+
+    assert plans == [4, 0, 0, 4, 0, 0, 4]
+
+
+class ManualExecutor:
+    """An executor whose work only runs when the test says so."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.submitted.append((future, fn, args))
+        return future
+
+    def run(self):
+        future, fn, args = self.submitted[-1]
+        future.set_result(fn(*args))
+
+
+def test_bots_planned_off_the_loop_get_the_angles_of_planning_in_the_tick():
+    game_state = _create_room(n_bots=6)
+    inline = BotPlanner(budget=float("inf"), far_plan_interval=1)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        planner = BotPlanner(
+            budget=float("inf"), far_plan_interval=1, executor=executor
+        )
+        for _ in range(10):
+            bots = list(game_state.players.bots())
+            angles = [bot.angle for bot in bots]
+            planner.plan_ahead(game_state)
+            planner._pending.result()
+            # the bots are planned from a copy of the room
+            assert [bot.angle for bot in bots] == angles
+
+            game_state.tick += 1
+            inline.plan(game_state)
+            expected = [bot.angle for bot in bots]
+            for bot, angle in zip(bots, angles):
+                bot.angle = angle
+
+            planner.plan(game_state)
+            assert [bot.angle for bot in bots] == expected
+            take_player_steps(game_state)
+            spawn_consumables(game_state)
+
+    assert planner.stats.plans == inline.stats.plans
+    assert planner.stats.missed_deadlines == 0
+
+
+def test_bots_keep_their_angles_when_planning_misses_the_deadline():
+    game_state = _create_room(n_bots=4)
+    executor = ManualExecutor()
+    planner = BotPlanner(executor=executor)
+
+    for _ in range(3):
+        angles = [bot.angle for bot in game_state.players.bots()]
+        planner.plan(game_state)
+        assert [bot.angle for bot in game_state.players.bots()] == angles
+        planner.plan_ahead(game_state)
+
+    # the late planning isn't queued up behind, and each tick without a plan counts
+    assert len(executor.submitted) == 1
+    assert planner.stats.missed_deadlines == 2
+
+    # the late plan is dropped with its targets, so its bots are planned again
+    executor.run()
+    planner.plan(game_state)
+    assert planner.stats.plans == 0
+    assert planner._targets == {}
+    assert [bot.angle for bot in game_state.players.bots()] == angles
+
+    planner.plan_ahead(game_state)
+    executor.run()
+    game_state.tick += 1
+    planner.plan(game_state)
+    assert planner.stats.plans == 4
+    assert all(planner._targets.values())
+    assert planner.stats.missed_deadlines == 2
@@ -0,0 +1,124 @@
+from types import SimpleNamespace
+
+import pytest
+
+from ll.api.messages.handlers import handle_join_request
+from ll.api.messages.resources import JoinRequest
+from ll.api.ws import ConnectionManager, SocketConnection
+from ll.game.player import COLOR_PALETTE, JoinError, add_player
+from ll.game.rooms import RoomManager
+
+
+@pytest.mark.asyncio
+async def test_join_fills_rooms_up_to_the_cap():
+    rooms = RoomManager({}, max_players_per_room=2)
+    rooms.create_room()
+
+    room_ids = [(await rooms.join(f"player {i}"))[0] for i in range(5)]
+
+    assert room_ids == [1, 1, 2, 2, 3]
+    assert len(rooms.game_states) == 3
+
+
+@pytest.mark.asyncio
+async def test_updates_are_routed_to_the_room_of_the_player():
+    rooms = RoomManager({}, max_players_per_room=1)
+    rooms.create_room()
+
+    first_room_id, first_player_id = await rooms.join("first")
+    second_room_id, second_player_id = await rooms.join("second")
+
+    assert rooms.get_player_room(first_player_id).id == first_room_id
+    assert rooms.get_player_room(second_player_id).id == second_room_id
+    assert rooms.steer_player(second_player_id, 1.0)
+    assert rooms.game_states[second_room_id].players.get(second_player_id).angle == 1.0
+
+    rooms.leave(first_player_id)
+    assert rooms.get_player_room(first_player_id) is None
+    assert not rooms.steer_player(first_player_id, 1.0)
+
+
+@pytest.mark.asyncio
+async def test_idle_rooms_are_closed_down_to_the_minimum():
+    rooms = RoomManager({}, max_players_per_room=1, min_rooms=1)
+    rooms.create_room()
+    first_room_id, first_player_id = await rooms.join("first")
+    second_room_id, second_player_id = await rooms.join("second")
+
+    rooms.game_states[second_room_id].players.remove(second_player_id)
+    rooms.leave(second_player_id)
+    assert rooms.should_close_room(rooms.game_states[second_room_id])
+    rooms.close_room(second_room_id)
+
+    rooms.game_states[first_room_id].players.remove(first_player_id)
+    assert not rooms.should_close_room(rooms.game_states[first_room_id])
+    assert list(rooms.game_states) == [first_room_id]
+
+
+@pytest.mark.asyncio
+async def test_rooms_are_capped_at_a_player_per_color():
+    rooms = RoomManager({}, max_players_per_room=16)
+    rooms.create_room()
+
+    room_ids = [(await rooms.join(f"player {i}"))[0] for i in range(12)]
+
+    assert room_ids == [1] * len(COLOR_PALETTE) + [2] * 3
+    players = list(rooms.game_states[1].players)
+    assert len({tuple(p.color) for p in players}) == len(COLOR_PALETTE)
+    # bots about to make room for players still get a color
+    add_player(rooms.game_states[1], "bot", True)
+
+
+@pytest.mark.asyncio
+async def test_failed_joins_are_answered():
+    rooms = RoomManager({}, max_players_per_room=1)
+    rooms.create_room()
+    connections = ConnectionManager()
+    responses = []
+    for _ in range(5):
+        conn = SocketConnection(ws=object())
+        connections.add(conn)
+        request = SimpleNamespace(
+            app={"rooms": rooms, "connections": connections}, conn=conn.ws
+        )
+        responses.append(
+            await handle_join_request(request, JoinRequest(name="same", color=[1]))
+        )
+
+    assert [response.ok for (response,) in responses] == [True] + [False] * 4
+    assert {response.reason for (response,) in responses[1:]} == {"Name already taken"}
+    assert len(rooms.game_states) == 1
+
+
+@pytest.mark.asyncio
+async def test_joins_are_refused_when_all_rooms_are_full():
+    rooms = RoomManager({}, max_players_per_room=1, max_rooms=2)
+    rooms.create_room()
+
+    await rooms.join("first")
+    await rooms.join("second")
+    with pytest.raises(JoinError, match="All rooms are full"):
+        await rooms.join("third")
+    assert len(rooms.game_states) == 2
+
+
+@pytest.mark.asyncio
+async def test_players_whose_socket_closed_while_joining_leave():
+    connections = ConnectionManager()
+    rooms = RoomManager({"connections": connections}, max_players_per_room=4)
+    rooms.create_room()
+    conn = SocketConnection(ws=object(), connected_at=0)
+    connections.add(conn)
+    request = SimpleNamespace(app={"rooms": rooms, "connections": connections})
+    request.conn = conn.ws
+    join = rooms.join
+
+    async def close_and_join(name, options):
+        assert conn.joining
+        connections.remove(conn)
+        return await join(name, options)
+
+    rooms.join = close_and_join
+    assert await handle_join_request(request, JoinRequest(name="a", color=[1])) == []
+    assert not conn.joining
+    assert len(rooms.game_states[1].players) == 0
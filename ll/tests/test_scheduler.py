@@ -0,0 +1,91 @@
+from unittest import mock
+
+import pytest
+
+from ll.game.scheduler import OverrunPolicy, TickScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.now += delay
+
+
+@pytest.fixture
+def clock():
+    clock = FakeClock()
+    with mock.patch("ll.game.scheduler.asyncio.sleep", clock.sleep):
+        yield clock
+
+
+@pytest.mark.asyncio
+async def test_deadlines_do_not_drift_with_work_time(clock):
+    scheduler = TickScheduler(clock=clock)
+
+    for tick in range(1, 6):
+        lateness = await scheduler.wait_for_tick(1.0)
+        assert lateness == 0.0
+        assert clock.now == 100.0 + tick
+
+        # simulate work taking a large part of the tick
+        clock.now += 0.7
+        scheduler.schedule_next(1.0)
+
+    assert scheduler.stats.overruns == 0
+
+
+@pytest.mark.asyncio
+async def test_tick_period_change_applies_to_next_tick(clock):
+    scheduler = TickScheduler(clock=clock)
+
+    await scheduler.wait_for_tick(1.0)
+    scheduler.schedule_next(0.5)
+    await scheduler.wait_for_tick(0.5)
+
+    assert clock.now == 101.5
+
+
+@pytest.mark.asyncio
+async def test_skip_policy_realigns_to_grid(clock):
+    scheduler = TickScheduler(policy=OverrunPolicy.SKIP, clock=clock)
+
+    await scheduler.wait_for_tick(1.0)
+    clock.now += 2.25
+    scheduler.schedule_next(1.0)
+    lateness = await scheduler.wait_for_tick(1.0)
+
+    assert lateness == pytest.approx(0.25)
+    assert scheduler.stats.overruns == 1
+    assert scheduler.stats.skipped_ticks == 1
+
+    scheduler.schedule_next(1.0)
+    await scheduler.wait_for_tick(1.0)
+    assert clock.now == pytest.approx(104.0)
+
+
+@pytest.mark.asyncio
+async def test_catch_up_policy_runs_missed_ticks(clock):
+    scheduler = TickScheduler(policy=OverrunPolicy.CATCH_UP, clock=clock)
+
+    await scheduler.wait_for_tick(1.0)
+    clock.now += 2.25
+    scheduler.schedule_next(1.0)
+
+    lateness = await scheduler.wait_for_tick(1.0)
+    assert lateness == pytest.approx(1.25)
+    scheduler.schedule_next(1.0)
+
+    # the missed tick runs straight away, then the schedule is back on the grid
+    lateness = await scheduler.wait_for_tick(1.0)
+    assert lateness == pytest.approx(0.25)
+    assert clock.now == pytest.approx(103.25)
+    scheduler.schedule_next(1.0)
+
+    await scheduler.wait_for_tick(1.0)
+    assert clock.now == pytest.approx(104.0)
+    assert scheduler.stats.skipped_ticks == 0
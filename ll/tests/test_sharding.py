@@ -0,0 +1,128 @@
+import asyncio
+import multiprocessing
+import threading
+
+import pytest
+
+from ll.api.ws import ConnectionManager, SocketConnection, StreamOptions
+from ll.game import sharding
+from ll.game.placement import LeastLoadedPlacement
+from ll.game.player import JoinError
+from ll.game.sharding import ShardedRoomManager, _Channel, _join, _Outbox, _RoomWorker
+
+from .test_ws import SlowSocket
+
+
+def _sharded_rooms():
+    """Create a sharded room manager with one worker, played by the test."""
+    rooms = ShardedRoomManager(
+        {"connections": ConnectionManager()},
+        n_workers=1,
+        placement=LeastLoadedPlacement(),
+    )
+    conn, worker_conn = multiprocessing.Pipe()
+    worker = _RoomWorker(0, process=None, conn=conn, on_message=rooms._on_message)
+    rooms._workers[0] = worker
+    return rooms, worker, worker_conn
+
+
+async def _recv(conn):
+    """Receive a message sent to the worker without blocking the loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+
+
+@pytest.mark.asyncio
+async def test_failed_worker_joins_are_raised_and_uncounted():
+    rooms, worker, worker_conn = _sharded_rooms()
+
+    join = asyncio.create_task(rooms.join("lizard", StreamOptions()))
+    _, request_id, name, _ = await _recv(worker_conn)
+    assert worker.load.load.humans == 1
+
+    worker_conn.send(("join_failed", request_id, "Name already taken"))
+
+    with pytest.raises(JoinError, match="Name already taken"):
+        await join
+    assert worker.load.load.humans == 0
+    assert not rooms._pending_joins
+
+
+@pytest.mark.asyncio
+async def test_names_are_unique_across_workers():
+    rooms, worker, worker_conn = _sharded_rooms()
+
+    join = asyncio.create_task(rooms.join("lizard", StreamOptions()))
+    _, request_id, _, _ = await _recv(worker_conn)
+    # taken while joining and once joined
+    with pytest.raises(JoinError, match="Name already taken"):
+        await rooms.join("lizard", StreamOptions())
+    worker_conn.send(("joined", request_id, 1, "player"))
+    assert await join == (1, "player")
+    with pytest.raises(JoinError, match="Name already taken"):
+        await rooms.join("lizard", StreamOptions())
+
+    rooms.leave("player")
+    assert await _recv(worker_conn) == ("leave", "player")
+    join = asyncio.create_task(rooms.join("lizard", StreamOptions()))
+    assert (await _recv(worker_conn))[2] == "lizard"
+    join.cancel()
+
+
+@pytest.mark.asyncio
+async def test_players_joined_after_the_timeout_are_removed(monkeypatch):
+    monkeypatch.setattr(sharding, "JOIN_TIMEOUT", 0.01)
+    rooms, worker, worker_conn = _sharded_rooms()
+
+    with pytest.raises(JoinError):
+        await rooms.join("lizard", StreamOptions())
+    _, request_id, _, _ = await _recv(worker_conn)
+    assert worker.load.load.humans == 0
+
+    worker_conn.send(("joined", request_id, 1, "player"))
+
+    assert await _recv(worker_conn) == ("leave", "player")
+    assert rooms._player_workers == {}
+
+
+@pytest.mark.asyncio
+async def test_busy_workers_and_big_batches_dont_block_the_loop():
+    rooms, worker, worker_conn = _sharded_rooms()
+    conn = SocketConnection(ws=SlowSocket(), player_id="player")
+    rooms.app["connections"].add(conn)
+    rooms._player_workers["player"] = worker
+
+    # many times what the pipe buffers, while the worker isn't reading
+    n_steers = 50000
+    for _ in range(n_steers):
+        assert rooms.steer_player("player", 0.5)
+    # and meanwhile the worker sends a batch bigger than the pipe buffers too
+    frame = "x" * 1000000
+    threading.Thread(
+        target=worker_conn.send, args=(("frames", [("player", frame)]),)
+    ).start()
+    for _ in range(100):
+        if conn.outbox:
+            break
+        await asyncio.sleep(0.01)
+    assert list(conn.outbox) == [frame]
+
+    messages = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: [worker_conn.recv() for _ in range(n_steers)]
+    )
+    assert messages[-1] == ("steer", "player", 0.5)
+
+
+@pytest.mark.asyncio
+async def test_workers_answer_joins_that_raise():
+    class FailingRooms:
+        async def join(self, name):
+            raise IndexError("no colors left")
+
+    app = {"rooms": FailingRooms(), "connections": ConnectionManager()}
+    conn, main_conn = multiprocessing.Pipe()
+    channel = _Channel(conn)
+
+    await _join(app, channel, _Outbox(channel), 7, "lizard", StreamOptions())
+
+    assert await _recv(main_conn) == ("join_failed", 7, "Couldn't join a room")
+    assert len(app["connections"]) == 0
@@ -0,0 +1,133 @@
+import math
+import random
+
+from ll.game.buffs.effects import attract_apples
+from ll.game.intersect import lines_intersect
+from ll.game.loop import spawn_consumables
+from ll.game.player import add_player, kick_player, take_player_steps
+from ll.game.resources.consumables import Consumable, ConsumableType
+from ll.game.rooms import RoomManager
+
+
+def _near_brute_force(game_state, x, y, radius):
+    return {
+        c.uid
+        for c in game_state.consumables
+        if math.hypot(c.coordinates[0] - x, c.coordinates[1] - y) <= radius
+    }
+
+
+def test_consumable_grid_matches_brute_force_after_moves_and_removals():
+    rng = random.Random(4)
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    spawn_consumables(game_state)
+    player = game_state.players.get(add_player(game_state, "magnet", False))
+
+    for _ in range(20):
+        attract_apples(game_state, player, repel=rng.random() < 0.5)
+        for consumable in rng.sample(list(game_state.consumables), 5):
+            game_state.consumables.remove(consumable.uid)
+        spawn_consumables(game_state)
+
+        for _ in range(10):
+            x, y = rng.uniform(-2000, 2000), rng.uniform(-2000, 2000)
+            radius = rng.choice([5, 50, 250, 1000])
+            near = {c.uid for c, _ in game_state.consumables.near(x, y, radius)}
+            assert near == _near_brute_force(game_state, x, y, radius)
+        # and the array of their coordinates, grown past its first capacity
+        assert game_state.consumables.coordinates().tolist() == [
+            c.coordinates for c in game_state.consumables
+        ]
+
+    assert len(game_state.consumables.grid) == len(game_state.consumables)
+
+
+def _nearest_brute_force(game_state, x, y, min_distance):
+    closest, closest_distance = None, None
+    for consumable in game_state.consumables:
+        if consumable.type == ConsumableType.POISON:
+            continue
+        distance = math.sqrt(
+            (x - consumable.coordinates[0]) ** 2 + (y - consumable.coordinates[1]) ** 2
+        )
+        if distance + consumable.size < min_distance:
+            continue
+        if closest is None or distance < closest_distance:
+            closest, closest_distance = consumable, distance
+    return closest
+
+
+def test_nearest_consumable_matches_brute_force():
+    rng = random.Random(11)
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    consumables = game_state.consumables
+    assert consumables.nearest(0, 0, exclude=(ConsumableType.POISON,)) is None
+
+    for _ in range(30):
+        spawn_consumables(game_state)
+        for consumable in rng.sample(list(consumables), 30):
+            consumables.remove(consumable.uid)
+        # equally close consumables, where the first one in the store has to win
+        x, y = rng.choice(list(consumables)).coordinates
+        consumables.extend(
+            Consumable(
+                type=rng.choice(list(ConsumableType)),
+                coordinates=[x + dx, y],
+                size=10,
+                color=[0],
+                uid=consumables.next_uid(),
+            )
+            for dx in [-30, 30, 30]
+        )
+
+        for _ in range(20):
+            x, y = rng.uniform(-2500, 2500), rng.uniform(-2500, 2500)
+            if rng.random() < 0.5:
+                x, y = rng.choice(list(consumables)).coordinates
+            min_distance = rng.choice([0, 25, 40])
+            nearest = consumables.nearest(
+                x, y, min_distance, exclude=(ConsumableType.POISON,)
+            )
+            assert nearest is _nearest_brute_force(game_state, x, y, min_distance)
+
+
+def test_segment_grid_finds_every_intersecting_segment():
+    rng = random.Random(7)
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    for i in range(6):
+        add_player(game_state, f"player {i}", False)
+    segments = game_state.segments
+    hits = 0
+
+    for tick in range(60):
+        for player in game_state.players:
+            player.angle += rng.uniform(-1, 1)
+        if tick == 30:
+            kick_player(game_state, list(game_state.players)[0].id)
+        take_player_steps(game_state)
+        segments.sync_players(game_state.players)
+
+        all_segments = [
+            segment
+            for player in game_state.players
+            for segment in player.steps.segments()
+        ]
+        assert len(segments) == len(all_segments)
+        for _ in range(20):
+            x, y = rng.choice(all_segments)[0]
+            a = [x + rng.uniform(-100, 100), y + rng.uniform(-100, 100)]
+            b = [x + rng.uniform(-100, 100), y + rng.uniform(-100, 100)]
+            found = {
+                (id(step1), id(step2))
+                for _, step1, step2 in segments.candidates(a, b)
+                if lines_intersect(a, b, step1, step2)
+            }
+            expected = {
+                (id(step1), id(step2))
+                for step1, step2 in all_segments
+                if lines_intersect(a, b, step1, step2)
+            }
+            assert found == expected
+            hits += len(expected)
+
+    assert hits
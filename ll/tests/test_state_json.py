@@ -0,0 +1,159 @@
+import random
+from datetime import datetime, timezone
+from pathlib import Path
+
+from ll.api.messages.resources import MessageType, MessageWrapper, StateUpdate
+from ll.api.messages.state_json import encode_state_update_json
+from ll.game import bot
+from ll.game.bot import choose_bot_step_angles, spawn_and_boot_bots
+from ll.game.buffs import BuffApplicationTime, apply_and_decay_buffs
+from ll.game.loop import spawn_consumables
+from ll.game.player import take_player_steps
+from ll.game.resources.body import SnakeBody
+from ll.game.resources.buffs import BUFF_DEFINITIONS, Buff, BuffType
+from ll.game.resources.consumables import Consumable, ConsumableType
+from ll.game.resources.game import GamePlayer
+from ll.game.rooms import RoomManager
+
+GOLDEN_STATE_UPDATE = Path(__file__).parent / "golden" / "state_update.json"
+
+
+def _pydantic_state_update(game_state, players, consumables) -> str:
+    """Encode a state update through the pydantic messages."""
+    return MessageWrapper(
+        type=MessageType.STATE_UPDATE,
+        payload=StateUpdate(
+            tick=game_state.tick,
+            tick_period=game_state.tick_period,
+            server_timestamp=game_state.server_timestamp,
+            server_next_tick_time=game_state.server_next_tick_time,
+            players=players,
+            consumables=consumables,
+            global_buffs=game_state.global_buffs,
+            map_bounds=game_state.map_bounds,
+        ),
+    ).json()
+
+
+def _buff(buff_type, duration_remaining, is_applied=True):
+    definition = BUFF_DEFINITIONS[buff_type]
+    return Buff(
+        type=buff_type,
+        friendly_name=definition.friendly_name,
+        is_debuff=definition.is_debuff,
+        is_applied=is_applied,
+        duration=definition.default_duration,
+        duration_remaining=duration_remaining,
+    )
+
+
+def _golden_state():
+    """Build a room with the values whose JSON is easy to get wrong."""
+    game_state = RoomManager({}, max_players_per_room=8).create_room()
+    game_state.tick = 1234
+    game_state.tick_period = 0.25
+    game_state.server_timestamp = datetime(2023, 5, 1, 12, 30, 15, 123456, timezone.utc)
+    game_state.server_next_tick_time = datetime(
+        2023, 5, 1, 12, 30, 15, 373456, timezone.utc
+    )
+    game_state.global_buffs = [_buff(BuffType.TICK_PERIOD_BOOST, 3, is_applied=False)]
+    game_state.players.add(
+        GamePlayer(
+            name='"quoted" \\ tab\t nul\x00 \x7f lézard 🦎',
+            id="00000000-0000-0000-0000-000000000001",
+            color=[255, 0, 12],
+            steps=SnakeBody(
+                [
+                    (0, 0),
+                    (-0.0, 1e-05),
+                    (1.5e-05, -1.25e-07),
+                    (1e16, 2.5e22),
+                    (0.1, 1 / 3),
+                ]
+            ),
+            step_length=50,
+            buffs=[_buff(BuffType.GHOST, 0), _buff(BuffType.APPLE_MAGNET, 12)],
+            spawned=True,
+            step_fov=1.2566370614359172,
+            is_bot=False,
+            angle=-3.141592653589793,
+        )
+    )
+    game_state.players.add(
+        GamePlayer(
+            name="bot",
+            id="00000000-0000-0000-0000-000000000002",
+            color=[1, 2, 3],
+            steps=SnakeBody([(-1999.5, 1999.0)]),
+            step_length=37.5,
+            buffs=[],
+            spawned=False,
+            step_fov=0.0,
+            is_bot=True,
+            angle=float("nan"),
+        )
+    )
+    game_state.consumables.extend(
+        Consumable(
+            type=consumable_type,
+            coordinates=coordinates,
+            size=size,
+            color=[10, 20, 30],
+            effect_multiplier=effect_multiplier,
+            uid=game_state.consumables.next_uid(),
+        )
+        for consumable_type, coordinates, size, effect_multiplier in [
+            (ConsumableType.APPLE, [12, -7], 10, 1.0),
+            (ConsumableType.POISON, [-0.0, 5.5], 18, 1.75),
+            (ConsumableType.STONE, [1e-06, 123456789.125], 7, 2),
+        ]
+    )
+    return game_state
+
+
+def test_state_update_json_matches_the_golden_file_and_pydantic():
+    game_state = _golden_state()
+    players = list(game_state.players)
+    consumables = list(game_state.consumables)
+
+    text = encode_state_update_json(game_state, players, consumables)
+
+    assert text == _pydantic_state_update(game_state, players, consumables)
+    assert text == GOLDEN_STATE_UPDATE.read_text(encoding="utf-8").rstrip("\n")
+    # again, from the text cached for the steps and consumables
+    assert encode_state_update_json(game_state, players, consumables) == text
+
+
+def test_state_update_json_matches_pydantic_every_tick_of_a_room(monkeypatch):
+    random.seed(4)
+    monkeypatch.setattr(bot, "MINIMUM_N_PLAYERS_INCL_BOTS", 6)
+    game_state = RoomManager({}, max_players_per_room=6).create_room()
+    rng = random.Random(4)
+
+    for tick in range(1, 150):
+        spawn_and_boot_bots(game_state)
+        game_state.tick = tick
+        game_state.server_timestamp = datetime.now()
+        apply_and_decay_buffs(game_state, BuffApplicationTime.PRE_STEP)
+        choose_bot_step_angles(game_state)
+        take_player_steps(game_state)
+        spawn_consumables(game_state)
+        apply_and_decay_buffs(game_state, BuffApplicationTime.POST_STEP)
+
+        # the whole room, and the part of it in the view of a player, alone and
+        # sharing the text of the tick
+        players = list(game_state.players)
+        consumables = list(game_state.consumables)
+        texts = {}
+        for players, consumables in [
+            (players, consumables),
+            (rng.sample(players, 2), rng.sample(consumables, 20)),
+        ]:
+            expected = _pydantic_state_update(game_state, players, consumables)
+            assert (
+                encode_state_update_json(game_state, players, consumables) == expected
+            )
+            assert (
+                encode_state_update_json(game_state, players, consumables, texts)
+                == expected
+            )
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from ll.api.ws import ConnectionManager, SocketConnection, StreamOptions, write_frames
+
+
+class SlowSocket:
+    def __init__(self):
+        self.closed = False
+        self.sent = []
+        self.unblock = asyncio.Event()
+
+    async def close(self, message=b""):
+        self.closed = True
+
+    async def send_str(self, frame):
+        await self.unblock.wait()
+        self.sent.append(frame)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_only_receives_the_latest_snapshot():
+    ws = SlowSocket()
+    conn = SocketConnection(ws=ws)
+    writer = asyncio.create_task(write_frames(conn))
+
+    conn.send("tick 1")
+    await asyncio.sleep(0)
+    # tick 1 is being written, tick 3 replaces tick 2 in the queue
+    conn.send("tick 2")
+    conn.send("tick 3")
+
+    ws.unblock.set()
+    await asyncio.sleep(0.01)
+    writer.cancel()
+
+    assert ws.sent == ["tick 1", "tick 3"]
+    assert conn.dropped_snapshots == 1
+
+
+@pytest.mark.asyncio
+async def test_connections_are_indexed_and_unjoined_ones_reaped():
+    connections = ConnectionManager(join_timeout=10)
+    joined = SocketConnection(ws=SlowSocket(), connected_at=0)
+    idle = SocketConnection(ws=SlowSocket(), connected_at=0)
+    fresh = SocketConnection(ws=SlowSocket(), connected_at=5)
+    joining = SocketConnection(ws=SlowSocket(), connected_at=0, joining=True)
+    for conn in [joined, idle, fresh, joining]:
+        connections.add(conn)
+
+    connections.assign_player(joined.ws, "player", StreamOptions(delta_updates=True))
+    assert connections.get_by_player_id("player") is joined
+    assert connections.get_by_ws(idle.ws) is idle
+    assert joined.options.delta_updates
+
+    assert await connections.reap_unjoined(now=12) == 1
+    assert idle.ws.closed and not fresh.ws.closed and not joining.ws.closed
+    assert list(connections) == [joined, fresh, joining]
+
+    # removing while sweeping
+    for conn in connections:
+        connections.remove(conn)
+    assert len(connections) == 0
+    assert connections.get_by_player_id("player") is None
+    assert not connections.assign_player(joined.ws, "player", StreamOptions())
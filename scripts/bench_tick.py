@@ -0,0 +1,275 @@
+"""Time the ticks of a room of bots, and the memory they allocate.
+
+Then the simulation types built on the tick path are timed against pydantic
+dataclasses of the same fields, which they replaced, and scaled by the number built
+per tick. Last, the objects of the game state are timed one at a time, including a
+state update built through the pydantic messages next to the encoder the game loop
+uses. A StateUpdate is slower to build from the slotted players than it was from
+pydantic ones, as they are validated into the schemas, but the game loop doesn't
+build it.
+
+Usage: python scripts/bench_tick.py [bots] [ticks]
+"""
+import dataclasses
+import os
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+from typing import List
+
+import structlog
+
+# Add package to sys path to allow for imports from legless-lizard
+sys.path.insert(0, os.getcwd())
+
+structlog.configure(logger_factory=structlog.PrintLoggerFactory(open(os.devnull, "w")))
+
+
+def _create_room(n_bots):
+    from ll.game import bot  # noqa
+    from ll.game.rooms import RoomManager  # noqa
+
+    random.seed(0)
+    bot.MINIMUM_N_PLAYERS_INCL_BOTS = n_bots
+    return RoomManager({}, max_players_per_room=n_bots).create_room()
+
+
+def _phases(game_state, history):
+    from ll.api.ws import WireEncoding  # noqa
+    from ll.game.bot import choose_bot_step_angles, spawn_and_boot_bots  # noqa
+    from ll.game.buffs import BuffApplicationTime, apply_and_decay_buffs  # noqa
+    from ll.game.delta import format_gamestate_ws_delta  # noqa
+    from ll.game.loop import format_gamestate_ws_update, spawn_consumables  # noqa
+    from ll.game.player import take_player_steps  # noqa
+
+    def simulate():
+        spawn_and_boot_bots(game_state)
+        game_state.tick += 1
+        apply_and_decay_buffs(game_state, BuffApplicationTime.PRE_STEP)
+        choose_bot_step_angles(game_state)
+        take_player_steps(game_state)
+        spawn_consumables(game_state)
+        apply_and_decay_buffs(game_state, BuffApplicationTime.POST_STEP)
+
+    def encode():
+        current = history.record(game_state)
+        base = history.get(game_state.tick - 1) or current
+        format_gamestate_ws_update(game_state)
+        format_gamestate_ws_update(game_state, encoding=WireEncoding.BINARY)
+        format_gamestate_ws_delta(game_state, base, current)
+
+    return {"simulate": simulate, "encode": encode}
+
+
+def _objects(game_state):
+    from ll.api.messages.resources import (  # noqa
+        MessageType,
+        MessageWrapper,
+        StateUpdate,
+    )
+    from ll.api.messages.state_json import encode_state_update_json  # noqa
+    from ll.game.player import add_player, kick_player  # noqa
+    from ll.game.resources.consumables import Consumable, ConsumableType  # noqa
+
+    pineapple = Consumable(
+        type=ConsumableType.PINEAPPLE, coordinates=[0, 0], size=10, color=[0]
+    )
+
+    def add_and_remove_player():
+        kick_player(game_state, add_player(game_state, "bench", False))
+
+    def state_update():
+        return StateUpdate(
+            tick=game_state.tick,
+            tick_period=game_state.tick_period,
+            server_timestamp=game_state.server_timestamp,
+            server_next_tick_time=game_state.server_next_tick_time,
+            players=list(game_state.players),
+            consumables=list(game_state.consumables),
+            global_buffs=game_state.global_buffs,
+            map_bounds=game_state.map_bounds,
+        )
+
+    def state_update_messages():
+        MessageWrapper(type=MessageType.STATE_UPDATE, payload=state_update()).json()
+
+    def state_update_json():
+        encode_state_update_json(
+            game_state, list(game_state.players), list(game_state.consumables)
+        )
+
+    return {
+        "new buff": lambda: pineapple.buff,
+        "add and remove a player": add_and_remove_player,
+        "StateUpdate": state_update,
+        "JSON state update, pydantic messages": state_update_messages,
+        "JSON state update, state_json": state_update_json,
+    }
+
+
+def _build_cost(build, number: int):
+    """Get the seconds and the peak bytes allocated to build an object."""
+    # the quickest of a few runs, the others are slowed down by the machine
+    elapsed = min(timeit.repeat(build, number=number, repeat=5)) / number
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    build()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def _simulation_types(game_state):
+    """Get builders of the simulation types and of their pydantic counterparts."""
+    from pydantic import ConfigDict  # noqa
+    from pydantic.dataclasses import dataclass as pydantic_dataclass  # noqa
+
+    from ll.game.resources.buffs import Buff  # noqa
+    from ll.game.resources.consumables import CONSUMABLE_TO_BUFF_MAP  # noqa
+    from ll.game.resources.game import GamePlayer  # noqa
+
+    buff_definition = next(iter(CONSUMABLE_TO_BUFF_MAP.values()))
+    buff_fields = {
+        "type": buff_definition.type,
+        "friendly_name": buff_definition.friendly_name,
+        "is_debuff": buff_definition.is_debuff,
+        "is_applied": False,
+        "duration": buff_definition.default_duration,
+        "duration_remaining": buff_definition.default_duration,
+    }
+    player = next(iter(game_state.players))
+    player_fields = {
+        field.name: getattr(player, field.name)
+        for field in dataclasses.fields(GamePlayer)
+    }
+    player_fields["buffs"] = []
+
+    # the pydantic dataclasses the game state was made of
+    config = ConfigDict(arbitrary_types_allowed=True)
+    PydanticBuff = pydantic_dataclass(
+        dataclasses.make_dataclass(
+            "Buff", [(name, type(value)) for name, value in buff_fields.items()]
+        ),
+        config=config,
+    )
+    PydanticGamePlayer = pydantic_dataclass(
+        dataclasses.make_dataclass(
+            "GamePlayer",
+            [
+                (field.name, field.type)
+                if field.name != "buffs"
+                else (field.name, List[PydanticBuff])
+                for field in dataclasses.fields(GamePlayer)
+            ],
+        ),
+        config=config,
+    )
+
+    return {
+        "Buff": (
+            lambda: Buff(**buff_fields),
+            lambda: PydanticBuff(**buff_fields),
+        ),
+        "GamePlayer": (
+            lambda: GamePlayer(**player_fields),
+            lambda: PydanticGamePlayer(**player_fields),
+        ),
+    }
+
+
+def bench_simulation_types(n_bots: int = 9, n_ticks: int = 500, number: int = 2000):
+    """Time the simulation types built per tick against their pydantic counterparts."""
+    from ll.game import player  # noqa
+    from ll.game.delta import SnapshotHistory  # noqa
+    from ll.game.resources import consumables  # noqa
+
+    # count the objects the ticks build, where the game builds them
+    built = {"Buff": 0, "GamePlayer": 0}
+
+    def counted(name, cls):
+        def build(*args, **kwargs):
+            built[name] += 1
+            return cls(*args, **kwargs)
+
+        return build
+
+    game_state = _create_room(n_bots)
+    phases = _phases(game_state, SnapshotHistory())
+    real = consumables.Buff, player.GamePlayer
+    consumables.Buff = counted("Buff", consumables.Buff)
+    player.GamePlayer = counted("GamePlayer", player.GamePlayer)
+    try:
+        for _ in range(n_ticks):
+            phases["simulate"]()
+    finally:
+        consumables.Buff, player.GamePlayer = real
+
+    saved_time = saved_memory = 0.0
+    for name, (build, build_pydantic) in _simulation_types(game_state).items():
+        elapsed, peak = _build_cost(build, number)
+        pydantic_elapsed, pydantic_peak = _build_cost(build_pydantic, number)
+        per_tick = built[name] / n_ticks
+        saved_time += per_tick * (pydantic_elapsed - elapsed)
+        saved_memory += per_tick * (pydantic_peak - peak)
+        print(
+            f"{name}: {per_tick:.2f} per tick, {elapsed * 1e6:.2f} us and"
+            f" {peak / 1024:.2f} KiB peak, pydantic {pydantic_elapsed * 1e6:.2f} us"
+            f" and {pydantic_peak / 1024:.2f} KiB peak"
+        )
+    print(
+        f"saved per tick: {saved_time * 1e6:.2f} us,"
+        f" {saved_memory / 1024:.3f} KiB allocated"
+    )
+
+
+def bench_objects(n_bots: int = 9, number: int = 200):
+    """Time building the objects of the game state, and the memory they allocate."""
+    game_state = _create_room(n_bots)
+    phases = _phases(game_state, None)
+    for _ in range(50):
+        phases["simulate"]()
+
+    for name, build in _objects(game_state).items():
+        elapsed, peak = _build_cost(build, number)
+        print(f"{name}: {elapsed * 1e6:.1f} us, {peak / 1024:.1f} KiB peak")
+
+
+def bench(n_bots: int = 9, n_ticks: int = 500):
+    from ll.game.delta import SnapshotHistory  # noqa
+
+    # time the phases, then replay the same ticks tracing the memory allocated
+    for traced in [False, True]:
+        game_state = _create_room(n_bots)
+        phases = _phases(game_state, SnapshotHistory())
+        totals = {name: 0.0 for name in phases}
+        if traced:
+            tracemalloc.start()
+        for _ in range(n_ticks):
+            for name, phase in phases.items():
+                if traced:
+                    tracemalloc.reset_peak()
+                    before = tracemalloc.get_traced_memory()[0]
+                    phase()
+                    totals[name] += tracemalloc.get_traced_memory()[1] - before
+                else:
+                    start = time.perf_counter()
+                    phase()
+                    totals[name] += time.perf_counter() - start
+        if traced:
+            tracemalloc.stop()
+
+        for name, total in totals.items():
+            if traced:
+                print(f"{name}: {total / n_ticks / 1024:.1f} KiB peak per tick")
+            else:
+                print(f"{name}: {total / n_ticks * 1e6:.0f} us per tick")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args[:2])
+    bench_simulation_types(*args[:2])
+    bench_objects(*args[:1])